@@ -4,7 +4,12 @@ from fastapi import APIRouter
 from loguru import logger
 
 from .crud import db
-from .tasks import wait_for_paid_invoices
+from .tasks import (
+    flush_audit_logs,
+    run_maintenance,
+    wait_for_paid_invoices,
+    write_buffered_audit_logs,
+)
 from .views import inventory_ext_generic
 from .views_api import inventory_ext_api
 
@@ -22,12 +27,13 @@ inventory_static_files = [
 scheduled_tasks: list[asyncio.Task] = []
 
 
-def inventory_stop():
+async def inventory_stop():
     for task in scheduled_tasks:
         try:
             task.cancel()
         except Exception as ex:
             logger.warning(ex)
+    await flush_audit_logs()
 
 
 def inventory_start():
@@ -35,6 +41,12 @@ def inventory_start():
 
     task = create_permanent_unique_task("ext_testing", wait_for_paid_invoices)
     scheduled_tasks.append(task)
+    task = create_permanent_unique_task("ext_inventory_maintenance", run_maintenance)
+    scheduled_tasks.append(task)
+    task = create_permanent_unique_task(
+        "ext_inventory_audit_logs", write_buffered_audit_logs
+    )
+    scheduled_tasks.append(task)
 
 
 __all__ = [
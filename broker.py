@@ -0,0 +1,107 @@
+import asyncio
+from collections import deque
+
+from .cache import LRUCache
+from .models import ItemChange
+
+
+class Subscription:
+    def __init__(self, inventory_id: str, buffer_size: int, private: bool = False):
+        self.inventory_id = inventory_id
+        # private subscribers (the owner) also get the private changes
+        self.private = private
+        self.queue: asyncio.Queue[ItemChange] = asyncio.Queue(maxsize=buffer_size)
+        # set when the subscriber fell behind, it should reconnect and resume
+        self.closed = False
+
+
+class ChangeBroker:
+    """
+    In-process fan-out of item changes to the subscribers of an inventory.
+
+    Every change gets a sequence number per inventory. The last
+    `history_size` changes are kept so a reconnecting subscriber can resume
+    after the last sequence it saw. A subscriber whose buffer fills up is
+    closed instead of blocking the writers, it resumes on reconnect.
+    Private changes only reach (and are only replayed to) private
+    subscribers.
+    """
+
+    def __init__(
+        self, buffer_size: int = 256, history_size: int = 1000, max_inventories=1000
+    ):
+        self.buffer_size = buffer_size
+        self.history_size = history_size
+        self._seq: dict[str, int] = {}
+        self._history: LRUCache[str, deque[tuple[ItemChange, bool]]] = LRUCache(
+            max_inventories
+        )
+        self._subscribers: dict[str, set[Subscription]] = {}
+
+    def last_seq(self, inventory_id: str) -> int:
+        return self._seq.get(inventory_id, 0)
+
+    def publish(
+        self, inventory_id: str, change_type: str, private: bool = False, **data
+    ) -> ItemChange:
+        seq = self._seq.get(inventory_id, 0) + 1
+        self._seq[inventory_id] = seq
+        change = ItemChange(
+            seq=seq, inventory_id=inventory_id, type=change_type, **data
+        )
+        history = self._history.get(inventory_id)
+        if history is None:
+            history = deque(maxlen=self.history_size)
+            self._history.set(inventory_id, history)
+        history.append((change, private))
+
+        for subscription in list(self._subscribers.get(inventory_id, ())):
+            if private and not subscription.private:
+                continue
+            try:
+                subscription.queue.put_nowait(change)
+            except asyncio.QueueFull:
+                subscription.closed = True
+                self.unsubscribe(subscription)
+        return change
+
+    def subscribe(
+        self, inventory_id: str, after_seq: int | None = None, private: bool = False
+    ) -> tuple[Subscription, list[ItemChange]]:
+        """
+        Subscribe to the changes of an inventory. Returns the subscription and
+        the changes after `after_seq` to replay first. When those are no
+        longer in the history a single `reset` change is returned instead,
+        the subscriber should then reload the items.
+        """
+        subscription = Subscription(inventory_id, self.buffer_size, private)
+        self._subscribers.setdefault(inventory_id, set()).add(subscription)
+        if after_seq is None:
+            return subscription, []
+
+        last_seq = self.last_seq(inventory_id)
+        history = list(self._history.get(inventory_id) or [])
+        oldest_seq = history[0][0].seq if history else last_seq + 1
+        if after_seq > last_seq or after_seq < oldest_seq - 1:
+            reset = ItemChange(seq=last_seq, inventory_id=inventory_id, type="reset")
+            return subscription, [reset]
+        return subscription, [
+            change
+            for change, change_private in history
+            if change.seq > after_seq and (private or not change_private)
+        ]
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.inventory_id)
+        if not subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.inventory_id]
+
+    def close(self, inventory_id: str) -> None:
+        for subscription in self._subscribers.pop(inventory_id, set()):
+            subscription.closed = True
+
+
+change_broker = ChangeBroker()
@@ -1,24 +1,364 @@
+import asyncio
+from collections.abc import AsyncGenerator, Callable, Sequence
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any
 
-from lnbits.db import Database, Filters, Page
+from lnbits.db import (
+    COCKROACH,
+    POSTGRES,
+    SQLITE,
+    Connection,
+    Database,
+    Filters,
+    Operator,
+    Page,
+    TModel,
+    dict_to_model,
+    insert_query,
+    model_to_dict,
+    update_query,
+)
 from lnbits.helpers import urlsafe_short_hash
+from pydantic import BaseModel
+from sqlalchemy.sql import text
+from sqlalchemy.sql.elements import TextClause
 
-from .helpers import check_item_tags, split_tags
+from .broker import change_broker
+from .cache import LRUCache
+from .helpers import (
+    ITEM_IMAGE_URL,
+    check_item_tags,
+    decode_cursor,
+    encode_cursor,
+    log_day,
+    manager_allowed_tags,
+    normalize_images,
+    primary_image,
+    search_terms,
+    split_tags,
+    to_images_csv,
+)
 from .models import (
+    AuditLogDaily,
     CreateInventory,
     CreateInventoryUpdateLog,
     CreateItem,
     CreateManager,
+    CursorPage,
     Inventory,
     InventoryLogFilters,
+    InventoryStats,
     InventoryUpdateLog,
+    InventoryValuation,
+    InvoiceStockUpdate,
     Item,
     ItemFilters,
+    ItemImage,
+    ItemsSelection,
+    ItemTag,
     Manager,
+    ManagerValuation,
     PublicInventory,
+    PublicItem,
+    SearchPage,
+    StockUpdateLine,
+    StockUpdateResult,
+    TagValuation,
+    UpdateItem,
+    ValuationTotals,
 )
 
 db = Database("ext_inventory")
+# recently claimed idempotency keys, so replayed webhooks skip the database
+idempotency_cache: LRUCache[str, bool] = LRUCache(maxsize=10_000)
+# inventories and managers are read on every request but rarely change,
+# writes invalidate them here, the ttl bounds staleness across workers
+inventory_cache: LRUCache[str, Inventory] = LRUCache(maxsize=1000, ttl=30)
+manager_cache: LRUCache[str, Manager] = LRUCache(maxsize=1000, ttl=30)
+
+# audit logs written with `buffered=True` (stock taken by paid invoices),
+# drained in multi-row inserts by
+# `tasks.write_buffered_audit_logs`, which writes all of them when stopped.
+# Logs still queued are lost on a crash.
+audit_log_buffer: asyncio.Queue[CreateInventoryUpdateLog] = asyncio.Queue(
+    maxsize=10_000
+)
+
+# keep multi-row statements below sqlite's default bind parameter limit
+MAX_BIND_PARAMS = 900
+
+# item fields that the valuation sums depend on
+VALUATION_FIELDS = {
+    "quantity_in_stock",
+    "price",
+    "discount_percentage",
+    "tax_rate",
+    "unit_cost",
+    "tags",
+    "manager_id",
+}
+# unfiltered searches only rank this many matches, so a short prefix that
+# matches most of an inventory stays fast while typing
+SEARCH_MAX_RESULTS = 500
+
+
+def bind_placeholder(model: BaseModel, field: str, key: str | None = None) -> str:
+    """Bind placeholder for `field` of `model`, datetimes via `to_timestamp`."""
+    key = key or field
+    if model.__fields__[field].type_ == datetime:
+        return db.timestamp_placeholder(key)
+    return f":{key}"
+
+
+class TransactionConnection(Connection):
+    """
+    lnbits' `Connection` commits after every statement. This one leaves the
+    commit (or rollback) to the surrounding `transaction()` block.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commit_callbacks: list[Callable[[], None]] = []
+
+    def on_commit(self, callback: Callable[[], None]) -> None:
+        """Run `callback` once the transaction is committed."""
+        self.commit_callbacks.append(callback)
+
+    async def execute(self, query: str, values: dict | None = None):
+        params = self.rewrite_values(values) if values else {}
+        return await self.conn.execute(text(self.rewrite_query(query)), params)
+
+    async def execute_many(self, query: str, values: list[dict]) -> None:
+        if not values:
+            return
+        params = [self.rewrite_values(value) for value in values]
+        await self.conn.execute(text(self.rewrite_query(query)), params)
+
+    async def insert(self, table_name: str, model: BaseModel) -> None:
+        await self.conn.execute(
+            text(insert_query(table_name, model)), model_to_dict(model)
+        )
+
+    async def update(
+        self, table_name: str, model: BaseModel, where: str = "WHERE id = :id"
+    ) -> None:
+        await self.conn.execute(
+            text(update_query(table_name, model, where)), model_to_dict(model)
+        )
+
+    async def update_columns(
+        self, table_name: str, model: BaseModel, columns: Sequence[str]
+    ) -> None:
+        """`update` of only `columns`, the row is matched by `id`."""
+        row = model_to_dict(model)
+        assignments = ", ".join(
+            [f'"{column}" = {bind_placeholder(model, column)}' for column in columns]
+        )
+        await self.conn.execute(
+            text(f"UPDATE {table_name} SET {assignments} WHERE id = :id"),
+            {**{column: row[column] for column in columns}, "id": row["id"]},
+        )
+
+    async def update_where(
+        self,
+        table_name: str,
+        model: BaseModel,
+        columns: Sequence[str],
+        where: str,
+        values: dict,
+    ) -> None:
+        """Set `columns` to their value in `model` on every row matching `where`."""
+        row = model_to_dict(model)
+        assignments = ", ".join(
+            [f'"{column}" = {bind_placeholder(model, column)}' for column in columns]
+        )
+        await self.conn.execute(
+            text(f"UPDATE {table_name} SET {assignments} {where}"),
+            {**values, **{column: row[column] for column in columns}},
+        )
+
+    async def insert_many(self, table_name: str, models: Sequence[BaseModel]) -> None:
+        """Insert `models` with chunked multi-row INSERT statements."""
+        rows = [model_to_dict(model) for model in models]
+        if not rows:
+            return
+        keys = list(rows[0].keys())
+        fields = ", ".join([f'"{key}"' for key in keys])
+        chunk_size = max(1, MAX_BIND_PARAMS // len(keys))
+        # full chunks share one statement, parsing its binds is not free
+        statements: dict[int, TextClause] = {}
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start : start + chunk_size]
+            values: dict = {}
+            for i, row in enumerate(chunk):
+                values.update({f"{key}_{i}": row[key] for key in keys})
+            statement = statements.get(len(chunk))
+            if statement is None:
+                rows_sql = ", ".join(
+                    "("
+                    + ", ".join(
+                        [bind_placeholder(models[0], key, f"{key}_{i}") for key in keys]
+                    )
+                    + ")"
+                    for i in range(len(chunk))
+                )
+                statement = text(
+                    f"INSERT INTO {table_name} ({fields}) VALUES {rows_sql}"
+                )
+                statements[len(chunk)] = statement
+            await self.conn.execute(statement, values)
+
+
+@asynccontextmanager
+async def transaction() -> AsyncGenerator[TransactionConnection, None]:
+    async with db.connect() as conn:
+        tx = TransactionConnection(conn.conn, conn.type, conn.name, conn.schema)
+        try:
+            yield tx
+        except BaseException:
+            await conn.conn.rollback()
+            raise
+        await conn.conn.commit()
+        for callback in tx.commit_callbacks:
+            callback()
+
+
+async def fetch_cursor_page(
+    table_name: str,
+    where: list[str],
+    values: dict,
+    filters: Filters,
+    model: type[BaseModel],
+    cursor: str | None = None,
+    default_sort: tuple[str, str] = ("created_at", "asc"),
+    nullable_sort_defaults: dict[str, str] | None = None,
+    include_total: bool = False,
+    columns: list[str] | None = None,
+) -> CursorPage:
+    """Keyset page ordered by the sort field and `id`, resumed from `cursor`."""
+    direction: str
+    if filters.sortby:
+        sortby, direction = filters.sortby, filters.direction or "asc"
+    else:
+        sortby, direction = default_sort
+    nullable_sort_defaults = nullable_sort_defaults or {}
+    sort_expr = sortby
+    if sortby in nullable_sort_defaults:
+        sort_expr = f"COALESCE({sortby}, {nullable_sort_defaults[sortby]})"
+
+    values = filters.values(values)
+    clause = filters.where(where)
+    count_clause, count_values = clause, dict(values)
+
+    if cursor:
+        position = decode_cursor(cursor)
+        if position.get("sortby") != sortby or position.get("direction") != direction:
+            raise ValueError("Cursor does not match the requested sorting.")
+        placeholder = ":cursor_value"
+        if position.get("timestamp") and db.type in {POSTGRES, COCKROACH}:
+            # bound as text, the driver only encodes datetimes as timestamps
+            placeholder = "CAST(CAST(:cursor_value AS TEXT) AS TIMESTAMP)"
+        op = ">" if direction == "asc" else "<"
+        after = (
+            f"({sort_expr} {op} {placeholder} OR "
+            f"({sort_expr} = {placeholder} AND id {op} :cursor_id))"
+        )
+        clause = f"{clause} AND {after}" if clause else f"WHERE {after}"
+        values["cursor_value"] = position.get("value")
+        values["cursor_id"] = position.get("id")
+
+    limit = filters.limit or 1000
+    limit = min(1000, limit)
+    rows: list[dict] = await db.fetchall(
+        f"""
+        SELECT {_select_list(columns)}, {sort_expr} AS cursor_value
+        FROM {table_name}
+        {clause}
+        ORDER BY {sort_expr} {direction}, id {direction}
+        LIMIT {limit + 1}
+        """,
+        values,
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        value = last["cursor_value"]
+        next_cursor = encode_cursor(
+            {
+                "sortby": sortby,
+                "direction": direction,
+                "value": value,
+                "id": last["id"],
+                "timestamp": isinstance(value, datetime),
+            }
+        )
+
+    total = None
+    if include_total:
+        row: dict = await db.fetchone(
+            f"SELECT COUNT(*) AS count FROM {table_name} {count_clause}",
+            count_values,
+        )
+        total = int(row["count"])
+
+    data: list[dict] | list[BaseModel]
+    if columns:
+        data = lean_rows(rows, model, columns)
+    else:
+        data = [dict_to_model(row, model) for row in rows]
+    return CursorPage(
+        data=data,
+        total=total,
+        next_cursor=next_cursor,
+    )
+
+
+def _select_list(columns: list[str] | None, table: str = "") -> str:
+    if not columns:
+        return f"{table}.*" if table else "*"
+    return ", ".join([f"{table}.{column}" if table else column for column in columns])
+
+
+@lru_cache
+def _decoded_fields(model: type[BaseModel]) -> tuple[set[str], set[str]]:
+    bools = {name for name, field in model.__fields__.items() if field.type_ is bool}
+    datetimes = {
+        name for name, field in model.__fields__.items() if field.type_ is datetime
+    }
+    return bools, datetimes
+
+
+def lean_rows(rows: Sequence, model: type[BaseModel], columns: list[str]) -> list[dict]:
+    """`columns` of the rows as plain dicts, decoded without building models."""
+    bools, datetimes = _decoded_fields(model)
+    bools = bools.intersection(columns)
+    datetimes = datetimes.intersection(columns)
+    data = []
+    for row in rows:
+        values = {column: row[column] for column in columns}
+        for column in bools:
+            if values[column] is not None:
+                values[column] = bool(values[column])
+        for column in datetimes:
+            value = values[column]
+            if value is None:
+                continue
+            if db.type == SQLITE:
+                values[column] = datetime.fromtimestamp(value, timezone.utc)
+            else:
+                values[column] = value.replace(tzinfo=timezone.utc)
+        data.append(values)
+    return data
+
+
+def in_clause(prefix: str, values: Sequence) -> tuple[str, dict]:
+    """Placeholders and values for an `IN (...)` clause."""
+    params = {f"{prefix}_{i}": value for i, value in enumerate(values)}
+    return ", ".join([f":{key}" for key in params]), params
 
 
 async def get_inventories(user_id: str) -> Inventory | None:
@@ -32,26 +372,35 @@ async def get_inventories(user_id: str) -> Inventory | None:
     )
 
 
+async def _get_cached_inventory(inventory_id: str) -> Inventory | None:
+    inventory = inventory_cache.get(inventory_id)
+    if not inventory:
+        inventory = await db.fetchone(
+            """
+                SELECT * FROM inventory.inventories
+                WHERE id = :inventory_id
+            """,
+            {"inventory_id": inventory_id},
+            Inventory,
+        )
+        if not inventory:
+            return None
+        inventory_cache.set(inventory_id, inventory)
+    return inventory.copy()
+
+
 async def get_inventory(user_id: str, inventory_id: str) -> Inventory | None:
-    return await db.fetchone(
-        """
-            SELECT * FROM inventory.inventories
-            WHERE id = :inventory_id AND user_id = :user_id
-        """,
-        {"inventory_id": inventory_id, "user_id": user_id},
-        Inventory,
-    )
+    inventory = await _get_cached_inventory(inventory_id)
+    if not inventory or inventory.user_id != user_id:
+        return None
+    return inventory
 
 
 async def get_public_inventory(inventory_id: str) -> PublicInventory | None:
-    return await db.fetchone(
-        """
-            SELECT * FROM inventory.inventories
-            WHERE id = :inventory_id
-        """,
-        {"inventory_id": inventory_id},
-        PublicInventory,
-    )
+    inventory = await _get_cached_inventory(inventory_id)
+    if not inventory:
+        return None
+    return PublicInventory.parse_obj(inventory.dict(exclude={"user_id"}))
 
 
 async def create_inventory(user_id: str, data: CreateInventory) -> Inventory:
@@ -61,60 +410,279 @@ async def create_inventory(user_id: str, data: CreateInventory) -> Inventory:
         user_id=user_id,
         **data.dict(),
     )
-    await db.insert("inventory.inventories", inventory)
+    async with transaction() as conn:
+        await conn.insert("inventory.inventories", inventory)
+        await conn.execute(
+            """
+            INSERT INTO inventory.inventory_stats (inventory_id)
+            VALUES (:inventory_id)
+            """,
+            {"inventory_id": inventory_id},
+        )
+    inventory_cache.pop(inventory_id)
     return inventory
 
 
 async def update_inventory(data: Inventory) -> Inventory:
     data.updated_at = datetime.now(timezone.utc)
-    await db.update("inventory.inventories", data)
+    async with transaction() as conn:
+        await conn.update("inventory.inventories", data)
+        await _bump_inventory_version(conn, data.id)
+    inventory_cache.pop(data.id)
     return data
 
 
-async def delete_inventory(user_id: str, inventory_id: str) -> None:
-    await db.execute(
-        """
-        DELETE FROM inventory.inventories
-        WHERE id = :inventory_id AND user_id = :user_id
-        """,
-        {"inventory_id": inventory_id, "user_id": user_id},
+async def delete_inventory(
+    user_id: str, inventory_id: str, defer_logs: bool = False
+) -> bool:
+    """Delete the inventory of `user_id`, with `defer_logs` its logs come later."""
+    async with transaction() as conn:
+        inventory: dict | None = await conn.fetchone(
+            """
+            SELECT id FROM inventory.inventories
+            WHERE id = :inventory_id AND user_id = :user_id
+            """,
+            {"inventory_id": inventory_id, "user_id": user_id},
+        )
+        if not inventory:
+            return False
+        await _delete_inventory_items(conn, inventory_id)
+        await _delete_inventory_managers(conn, inventory_id)
+        if defer_logs:
+            await conn.execute(
+                """
+                INSERT INTO inventory.deleted_inventories (inventory_id)
+                VALUES (:inventory_id)
+                ON CONFLICT (inventory_id) DO NOTHING
+                """,
+                {"inventory_id": inventory_id},
+            )
+        else:
+            await _delete_inventory_update_logs(conn, inventory_id)
+        await conn.execute(
+            """
+            DELETE FROM inventory.inventory_stats
+            WHERE inventory_id = :inventory_id
+            """,
+            {"inventory_id": inventory_id},
+        )
+        await conn.execute(
+            """
+            DELETE FROM inventory.inventories
+            WHERE id = :inventory_id AND user_id = :user_id
+            """,
+            {"inventory_id": inventory_id, "user_id": user_id},
+        )
+    inventory_cache.pop(inventory_id)
+    change_broker.publish(inventory_id, "inventory.deleted")
+    change_broker.close(inventory_id)
+    return True
+
+
+def item_tags_where(tags: list[str], match_all: bool = False) -> tuple[str, dict]:
+    """WHERE clause for items of `:inventory_id` tagged with any or all `tags`."""
+    tags = list(dict.fromkeys(tags))
+    q, values = in_clause("tag", tags)
+    having = ""
+    if match_all:
+        having = "GROUP BY item_id HAVING COUNT(*) = :tag_count"
+        values["tag_count"] = len(tags)
+    return (
+        f"""id IN (
+            SELECT item_id FROM inventory.item_tags
+            WHERE inventory_id = :inventory_id AND tag IN ({q}) {having}
+        )""",
+        values,
     )
 
 
-async def get_inventory_items_paginated(
-    inventory_id: str, filters: Filters[ItemFilters] | None = None
-) -> Page[Item]:
+def _items_where(
+    inventory_id: str, tags: list[str] | None, match_all_tags: bool
+) -> tuple[list[str], dict]:
     where = ["inventory_id = :inventory_id"]
     params = {"inventory_id": inventory_id}
+    if tags:
+        tags_clause, tags_values = item_tags_where(tags, match_all_tags)
+        where.append(tags_clause)
+        params.update(tags_values)
+    return where, params
 
-    return await db.fetch_page(
-        "SELECT * FROM inventory.items",
-        where=where,
-        values=params,
-        filters=filters,
-        model=Item,
+
+async def get_inventory_items_paginated(
+    inventory_id: str,
+    filters: Filters[ItemFilters] | None = None,
+    tags: list[str] | None = None,
+    match_all_tags: bool = False,
+    columns: list[str] | None = None,
+) -> Page[Item] | Page[dict]:
+    """A page of the inventory items, plain dicts of `columns` if given."""
+    where, params = _items_where(inventory_id, tags, match_all_tags)
+    query = f"SELECT {_select_list(columns)} FROM inventory.items"
+    model = None if columns else Item
+
+    total = None if tags else await _items_stats_total(inventory_id, filters)
+    if total is None:
+        page = await db.fetch_page(
+            query, where=where, values=params, filters=filters, model=model
+        )
+    else:
+        page = await _fetch_page_with_total(query, where, params, filters, model, total)
+    if columns:
+        return Page(data=lean_rows(page.data, Item, columns), total=page.total)
+    return page
+
+
+async def get_inventory_items_cursor_page(
+    inventory_id: str,
+    filters: Filters[ItemFilters],
+    cursor: str | None = None,
+    include_total: bool = False,
+    tags: list[str] | None = None,
+    match_all_tags: bool = False,
+    columns: list[str] | None = None,
+) -> CursorPage:
+    where, params = _items_where(inventory_id, tags, match_all_tags)
+    total = None
+    if include_total and not tags:
+        total = await _items_stats_total(inventory_id, filters)
+    page = await fetch_cursor_page(
+        "inventory.items",
+        where,
+        params,
+        filters,
+        Item,
+        cursor,
+        default_sort=("created_at", "asc"),
+        nullable_sort_defaults={"quantity_in_stock": "-1", "tags": "''"},
+        include_total=include_total and total is None,
+        columns=columns,
+    )
+    if total is not None:
+        page.total = total
+    return page
+
+
+def _items_search_matches(inventory_id: str, terms: list[str]) -> tuple[str, dict]:
+    """Subquery of `item_id` and `search_rank` of the items matching `terms`."""
+    if db.type == SQLITE:
+        words = " AND ".join(f"{_fts_phrase(term)}*" for term in terms)
+        match = (
+            f"inventory_id : {_fts_phrase(inventory_id)} "
+            f"AND {{name sku tags description}} : ({words})"
+        )
+        # bm25 weights follow the column order of items_fts
+        return (
+            """
+            SELECT item_id, -bm25(items_fts, 0, 0, 10.0, 10.0, 5.0, 1.0)
+                AS search_rank
+            FROM inventory.items_fts WHERE items_fts MATCH :search_match
+            """,
+            {"search_match": match},
+        )
+    return (
+        """
+        SELECT item_id,
+            ts_rank(document, to_tsquery('simple', :search_match)) AS search_rank
+        FROM inventory.items_fts
+        WHERE inventory_id = :inventory_id
+        AND document @@ to_tsquery('simple', :search_match)
+        """,
+        {"search_match": " & ".join(f"{term}:*" for term in terms)},
+    )
+
+
+async def search_inventory_items(
+    inventory_id: str,
+    search: str,
+    filters: Filters[ItemFilters] | None = None,
+    tags: list[str] | None = None,
+    match_all_tags: bool = False,
+    columns: list[str] | None = None,
+) -> SearchPage:
+    """Items matching every word of `search` as a prefix, best ranked first."""
+    terms = search_terms(search)
+    if not terms:
+        page = await get_inventory_items_paginated(
+            inventory_id, filters, tags, match_all_tags, columns
+        )
+        return SearchPage(data=page.data, total=page.total)
+    filters = filters or Filters()
+    where, params = _items_where(inventory_id, tags, match_all_tags)
+    matches, match_values = _items_search_matches(inventory_id, terms)
+    params.update(match_values)
+
+    if not (tags or filters.filters or filters.search or filters.sortby):
+        # the best ranked matches once, they give both the page and the total
+        ranked: list[dict] = await db.fetchall(
+            f"""
+            {matches}
+            ORDER BY search_rank DESC, item_id
+            LIMIT {SEARCH_MAX_RESULTS + 1}
+            """,
+            params,
+        )
+        capped = len(ranked) > SEARCH_MAX_RESULTS
+        ranked = ranked[:SEARCH_MAX_RESULTS]
+        offset = filters.offset or 0
+        limit = min(filters.limit or 10, 1000)
+        page_ids = [row["item_id"] for row in ranked[offset : offset + limit]]
+        rows = await get_items_by_ids(inventory_id, page_ids, columns=columns)
+        items = {row["id"] if columns else row.id: row for row in rows}
+        return SearchPage(
+            data=[items[item_id] for item_id in page_ids if item_id in items],
+            total=None if capped else len(ranked),
+        )
+
+    query = f"""
+        FROM inventory.items
+        JOIN ({matches}) AS matches ON matches.item_id = items.id
+        {filters.where(where)}
+    """
+    values = filters.values(params)
+    rows = await db.fetchall(
+        f"""
+        SELECT {_select_list(columns, "items")} {query}
+        {filters.order_by() or "ORDER BY search_rank DESC, id"}
+        {filters.pagination()}
+        """,
+        values,
+        model=None if columns else Item,
     )
+    if columns:
+        rows = lean_rows(rows, Item, columns)
+    if not filters.offset and len(rows) < (filters.limit or 0):
+        return SearchPage(data=rows, total=len(rows))
+    row: dict = await db.fetchone(f"SELECT COUNT(*) AS total {query}", values)
+    return SearchPage(data=rows, total=row["total"])
 
 
-async def get_items_by_ids(inventory_id: str, item_ids: list[str]) -> list[Item]:
+async def get_items_by_ids(
+    inventory_id: str,
+    item_ids: list[str],
+    for_update: bool = False,
+    conn: Connection | None = None,
+    columns: list[str] | None = None,
+) -> list:
     if not item_ids:
         return []
     if isinstance(item_ids, str):
         item_ids = [item_ids]
-    q = ",".join([f"'{item_id}'" for item_id in item_ids])
-    items = await db.fetchall(
+    q, values = in_clause("id", list(dict.fromkeys(item_ids)))
+    lock = "FOR UPDATE" if for_update and db.type in {POSTGRES, COCKROACH} else ""
+    items = await (conn or db).fetchall(
         f"""
-        SELECT * FROM inventory.items
+        SELECT {_select_list(columns)} FROM inventory.items
         WHERE inventory_id = :inventory_id AND id IN ({q})
+        {lock}
         """,
-        {"inventory_id": inventory_id},
-        model=Item,
+        {"inventory_id": inventory_id, **values},
+        model=None if columns else Item,
     )
-    return items
+    return lean_rows(items, Item, columns) if columns else items
 
 
-async def get_item(item_id: str) -> Item | None:
-    return await db.fetchone(
+async def get_item(item_id: str, conn: Connection | None = None) -> Item | None:
+    return await (conn or db).fetchone(
         """
         SELECT * FROM inventory.items
         WHERE id = :item_id
@@ -124,7 +692,70 @@ async def get_item(item_id: str) -> Item | None:
     )
 
 
-async def create_item(data: CreateItem) -> Item:
+def _joined_columns(table: str, model: type[BaseModel]) -> str:
+    return ", ".join(
+        f"{table}.{field} AS {table}__{field}" for field in model.__fields__
+    )
+
+
+def _joined_model(row: dict, table: str, model: type[TModel]) -> TModel:
+    prefix = f"{table}__"
+    return dict_to_model(
+        {
+            key.removeprefix(prefix): value
+            for key, value in row.items()
+            if key.startswith(prefix)
+        },
+        model,
+    )
+
+
+async def get_user_item(user_id: str, item_id: str) -> tuple[Item, Inventory] | None:
+    """The item with its inventory, in one query, if `user_id` owns it."""
+    row: dict | None = await db.fetchone(
+        f"""
+        SELECT {_joined_columns("items", Item)},
+            {_joined_columns("inventories", Inventory)}
+        FROM inventory.items
+        JOIN inventory.inventories ON inventories.id = items.inventory_id
+        WHERE items.id = :item_id AND inventories.user_id = :user_id
+        """,
+        {"item_id": item_id, "user_id": user_id},
+    )
+    if not row:
+        return None
+    return (
+        _joined_model(row, "items", Item),
+        _joined_model(row, "inventories", Inventory),
+    )
+
+
+async def get_manager_item(
+    manager_id: str, item_id: str
+) -> tuple[Item, Manager, PublicInventory] | None:
+    """The item with its inventory and manager, if the manager may access it."""
+    row: dict | None = await db.fetchone(
+        f"""
+        SELECT {_joined_columns("items", Item)},
+            {_joined_columns("managers", Manager)},
+            {_joined_columns("inventories", PublicInventory)}
+        FROM inventory.items
+        JOIN inventory.inventories ON inventories.id = items.inventory_id
+        JOIN inventory.managers ON managers.inventory_id = items.inventory_id
+        WHERE items.id = :item_id AND managers.id = :manager_id
+        """,
+        {"item_id": item_id, "manager_id": manager_id},
+    )
+    if not row:
+        return None
+    return (
+        _joined_model(row, "items", Item),
+        _joined_model(row, "managers", Manager),
+        _joined_model(row, "inventories", PublicInventory),
+    )
+
+
+def _new_item(data: CreateItem) -> Item:
     item_id = urlsafe_short_hash()
     item = Item(
         id=item_id,
@@ -132,28 +763,787 @@ async def create_item(data: CreateItem) -> Item:
     )
     if item.manager_id is not None and item.manager_id != "":
         item.is_active = False  # Items created by managers are inactive by default
-    await db.insert("inventory.items", item)
     return item
 
 
-async def update_item(data: Item) -> Item:
-    data.updated_at = datetime.now(timezone.utc)
-    await db.update("inventory.items", data)
-    return data
+def _split_images(items: list[Item]) -> list[ItemImage]:
+    """Image rows of new `items`, whose `images` become their primary image."""
+    rows: list[ItemImage] = []
+    for item in items:
+        images = normalize_images(item.images)
+        item.images = primary_image(item.id, images)
+        rows += _item_images(item, images)
+    return rows
 
 
-async def delete_item(item_id: str) -> None:
-    await db.execute(
+def _item_images(item: Item, images: list[str]) -> list[ItemImage]:
+    return [
+        ItemImage(
+            item_id=item.id,
+            inventory_id=item.inventory_id,
+            position=position,
+            image=image,
+        )
+        for position, image in enumerate(images)
+    ]
+
+
+async def _replace_item_images(
+    conn: TransactionConnection, item: Item, images: list[str]
+) -> None:
+    await conn.execute(
+        "DELETE FROM inventory.item_images WHERE item_id = :item_id",
+        {"item_id": item.id},
+    )
+    await conn.insert_many("inventory.item_images", _item_images(item, images))
+
+
+async def get_item_images(item_id: str, conn: Connection | None = None) -> list[str]:
+    rows: list[dict] = await (conn or db).fetchall(
         """
-        DELETE FROM inventory.items
-        WHERE id = :item_id
+        SELECT image FROM inventory.item_images
+        WHERE item_id = :item_id ORDER BY position
         """,
         {"item_id": item_id},
     )
+    return [row["image"] for row in rows]
+
+
+async def get_item_image(item_id: str, position: int) -> str | None:
+    row: dict | None = await db.fetchone(
+        """
+        SELECT image FROM inventory.item_images
+        WHERE item_id = :item_id AND position = :position
+        """,
+        {"item_id": item_id, "position": position},
+    )
+    return row["image"] if row else None
+
+
+async def set_item_images(item_id: str, images: list[str]) -> Item | None:
+    """Replace the gallery of an item, returns None if it does not exist."""
+    return await update_item_fields(item_id, {"images": images})
+
+
+def _item_tags(items: list[Item]) -> list[ItemTag]:
+    return [
+        ItemTag(item_id=item.id, inventory_id=item.inventory_id, tag=tag)
+        for item in items
+        for tag in dict.fromkeys(split_tags(item.tags))
+    ]
+
+
+async def _replace_item_tags(conn: TransactionConnection, items: list[Item]) -> None:
+    q, values = in_clause("id", [item.id for item in items])
+    await conn.execute(
+        f"DELETE FROM inventory.item_tags WHERE item_id IN ({q})",
+        values,
+    )
+    await conn.insert_many("inventory.item_tags", _item_tags(items))
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _search_document(i: int) -> str:
+    return (
+        f"setweight(to_tsvector('simple', :name_{i}), 'A')"
+        f" || setweight(to_tsvector('simple', :sku_{i}), 'A')"
+        f" || setweight(to_tsvector('simple', :tags_{i}), 'B')"
+        f" || setweight(to_tsvector('simple', :description_{i}), 'C')"
+    )
+
+
+async def _index_items(conn: TransactionConnection, items: list[Item]) -> None:
+    if db.type == SQLITE:
+        columns = "item_id, inventory_id, name, sku, tags, description"
+    else:
+        columns = "item_id, inventory_id, document"
+    chunk_size = MAX_BIND_PARAMS // 6
+    for start in range(0, len(items), chunk_size):
+        placeholders = []
+        values: dict = {}
+        for i, item in enumerate(items[start : start + chunk_size]):
+            values.update(
+                {
+                    f"item_id_{i}": item.id,
+                    f"inventory_id_{i}": item.inventory_id,
+                    f"name_{i}": item.name,
+                    f"sku_{i}": item.sku or "",
+                    f"tags_{i}": item.tags or "",
+                    f"description_{i}": item.description or "",
+                }
+            )
+            if db.type == SQLITE:
+                placeholders.append(
+                    f"(:item_id_{i}, :inventory_id_{i}, :name_{i}, :sku_{i}, "
+                    f":tags_{i}, :description_{i})"
+                )
+            else:
+                placeholders.append(
+                    f"(:item_id_{i}, :inventory_id_{i}, {_search_document(i)})"
+                )
+        await conn.execute(
+            f"""
+            INSERT INTO inventory.items_fts ({columns})
+            VALUES {", ".join(placeholders)}
+            """,
+            values,
+        )
+
+
+async def _unindex_items(conn: TransactionConnection, item_ids: list[str]) -> None:
+    chunk_size = MAX_BIND_PARAMS // 2
+    for start in range(0, len(item_ids), chunk_size):
+        chunk = item_ids[start : start + chunk_size]
+        q, values = in_clause("id", chunk)
+        if db.type == SQLITE:
+            # item_id is a full-text column on sqlite, find the rows by MATCH
+            ids = " OR ".join(_fts_phrase(item_id) for item_id in chunk)
+            values["id_match"] = f"item_id : ({ids})"
+            await conn.execute(
+                f"""
+                DELETE FROM inventory.items_fts
+                WHERE items_fts MATCH :id_match AND item_id IN ({q})
+                """,
+                values,
+            )
+        else:
+            await conn.execute(
+                f"DELETE FROM inventory.items_fts WHERE item_id IN ({q})", values
+            )
+
+
+def _search_changed(previous: Item | None, item: Item) -> bool:
+    if not previous:
+        return True
+    return any(
+        getattr(previous, field) != getattr(item, field)
+        for field in ("name", "sku", "tags", "description")
+    )
+
+
+async def create_item(data: CreateItem) -> Item:
+    item = _new_item(data)
+    images = _split_images([item])
+    async with transaction() as conn:
+        await conn.insert("inventory.items", item)
+        await conn.insert_many("inventory.item_images", images)
+        await conn.insert_many("inventory.item_tags", _item_tags([item]))
+        await _index_items(conn, [item])
+        await _update_item_stats(conn, [], [item])
+        await _add_item_valuation(conn, [item.id])
+        _publish_items(conn, "item.created", [item])
+    return item
+
+
+async def create_items(data: list[CreateItem]) -> list[str]:
+    """Insert all items in one transaction and return their ids."""
+    items = [_new_item(item) for item in data]
+    images = _split_images(items)
+    async with transaction() as conn:
+        await conn.insert_many("inventory.items", items)
+        await conn.insert_many("inventory.item_images", images)
+        await conn.insert_many("inventory.item_tags", _item_tags(items))
+        await _index_items(conn, items)
+        await _update_item_stats(conn, [], items)
+        await _add_item_valuation(conn, [item.id for item in items])
+        _publish_items(conn, "item.created", items)
+    return [item.id for item in items]
+
+
+async def update_item(data: Item, keep_images: bool = False) -> Item:
+    exclude = {"id", "created_at", "updated_at"} | (
+        {"images"} if keep_images else set()
+    )
+    return await update_item_fields(data.id, data.dict(exclude=exclude)) or data
+
+
+async def update_item_fields(item_id: str, fields: dict[str, Any]) -> Item | None:
+    """Write the changed `fields` of the item, without `images` the gallery stays."""
+    unknown = set(fields) - (set(Item.__fields__) - {"id", "created_at", "updated_at"})
+    if unknown:
+        raise ValueError(f"Cannot update item fields: {', '.join(sorted(unknown))}.")
+    async with transaction() as conn:
+        previous = await get_item(item_id, conn)
+        if not previous:
+            return None
+        gallery = None
+        if fields.get("images") == ITEM_IMAGE_URL.format(item_id=item_id, position=0):
+            fields = {k: v for k, v in fields.items() if k != "images"}
+        if "images" in fields:
+            gallery = normalize_images(fields["images"])
+            fields = {**fields, "images": primary_image(item_id, gallery)}
+            if gallery == await get_item_images(item_id, conn):
+                gallery = None
+        item = Item(**{**previous.dict(), **fields})
+        changed = [
+            field
+            for field in fields
+            if getattr(item, field) != getattr(previous, field)
+        ]
+        if not changed and gallery is None:
+            return previous
+        item.updated_at = datetime.now(timezone.utc)
+        revalue = not VALUATION_FIELDS.isdisjoint(changed)
+        if revalue:
+            await _add_item_valuation(conn, [item_id], -1)
+        await conn.update_columns("inventory.items", item, [*changed, "updated_at"])
+        if gallery is not None:
+            await _replace_item_images(conn, item, gallery)
+        if "tags" in changed:
+            await _replace_item_tags(conn, [item])
+        if revalue:
+            await _add_item_valuation(conn, [item_id])
+        if _search_changed(previous, item):
+            await _unindex_items(conn, [item_id])
+            await _index_items(conn, [item])
+        await _update_item_stats(conn, [previous], [item])
+        if not _is_low_stock(previous) and _is_low_stock(item):
+            _publish_low_stock(conn, [item])
+        if changed == ["quantity_in_stock"] and gallery is None:
+            _publish_quantities(
+                conn,
+                item.inventory_id,
+                [(item.id, previous.quantity_in_stock, item.quantity_in_stock)],
+            )
+        else:
+            _publish_items(conn, "item.updated", [item])
+    return item
+
+
+async def bulk_update_items(
+    inventory_id: str,
+    selection: ItemsSelection,
+    fields: dict[str, Any],
+    price_change_percentage: float | None = None,
+) -> int:
+    """Apply `fields` and a price change to the selected items, returns the count."""
+    unknown = set(fields) - (
+        set(UpdateItem.__fields__) - {"quantity_in_stock", "images"}
+    )
+    if unknown:
+        raise ValueError(f"Cannot bulk update fields: {', '.join(sorted(unknown))}.")
+    if not fields and not price_change_percentage:
+        raise ValueError("Nothing to update.")
+    if "price" in fields and price_change_percentage:
+        raise ValueError("Set either a price or a price change, not both.")
+    factor = 1 + price_change_percentage / 100 if price_change_percentage else None
+    now = datetime.now(timezone.utc)
+
+    async with transaction() as conn:
+        previous_items = await _get_selected_items(conn, inventory_id, selection)
+        if not previous_items:
+            return 0
+        # validate the patch once, the items then get copies of its values
+        sample = Item(**{**previous_items[0].dict(), **fields})
+        patch = {field: getattr(sample, field) for field in fields}
+        pairs: list[tuple[Item, Item]] = []
+        for previous in previous_items:
+            changes = {
+                field: value
+                for field, value in patch.items()
+                if getattr(previous, field) != value
+            }
+            if factor and round(previous.price * factor, 2) != previous.price:
+                changes["price"] = round(previous.price * factor, 2)
+            if changes:
+                item = previous.copy(update={**changes, "updated_at": now})
+                pairs.append((previous, item))
+        if not pairs:
+            return 0
+
+        items = [item for _, item in pairs]
+        item_ids = [item.id for item in items]
+        revalue = bool(factor) or not VALUATION_FIELDS.isdisjoint(fields)
+        if revalue:
+            await _add_item_valuation(conn, item_ids, -1)
+        for start in range(0, len(item_ids), MAX_BIND_PARAMS):
+            q, values = in_clause("id", item_ids[start : start + MAX_BIND_PARAMS])
+            where = f"WHERE inventory_id = :inventory_id AND id IN ({q})"
+            values["inventory_id"] = inventory_id
+            await conn.update_where(
+                "inventory.items", items[0], [*fields, "updated_at"], where, values
+            )
+            if factor:
+                await conn.execute(
+                    f"""
+                    UPDATE inventory.items
+                    SET price = ROUND(CAST(price * :price_factor AS NUMERIC), 2)
+                    {where}
+                    """,
+                    {**values, "price_factor": factor},
+                )
+
+        if "tags" in fields:
+            for start in range(0, len(items), MAX_BIND_PARAMS):
+                await _replace_item_tags(conn, items[start : start + MAX_BIND_PARAMS])
+        if revalue:
+            await _add_item_valuation(conn, item_ids)
+        reindex = [item for previous, item in pairs if _search_changed(previous, item)]
+        if reindex:
+            await _unindex_items(conn, [item.id for item in reindex])
+            await _index_items(conn, reindex)
+        await _update_item_stats(conn, [previous for previous, _ in pairs], items)
+        crossed = [
+            item
+            for previous, item in pairs
+            if not _is_low_stock(previous) and _is_low_stock(item)
+        ]
+        _publish_low_stock(conn, crossed)
+        _publish_items(conn, "item.updated", items)
+    return len(items)
+
+
+async def _get_selected_items(
+    conn: TransactionConnection, inventory_id: str, selection: ItemsSelection
+) -> list[Item]:
+    if selection.ids is None and not selection.tags and not selection.manager_id:
+        raise ValueError("Select the items by ids, tags or manager.")
+    where, params = _items_where(
+        inventory_id, selection.tags, selection.tag_match == "all"
+    )
+    if selection.manager_id:
+        where.append("manager_id = :manager_id")
+        params["manager_id"] = selection.manager_id
+    lock = "FOR UPDATE" if db.type in {POSTGRES, COCKROACH} else ""
+    query = f"SELECT * FROM inventory.items WHERE {' AND '.join(where)}"
+    if selection.ids is None:
+        return await conn.fetchall(f"{query} {lock}", params, model=Item)
+
+    item_ids = list(dict.fromkeys(selection.ids))
+    items: list[Item] = []
+    for start in range(0, len(item_ids), MAX_BIND_PARAMS):
+        q, values = in_clause("id", item_ids[start : start + MAX_BIND_PARAMS])
+        items += await conn.fetchall(
+            f"{query} AND id IN ({q}) {lock}", {**params, **values}, model=Item
+        )
+    return items
+
+
+async def decrement_items_quantities(
+    inventory_id: str,
+    lines: list[tuple[str, int]],
+    source: str,
+    buffered: bool = False,
+) -> list[Item]:
+    """Subtract stock for `(item_id, quantity)` lines, never below zero."""
+    pending_logs: list[CreateInventoryUpdateLog] | None = [] if buffered else None
+    async with transaction() as conn:
+        items = await _decrement_stock(
+            conn, inventory_id, lines, source, pending_logs=pending_logs
+        )
+    if pending_logs:
+        await buffer_inventory_update_logs(pending_logs)
+    return items
+
+
+async def decrement_stock_for_payments(
+    updates: list[InvoiceStockUpdate], buffered: bool = False
+) -> list[InvoiceStockUpdate]:
+    """Take the stock of paid invoices once per payment hash."""
+    applied: list[InvoiceStockUpdate] = []
+    pending_logs: list[CreateInventoryUpdateLog] | None = [] if buffered else None
+    async with transaction() as conn:
+        lines_by_inventory: dict[str, list[tuple[str, int]]] = {}
+        keys_by_inventory: dict[str, list[str]] = {}
+        for update in updates:
+            claimed = await claim_idempotency_key(
+                update.payment_hash, update.inventory_id, conn
+            )
+            if not claimed:
+                continue
+            applied.append(update)
+            lines = lines_by_inventory.setdefault(update.inventory_id, [])
+            keys = keys_by_inventory.setdefault(update.inventory_id, [])
+            for line in update.items:
+                lines.append((line.id, line.quantity))
+                keys.append(update.payment_hash)
+        for inventory_id, lines in lines_by_inventory.items():
+            await _decrement_stock(
+                conn,
+                inventory_id,
+                lines,
+                "invoice",
+                keys_by_inventory[inventory_id],
+                pending_logs,
+            )
+    if pending_logs:
+        await buffer_inventory_update_logs(pending_logs)
+    for update in applied:
+        remember_idempotency_key(update.payment_hash)
+    return applied
+
+
+async def apply_stock_updates(
+    inventory_id: str, lines: list[StockUpdateLine], source: str
+) -> list[StockUpdateResult]:
+    """Apply `set`, `add` and `subtract` stock lines in order, one result each."""
+    item_ids = list(dict.fromkeys(line.id for line in lines))
+    lock = "FOR UPDATE" if db.type in {POSTGRES, COCKROACH} else ""
+    async with transaction() as conn:
+        # only the stock columns are read, building 10k items is not cheap
+        rows: list[dict] = []
+        for start in range(0, len(item_ids), MAX_BIND_PARAMS):
+            q, values = in_clause("id", item_ids[start : start + MAX_BIND_PARAMS])
+            rows += await conn.fetchall(
+                f"""
+                SELECT id, quantity_in_stock, reorder_threshold
+                FROM inventory.items
+                WHERE inventory_id = :inventory_id AND id IN ({q})
+                {lock}
+                """,
+                {"inventory_id": inventory_id, **values},
+            )
+        stock_before = {row["id"]: row["quantity_in_stock"] for row in rows}
+        thresholds = {row["id"]: row["reorder_threshold"] for row in rows}
+        stock = dict(stock_before)
+        results: list[StockUpdateResult] = []
+        logs: list[CreateInventoryUpdateLog] = []
+
+        for line in lines:
+            if line.id not in stock:
+                results.append(StockUpdateResult(id=line.id, status="not_found"))
+                continue
+            before = stock[line.id]
+            if before is None:
+                results.append(StockUpdateResult(id=line.id, status="untracked"))
+                continue
+            if line.op == "set":
+                after = line.quantity
+            elif line.op == "add":
+                after = before + line.quantity
+            else:
+                after = max(0, before - line.quantity)
+            results.append(
+                StockUpdateResult(
+                    id=line.id,
+                    status="updated" if after != before else "unchanged",
+                    quantity_before=before,
+                    quantity_after=after,
+                )
+            )
+            if after == before:
+                continue
+            stock[line.id] = after
+            logs.append(
+                CreateInventoryUpdateLog(
+                    inventory_id=inventory_id,
+                    item_id=line.id,
+                    quantity_change=after - before,
+                    quantity_before=before,
+                    quantity_after=after,
+                    source=source,
+                    idempotency_key=f"stock-update:{inventory_id}:{line.id}:"
+                    f"{before}->{after}",
+                )
+            )
+
+        changed = [
+            item_id
+            for item_id, after in stock.items()
+            if after != stock_before[item_id]
+        ]
+        await _add_item_valuation(conn, changed, -1)
+        await conn.execute_many(
+            f"""
+            UPDATE inventory.items
+            SET quantity_in_stock = :quantity_in_stock,
+                updated_at = {db.timestamp_now}
+            WHERE id = :id
+            """,
+            [
+                {"id": item_id, "quantity_in_stock": stock[item_id]}
+                for item_id in changed
+            ],
+        )
+        await _add_item_valuation(conn, changed)
+        await conn.insert_many("inventory.audit_logs", logs)
+        await _add_logs_stats(conn, inventory_id, len(logs))
+        if changed:
+            await _bump_inventory_version(conn, inventory_id)
+        crossed_ids = [
+            item_id
+            for item_id in changed
+            if thresholds[item_id] is not None
+            and stock[item_id] <= thresholds[item_id] < stock_before[item_id]
+        ]
+        if crossed_ids:
+            crossed = await get_items_by_ids(inventory_id, crossed_ids, conn=conn)
+            _publish_low_stock(conn, crossed)
+        _publish_quantities(
+            conn,
+            inventory_id,
+            [(item_id, stock_before[item_id], stock[item_id]) for item_id in changed],
+        )
+    return results
+
+
+async def _decrement_stock(
+    conn: TransactionConnection,
+    inventory_id: str,
+    lines: list[tuple[str, int]],
+    source: str,
+    idempotency_keys: list[str] | None = None,
+    pending_logs: list[CreateInventoryUpdateLog] | None = None,
+) -> list[Item]:
+    items = await get_items_by_ids(
+        inventory_id, [item_id for item_id, _ in lines], True, conn
+    )
+    existing_by_id = {item.id: item for item in items}
+    stock_before = {item.id: item.quantity_in_stock for item in items}
+    now = datetime.now(timezone.utc)
+    updated_items: list[Item] = []
+    logs: list[CreateInventoryUpdateLog] = []
+
+    for i, (item_id, qty) in enumerate(lines):
+        current = existing_by_id.get(item_id)
+        if not current or current.quantity_in_stock is None:
+            continue
+        if qty <= 0:
+            continue
+        before = current.quantity_in_stock
+        new_quantity = max(0, before - qty)
+        if new_quantity == before:
+            continue
+        current.quantity_in_stock = new_quantity
+        current.updated_at = now
+        updated_items.append(current)
+        logs.append(
+            CreateInventoryUpdateLog(
+                inventory_id=inventory_id,
+                item_id=item_id,
+                quantity_change=new_quantity - before,
+                quantity_before=before,
+                quantity_after=new_quantity,
+                source=source,
+                idempotency_key=(
+                    idempotency_keys[i]
+                    if idempotency_keys
+                    else f"manual-patch:{inventory_id}:{item_id}:"
+                    f"{before}->{new_quantity}"
+                ),
+            )
+        )
+
+    decrements = [
+        {"id": item.id, "delta": stock_before[item.id] - item.quantity_in_stock}
+        for item in existing_by_id.values()
+        if item.quantity_in_stock is not None
+        and item.quantity_in_stock != stock_before[item.id]
+    ]
+    decremented = [decrement["id"] for decrement in decrements]
+    await _add_item_valuation(conn, decremented, -1)
+    await conn.execute_many(
+        f"""
+        UPDATE inventory.items
+        SET quantity_in_stock = quantity_in_stock - :delta,
+            updated_at = {db.timestamp_now}
+        WHERE id = :id AND quantity_in_stock >= :delta
+        """,
+        decrements,
+    )
+    await _add_item_valuation(conn, decremented)
+    crossed = [
+        item
+        for item in updated_items
+        if _is_low_stock(item) and not _is_low_stock(item, stock_before[item.id])
+    ]
+    _publish_low_stock(conn, crossed)
+    _publish_quantities(
+        conn,
+        inventory_id,
+        [
+            (item.id, stock_before[item.id], item.quantity_in_stock)
+            for item in existing_by_id.values()
+        ],
+    )
+    if pending_logs is None:
+        await conn.insert_many("inventory.audit_logs", logs)
+        await _add_logs_stats(conn, inventory_id, len(logs))
+    else:
+        pending_logs.extend(logs)
+    if decrements:
+        await _bump_inventory_version(conn, inventory_id)
+    return updated_items
+
+
+async def get_low_stock_items(inventory_id: str) -> list[Item]:
+    """Items at or below their reorder threshold, served by a partial index."""
+    return await db.fetchall(
+        """
+        SELECT * FROM inventory.items
+        WHERE inventory_id = :inventory_id
+        AND quantity_in_stock <= reorder_threshold
+        ORDER BY quantity_in_stock, name
+        """,
+        {"inventory_id": inventory_id},
+        model=Item,
+    )
+
+
+def _is_low_stock(item: Item, quantity: int | None = None) -> bool:
+    if quantity is None:
+        quantity = item.quantity_in_stock
+    if quantity is None or item.reorder_threshold is None:
+        return False
+    return quantity <= item.reorder_threshold
+
+
+def _publish_low_stock(conn: TransactionConnection, items: list[Item]) -> None:
+    """Publish an owner-only `item.low_stock` change once `conn` commits."""
+    if not items:
+        return
+
+    def publish():
+        for item in items:
+            change_broker.publish(
+                item.inventory_id,
+                "item.low_stock",
+                private=True,
+                item_id=item.id,
+                quantity_in_stock=item.quantity_in_stock,
+            )
+
+    conn.on_commit(publish)
+
+
+def _publish_items(
+    conn: TransactionConnection, change_type: str, items: list[Item]
+) -> None:
+    """Publish `items` on the change feed once `conn` commits."""
+
+    def publish():
+        public_fields = set(PublicItem.__fields__)
+        for item in items:
+            public = None
+            if change_type != "item.deleted":
+                # the items are validated already
+                public = PublicItem.construct(**item.dict(include=public_fields))
+            change_broker.publish(
+                item.inventory_id,
+                change_type,
+                item_id=item.id,
+                quantity_in_stock=item.quantity_in_stock,
+                item=public,
+            )
+
+    conn.on_commit(publish)
+
+
+def _publish_quantities(
+    conn: TransactionConnection,
+    inventory_id: str,
+    changes: list[tuple[str, int | None, int | None]],
+) -> None:
+    """Publish `(item_id, before, after)` stock changes once `conn` commits."""
+    changes = [change for change in changes if change[1] != change[2]]
+
+    def publish():
+        for item_id, before, after in changes:
+            change_broker.publish(
+                inventory_id,
+                "item.quantity",
+                item_id=item_id,
+                quantity_delta=(after or 0) - (before or 0),
+                quantity_in_stock=after,
+            )
+
+    if changes:
+        conn.on_commit(publish)
+
+
+async def delete_item(item_id: str) -> None:
+    async with transaction() as conn:
+        item = await get_item(item_id, conn)
+        if item:
+            await _update_item_stats(conn, [item], [])
+            await _add_item_valuation(conn, [item_id], -1)
+            _publish_items(conn, "item.deleted", [item])
+        await _unindex_items(conn, [item_id])
+        await conn.execute(
+            """
+            DELETE FROM inventory.item_tags
+            WHERE item_id = :item_id
+            """,
+            {"item_id": item_id},
+        )
+        await conn.execute(
+            """
+            DELETE FROM inventory.item_images
+            WHERE item_id = :item_id
+            """,
+            {"item_id": item_id},
+        )
+        await conn.execute(
+            """
+            DELETE FROM inventory.items
+            WHERE id = :item_id
+            """,
+            {"item_id": item_id},
+        )
 
 
 async def delete_inventory_items(inventory_id: str) -> None:
-    await db.execute(
+    async with transaction() as conn:
+        await _delete_inventory_items(conn, inventory_id)
+
+
+async def _delete_inventory_items(
+    conn: TransactionConnection, inventory_id: str
+) -> None:
+    await conn.execute(
+        f"""
+        UPDATE inventory.inventory_stats
+        SET items_total = 0, items_active = 0, items_approved = 0,
+            version = version + 1, updated_at = {db.timestamp_now}
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+    await conn.execute(
+        """
+        DELETE FROM inventory.item_valuation
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+    await conn.execute(
+        """
+        DELETE FROM inventory.item_tags
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+    await conn.execute(
+        """
+        DELETE FROM inventory.item_images
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+    if db.type == SQLITE:
+        await conn.execute(
+            """
+            DELETE FROM inventory.items_fts
+            WHERE items_fts MATCH :inventory_match
+            AND inventory_id = :inventory_id
+            """,
+            {
+                "inventory_match": f"inventory_id : {_fts_phrase(inventory_id)}",
+                "inventory_id": inventory_id,
+            },
+        )
+    else:
+        await conn.execute(
+            """
+            DELETE FROM inventory.items_fts
+            WHERE inventory_id = :inventory_id
+            """,
+            {"inventory_id": inventory_id},
+        )
+    await conn.execute(
         """
         DELETE FROM inventory.items
         WHERE inventory_id = :inventory_id
@@ -161,6 +1551,11 @@ async def delete_inventory_items(inventory_id: str) -> None:
         {"inventory_id": inventory_id},
     )
 
+    def publish() -> None:
+        change_broker.publish(inventory_id, "items.cleared")
+
+    conn.on_commit(publish)
+
 
 async def create_manager(data: CreateManager) -> Manager:
     manager_id = urlsafe_short_hash()
@@ -169,12 +1564,14 @@ async def create_manager(data: CreateManager) -> Manager:
         **data.dict(),
     )
     await db.insert("inventory.managers", manager)
+    manager_cache.pop(manager_id)
     return manager
 
 
 async def update_manager(data: Manager) -> Manager:
     data.updated_at = datetime.now(timezone.utc)
     await db.update("inventory.managers", data)
+    manager_cache.pop(data.id)
     return data
 
 
@@ -190,14 +1587,20 @@ async def get_managers(inventory_id: str) -> list[Manager]:
 
 
 async def get_manager(manager_id: str) -> Manager | None:
-    return await db.fetchone(
-        """
-        SELECT * FROM inventory.managers
-        WHERE id = :manager_id
-        """,
-        {"manager_id": manager_id},
-        model=Manager,
-    )
+    manager = manager_cache.get(manager_id)
+    if not manager:
+        manager = await db.fetchone(
+            """
+            SELECT * FROM inventory.managers
+            WHERE id = :manager_id
+            """,
+            {"manager_id": manager_id},
+            model=Manager,
+        )
+        if not manager:
+            return None
+        manager_cache.set(manager_id, manager)
+    return manager.copy()
 
 
 async def delete_manager(manager_id: str) -> None:
@@ -208,16 +1611,26 @@ async def delete_manager(manager_id: str) -> None:
         """,
         {"manager_id": manager_id},
     )
+    manager_cache.pop(manager_id)
 
 
 async def delete_inventory_managers(inventory_id: str) -> None:
-    await db.execute(
+    async with transaction() as conn:
+        await _delete_inventory_managers(conn, inventory_id)
+
+
+async def _delete_inventory_managers(
+    conn: TransactionConnection, inventory_id: str
+) -> None:
+    await conn.execute(
         """
         DELETE FROM inventory.managers
         WHERE inventory_id = :inventory_id
         """,
         {"inventory_id": inventory_id},
     )
+    # manager ids are not known here, this is rare enough to drop them all
+    conn.on_commit(manager_cache.clear)
 
 
 async def get_inventory_items(inventory_id: str) -> list[Item]:
@@ -231,6 +1644,61 @@ async def get_inventory_items(inventory_id: str) -> list[Item]:
     )
 
 
+async def iter_inventory_items(
+    inventory_id: str,
+    chunk_size: int = 500,
+    columns: list[str] | None = None,
+    with_images: bool = False,
+) -> AsyncGenerator[list, None]:
+    """Yield the inventory items in chunks of `chunk_size`, in id order."""
+    last_id = ""
+    while True:
+        rows = await db.fetchall(
+            f"""
+            SELECT {_select_list(columns)} FROM inventory.items
+            WHERE inventory_id = :inventory_id AND id > :last_id
+            ORDER BY id
+            LIMIT :limit
+            """,
+            {"inventory_id": inventory_id, "last_id": last_id, "limit": chunk_size},
+            model=None if columns else Item,
+        )
+        if not rows:
+            return
+        items: list[Item] | list[dict] = (
+            lean_rows(rows, Item, columns) if columns else rows
+        )
+        if with_images and (not columns or "images" in columns):
+            await _load_galleries(items)
+        yield items
+        if len(items) < chunk_size:
+            return
+        last = items[-1]
+        last_id = last["id"] if isinstance(last, dict) else last.id
+
+
+async def _load_galleries(items: list[Item] | list[dict]) -> None:
+    """Set `images` of the items to their full gallery, joined by `|||`."""
+    item_ids = [item["id"] if isinstance(item, dict) else item.id for item in items]
+    galleries: dict[str, list[str]] = {}
+    for start in range(0, len(item_ids), MAX_BIND_PARAMS):
+        q, values = in_clause("id", item_ids[start : start + MAX_BIND_PARAMS])
+        rows: list[dict] = await db.fetchall(
+            f"""
+            SELECT item_id, image FROM inventory.item_images
+            WHERE item_id IN ({q}) ORDER BY item_id, position
+            """,
+            values,
+        )
+        for row in rows:
+            galleries.setdefault(row["item_id"], []).append(row["image"])
+    for item in items:
+        if isinstance(item, dict):
+            item["images"] = to_images_csv(galleries.get(item["id"], []))
+        else:
+            item.images = to_images_csv(galleries.get(item.id, []))
+
+
 def manager_can_access_item(manager: Manager, item: Item) -> bool:
     # No restriction when manager has no tag limitations
     if manager.tags is None:
@@ -248,16 +1716,86 @@ def manager_can_access_item(manager: Manager, item: Item) -> bool:
     return check_item_tags(allowed_tags, item_tags)
 
 
+def manager_items_where(manager: Manager) -> tuple[list[str], dict]:
+    """WHERE clauses limiting items to the tags the manager may see."""
+    allowed_tags = manager_allowed_tags(manager)
+    if allowed_tags is None:
+        return [], {}
+    if not allowed_tags:
+        return ["1 = 0"], {}
+    clause, values = item_tags_where(allowed_tags)
+    return [clause], values
+
+
 async def get_manager_items(inventory_id: str, manager: Manager) -> list[Item]:
-    items = await get_inventory_items(inventory_id)
-    return [item for item in items if manager_can_access_item(manager, item)]
+    where, values = manager_items_where(manager)
+    return await db.fetchall(
+        f"""
+        SELECT * FROM inventory.items
+        WHERE {" AND ".join(["inventory_id = :inventory_id", *where])}
+        """,
+        {"inventory_id": inventory_id, **values},
+        model=Item,
+    )
+
+
+async def get_manager_items_paginated(
+    inventory_id: str, manager: Manager, filters: Filters[ItemFilters] | None = None
+) -> Page[Item]:
+    where, values = manager_items_where(manager)
+
+    return await db.fetch_page(
+        "SELECT * FROM inventory.items",
+        where=["inventory_id = :inventory_id", *where],
+        values={"inventory_id": inventory_id, **values},
+        filters=filters,
+        model=Item,
+    )
 
 
 ## Log/Audit
 async def create_inventory_update_log(
-    data: CreateInventoryUpdateLog,
+    data: CreateInventoryUpdateLog, buffered: bool = False
 ) -> None:
-    await db.insert("inventory.audit_logs", data)
+    """Write the log, or with `buffered` queue it for the background writer."""
+    if buffered:
+        await buffer_inventory_update_logs([data])
+        return
+    async with transaction() as conn:
+        await conn.insert("inventory.audit_logs", data)
+        await _add_logs_stats(conn, data.inventory_id, 1)
+
+
+async def create_inventory_update_logs(logs: list[CreateInventoryUpdateLog]) -> None:
+    counts: dict[str, int] = {}
+    for log in logs:
+        counts[log.inventory_id] = counts.get(log.inventory_id, 0) + 1
+    async with transaction() as conn:
+        await conn.insert_many("inventory.audit_logs", logs)
+        for inventory_id, count in counts.items():
+            await _add_logs_stats(conn, inventory_id, count)
+
+
+async def buffer_inventory_update_logs(logs: list[CreateInventoryUpdateLog]) -> None:
+    """Queue `logs` for the background writer, writing them now if it is full."""
+    for i, log in enumerate(logs):
+        try:
+            audit_log_buffer.put_nowait(log)
+        except asyncio.QueueFull:
+            await create_inventory_update_logs(logs[i:])
+            return
+
+
+async def flush_inventory_update_logs(max_size: int = 1000) -> int:
+    """Write every queued log, returns how many were written."""
+    written = 0
+    while not audit_log_buffer.empty():
+        logs: list[CreateInventoryUpdateLog] = []
+        while not audit_log_buffer.empty() and len(logs) < max_size:
+            logs.append(audit_log_buffer.get_nowait())
+        await create_inventory_update_logs(logs)
+        written += len(logs)
+    return written
 
 
 async def get_inventory_update_logs_paginated(
@@ -267,36 +1805,667 @@ async def get_inventory_update_logs_paginated(
     where = ["inventory_id = :inventory_id"]
     params = {"inventory_id": inventory_id}
 
-    return await db.fetch_page(
+    stats = None
+    if not filters or (not filters.filters and not filters.search):
+        stats = await get_inventory_stats(inventory_id)
+    if not stats:
+        return await db.fetch_page(
+            "SELECT * FROM inventory.audit_logs",
+            where=where,
+            values=params,
+            filters=filters,
+            model=InventoryUpdateLog,
+        )
+    return await _fetch_page_with_total(
         "SELECT * FROM inventory.audit_logs",
-        where=where,
-        values=params,
-        filters=filters,
-        model=InventoryUpdateLog,
+        where,
+        params,
+        filters,
+        InventoryUpdateLog,
+        stats.logs_total,
+    )
+
+
+async def get_inventory_update_logs_cursor_page(
+    inventory_id: str,
+    filters: Filters[InventoryLogFilters],
+    cursor: str | None = None,
+    include_total: bool = False,
+) -> CursorPage:
+    stats = None
+    if include_total and not filters.filters and not filters.search:
+        stats = await get_inventory_stats(inventory_id)
+    page = await fetch_cursor_page(
+        "inventory.audit_logs",
+        ["inventory_id = :inventory_id"],
+        {"inventory_id": inventory_id},
+        filters,
+        InventoryUpdateLog,
+        cursor,
+        default_sort=("created_at", "desc"),
+        include_total=include_total and stats is None,
     )
+    if stats:
+        page.total = stats.logs_total
+    return page
 
 
 async def delete_inventory_update_logs(inventory_id: str) -> None:
-    await db.execute(
+    async with transaction() as conn:
+        await _delete_inventory_update_logs(conn, inventory_id)
+
+
+async def _delete_inventory_update_logs(
+    conn: TransactionConnection, inventory_id: str
+) -> None:
+    await conn.execute(
         """
         DELETE FROM inventory.audit_logs
         WHERE inventory_id = :inventory_id
         """,
         {"inventory_id": inventory_id},
     )
+    await conn.execute(
+        """
+        DELETE FROM inventory.audit_log_daily
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+    await conn.execute(
+        """
+        UPDATE inventory.inventory_stats SET logs_total = 0
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
 
 
-async def check_idempotency(idempotency_key: str) -> bool:
-    """
-    Check if this request has already been processed.
-    Returns True if already processed.
-    """
-    existing_log = await db.fetchone(
+async def delete_inventory_update_logs_in_batches(
+    inventory_id: str, batch_size: int = 5000
+) -> int:
+    """Delete the logs of a deleted inventory in batches."""
+    deleted = 0
+    while True:
+        result = await db.execute(
+            """
+            DELETE FROM inventory.audit_logs
+            WHERE id IN (
+                SELECT id FROM inventory.audit_logs
+                WHERE inventory_id = :inventory_id
+                LIMIT :batch_size
+            )
+            """,
+            {"inventory_id": inventory_id, "batch_size": batch_size},
+        )
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            break
+        await asyncio.sleep(0)
+    await db.execute(
+        """
+        DELETE FROM inventory.audit_log_daily
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+    await db.execute(
+        """
+        DELETE FROM inventory.deleted_inventories
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+    return deleted
+
+
+async def delete_orphaned_update_logs(batch_size: int = 5000) -> int:
+    """Delete the logs left behind by inventories deleted with `defer_logs`."""
+    rows: list[dict] = await db.fetchall(
         """
+        SELECT inventory_id FROM inventory.deleted_inventories
+        ORDER BY deleted_at
+        """
+    )
+    deleted = 0
+    for row in rows:
+        deleted += await delete_inventory_update_logs_in_batches(
+            row["inventory_id"], batch_size
+        )
+    return deleted
+
+
+async def get_inventories_with_log_retention() -> list[Inventory]:
+    return await db.fetchall(
+        """
+        SELECT * FROM inventory.inventories
+        WHERE audit_log_retention_days IS NOT NULL
+        """,
+        model=Inventory,
+    )
+
+
+async def get_audit_logs_before(
+    inventory_id: str, before: datetime, limit: int = 1000
+) -> list[InventoryUpdateLog]:
+    """At most `limit` oldest audit logs of the inventory before `before`."""
+    return await db.fetchall(
+        f"""
         SELECT * FROM inventory.audit_logs
+        WHERE inventory_id = :inventory_id
+        AND created_at < {db.timestamp_placeholder("before")}
+        ORDER BY id LIMIT :limit
+        """,
+        {"inventory_id": inventory_id, "before": before, "limit": limit},
+        model=InventoryUpdateLog,
+    )
+
+
+async def rollup_audit_logs(logs: list[InventoryUpdateLog]) -> int:
+    """Add `logs` to the daily totals and delete them, returns how many."""
+    lock = "FOR UPDATE" if db.type in {POSTGRES, COCKROACH} else ""
+    async with transaction() as conn:
+        log_ids = [log.id for log in logs]
+        existing: set[int] = set()
+        for start in range(0, len(log_ids), MAX_BIND_PARAMS):
+            q, values = in_clause("id", log_ids[start : start + MAX_BIND_PARAMS])
+            rows: list[dict] = await conn.fetchall(
+                f"SELECT id FROM inventory.audit_logs WHERE id IN ({q}) {lock}",
+                values,
+            )
+            existing.update(row["id"] for row in rows)
+        logs = [log for log in logs if log.id in existing]
+        if logs:
+            await _rollup_audit_logs(conn, logs)
+    return len(logs)
+
+
+async def _rollup_audit_logs(
+    conn: TransactionConnection, logs: list[InventoryUpdateLog]
+) -> None:
+    daily: dict[tuple[str, str, str], AuditLogDaily] = {}
+    removed: dict[str, int] = {}
+    for log in logs:
+        key = (log.inventory_id, log.item_id, log_day(log.created_at))
+        if key not in daily:
+            daily[key] = AuditLogDaily(inventory_id=key[0], item_id=key[1], day=key[2])
+        row = daily[key]
+        row.changes += 1
+        if log.quantity_change > 0:
+            row.quantity_added += log.quantity_change
+        else:
+            row.quantity_removed -= log.quantity_change
+        removed[log.inventory_id] = removed.get(log.inventory_id, 0) + 1
+
+    await conn.execute_many(
+        """
+        INSERT INTO inventory.audit_log_daily
+            (inventory_id, item_id, day, changes, quantity_added, quantity_removed)
+        VALUES
+            (:inventory_id, :item_id, :day, :changes, :quantity_added,
+            :quantity_removed)
+        ON CONFLICT (inventory_id, item_id, day) DO UPDATE SET
+            changes = audit_log_daily.changes + excluded.changes,
+            quantity_added = audit_log_daily.quantity_added
+                + excluded.quantity_added,
+            quantity_removed = audit_log_daily.quantity_removed
+                + excluded.quantity_removed
+        """,
+        [row.dict() for row in daily.values()],
+    )
+    log_ids = [log.id for log in logs]
+    for start in range(0, len(log_ids), MAX_BIND_PARAMS):
+        q, values = in_clause("id", log_ids[start : start + MAX_BIND_PARAMS])
+        await conn.execute(
+            f"DELETE FROM inventory.audit_logs WHERE id IN ({q})", values
+        )
+    for inventory_id, count in removed.items():
+        await _add_logs_stats(conn, inventory_id, -count)
+
+
+async def get_audit_log_daily(
+    inventory_id: str, item_id: str | None = None, limit: int = 1000
+) -> list[AuditLogDaily]:
+    item_clause = "AND item_id = :item_id" if item_id else ""
+    return await db.fetchall(
+        f"""
+        SELECT * FROM inventory.audit_log_daily
+        WHERE inventory_id = :inventory_id {item_clause}
+        ORDER BY day DESC, item_id LIMIT :limit
+        """,
+        {"inventory_id": inventory_id, "item_id": item_id, "limit": limit},
+        model=AuditLogDaily,
+    )
+
+
+async def _fetch_page_with_total(
+    query: str,
+    where: list[str],
+    values: dict,
+    filters: Filters | None,
+    model: type[BaseModel] | None,
+    total: int,
+) -> Page:
+    """`db.fetch_page` for when the total is already known, skips the COUNT(*)."""
+    filters = filters or Filters()
+    rows = await db.fetchall(
+        f"""
+        {query}
+        {filters.where(where)}
+        {filters.order_by()}
+        {filters.pagination()}
+        """,
+        filters.values(values),
+        model,
+    )
+    return Page(data=rows, total=total)
+
+
+async def claim_idempotency_key(
+    idempotency_key: str,
+    inventory_id: str | None = None,
+    conn: Connection | None = None,
+) -> bool:
+    """Claim `idempotency_key`, False if it was already processed."""
+    if idempotency_cache.get(idempotency_key):
+        return False
+    result = await (conn or db).execute(
+        """
+        INSERT INTO inventory.idempotency_keys (idempotency_key, inventory_id)
+        VALUES (:idempotency_key, :inventory_id)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        """,
+        {"idempotency_key": idempotency_key, "inventory_id": inventory_id},
+    )
+    claimed = result.rowcount == 1
+    # within a transaction the caller remembers the key once it commits
+    if not claimed or not conn:
+        remember_idempotency_key(idempotency_key)
+    return claimed
+
+
+def remember_idempotency_key(idempotency_key: str) -> None:
+    idempotency_cache.set(idempotency_key, True)
+
+
+async def check_idempotency(idempotency_key: str) -> bool:
+    """True if a request with this key was already processed."""
+    if idempotency_cache.get(idempotency_key):
+        return True
+    existing: dict | None = await db.fetchone(
+        """
+        SELECT idempotency_key FROM inventory.idempotency_keys
         WHERE idempotency_key = :idempotency_key
         """,
         {"idempotency_key": idempotency_key},
-        model=InventoryUpdateLog,
     )
-    return existing_log is not None
+    if existing:
+        remember_idempotency_key(idempotency_key)
+    return existing is not None
+
+
+async def prune_idempotency_keys(older_than: datetime, batch_size: int = 1000) -> int:
+    """Delete keys claimed before `older_than` in batches."""
+    deleted = 0
+    while True:
+        result = await db.execute(
+            f"""
+            DELETE FROM inventory.idempotency_keys
+            WHERE idempotency_key IN (
+                SELECT idempotency_key FROM inventory.idempotency_keys
+                WHERE created_at < {db.timestamp_placeholder("older_than")}
+                LIMIT :batch_size
+            )
+            """,
+            {"older_than": older_than, "batch_size": batch_size},
+        )
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+## Stats
+async def get_inventory_stats(
+    inventory_id: str, conn: Connection | None = None
+) -> InventoryStats | None:
+    return await (conn or db).fetchone(
+        """
+        SELECT * FROM inventory.inventory_stats
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+        model=InventoryStats,
+    )
+
+
+async def _items_stats_total(
+    inventory_id: str, filters: Filters[ItemFilters] | None
+) -> int | None:
+    """Item total from the counters, None when it has to be counted."""
+    counter = "items_total"
+    if filters and filters.search:
+        return None
+    if filters and filters.filters:
+        if len(filters.filters) > 1:
+            return None
+        page_filter = filters.filters[0]
+        values = list((page_filter.values or {}).values())
+        if (
+            page_filter.field not in {"is_active", "is_approved"}
+            or page_filter.op != Operator.EQ
+            or values != [True]
+        ):
+            return None
+        counter = f"items_{page_filter.field[3:]}"
+    stats = await get_inventory_stats(inventory_id)
+    return getattr(stats, counter) if stats else None
+
+
+async def _update_item_stats(
+    conn: TransactionConnection, removed: list[Item], added: list[Item]
+) -> None:
+    deltas: dict[str, dict[str, int]] = {}
+    for sign, items in ((-1, removed), (1, added)):
+        for item in items:
+            delta = deltas.setdefault(
+                item.inventory_id,
+                {"items_total": 0, "items_active": 0, "items_approved": 0},
+            )
+            delta["items_total"] += sign
+            delta["items_active"] += sign if item.is_active else 0
+            delta["items_approved"] += sign if item.is_approved else 0
+    # every item write changes the inventory, so the version is always bumped
+    for inventory_id, delta in deltas.items():
+        await conn.execute(
+            f"""
+            UPDATE inventory.inventory_stats
+            SET items_total = items_total + :items_total,
+                items_active = items_active + :items_active,
+                items_approved = items_approved + :items_approved,
+                version = version + 1,
+                updated_at = {db.timestamp_now}
+            WHERE inventory_id = :inventory_id
+            """,
+            {"inventory_id": inventory_id, **delta},
+        )
+
+
+async def _bump_inventory_version(
+    conn: TransactionConnection, inventory_id: str
+) -> None:
+    await conn.execute(
+        f"""
+        UPDATE inventory.inventory_stats
+        SET version = version + 1, updated_at = {db.timestamp_now}
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id},
+    )
+
+
+async def _add_logs_stats(
+    conn: TransactionConnection, inventory_id: str, count: int
+) -> None:
+    if not count:
+        return
+    await conn.execute(
+        """
+        UPDATE inventory.inventory_stats
+        SET logs_total = logs_total + :count
+        WHERE inventory_id = :inventory_id
+        """,
+        {"inventory_id": inventory_id, "count": count},
+    )
+
+
+async def recompute_inventory_stats(inventory_id: str | None = None) -> None:
+    """Recount the counters and valuation sums, of one or all inventories."""
+    where = "WHERE inv.id = :inventory_id" if inventory_id else "WHERE 1 = 1"
+    await db.execute(
+        f"""
+        INSERT INTO inventory.inventory_stats
+            (inventory_id, items_total, items_active, items_approved, logs_total)
+        SELECT inv.id,
+            (SELECT COUNT(*) FROM inventory.items i WHERE i.inventory_id = inv.id),
+            (
+                SELECT COUNT(*) FROM inventory.items i
+                WHERE i.inventory_id = inv.id AND i.is_active
+            ),
+            (
+                SELECT COUNT(*) FROM inventory.items i
+                WHERE i.inventory_id = inv.id AND i.is_approved
+            ),
+            (SELECT COUNT(*) FROM inventory.audit_logs l WHERE l.inventory_id = inv.id)
+        FROM inventory.inventories inv
+        {where}
+        ON CONFLICT (inventory_id) DO UPDATE SET
+            items_total = excluded.items_total,
+            items_active = excluded.items_active,
+            items_approved = excluded.items_approved,
+            logs_total = excluded.logs_total
+        """,
+        {"inventory_id": inventory_id},
+    )
+    async with transaction() as conn:
+        if inventory_id:
+            await conn.execute(
+                """
+                DELETE FROM inventory.item_valuation
+                WHERE inventory_id = :inventory_id
+                """,
+                {"inventory_id": inventory_id},
+            )
+            await _upsert_item_valuation(
+                conn,
+                "items.inventory_id = :inventory_id",
+                {"inventory_id": inventory_id},
+                1,
+            )
+        else:
+            await conn.execute("DELETE FROM inventory.item_valuation")
+            await _upsert_item_valuation(conn, "1 = 1", {}, 1)
+
+
+async def get_drifted_inventories(after_id: str, limit: int) -> tuple[list[str], str]:
+    """Drifted ids among the next `limit` inventories, and where to continue."""
+    rows: list[dict] = await db.fetchall(
+        """
+        SELECT inv.id,
+            s.items_total, s.items_active, s.items_approved, s.logs_total,
+            (
+                SELECT COUNT(*) FROM inventory.items i
+                WHERE i.inventory_id = inv.id
+            ) AS counted_items,
+            (
+                SELECT COUNT(*) FROM inventory.items i
+                WHERE i.inventory_id = inv.id AND i.is_active
+            ) AS counted_active,
+            (
+                SELECT COUNT(*) FROM inventory.items i
+                WHERE i.inventory_id = inv.id AND i.is_approved
+            ) AS counted_approved,
+            (
+                SELECT COUNT(*) FROM inventory.audit_logs l
+                WHERE l.inventory_id = inv.id
+            ) AS counted_logs,
+            (
+                SELECT COALESCE(SUM(i.quantity_in_stock), 0) FROM inventory.items i
+                WHERE i.inventory_id = inv.id
+            ) AS counted_units,
+            (
+                SELECT COALESCE(SUM(v.items), 0) FROM inventory.item_valuation v
+                WHERE v.inventory_id = inv.id AND v.scope = 'total'
+            ) AS valued_items,
+            (
+                SELECT COALESCE(SUM(v.units), 0) FROM inventory.item_valuation v
+                WHERE v.inventory_id = inv.id AND v.scope = 'total'
+            ) AS valued_units
+        FROM (
+            SELECT id FROM inventory.inventories
+            WHERE id > :after_id ORDER BY id LIMIT :limit
+        ) inv
+        LEFT JOIN inventory.inventory_stats s ON s.inventory_id = inv.id
+        ORDER BY inv.id
+        """,
+        {"after_id": after_id, "limit": limit},
+    )
+    drifted = [
+        row["id"]
+        for row in rows
+        if (
+            row["items_total"],
+            row["items_active"],
+            row["items_approved"],
+            row["logs_total"],
+            row["valued_items"],
+            row["valued_units"],
+        )
+        != (
+            row["counted_items"],
+            row["counted_active"],
+            row["counted_approved"],
+            row["counted_logs"],
+            row["counted_items"],
+            row["counted_units"],
+        )
+    ]
+    last_id = rows[-1]["id"] if len(rows) == limit else ""
+    return drifted, last_id
+
+
+## Analytics
+async def _add_item_valuation(
+    conn: TransactionConnection, item_ids: list[str], sign: int = 1
+) -> None:
+    """Add the items to the valuation sums of their inventory, or `sign` -1."""
+    for start in range(0, len(item_ids), MAX_BIND_PARAMS):
+        q, values = in_clause("id", item_ids[start : start + MAX_BIND_PARAMS])
+        await _upsert_item_valuation(conn, f"items.id IN ({q})", values, sign)
+
+
+async def _upsert_item_valuation(
+    conn: TransactionConnection, where: str, values: dict, sign: int
+) -> None:
+    price = (
+        "CAST(items.price AS DOUBLE PRECISION)"
+        " * (1 - COALESCE(items.discount_percentage, 0) / 100)"
+    )
+    for scope, scope_key, source in (
+        ("total", "''", "inventory.items"),
+        (
+            "tag",
+            "item_tags.tag",
+            "inventory.items JOIN inventory.item_tags"
+            " ON item_tags.item_id = items.id",
+        ),
+        ("manager", "COALESCE(items.manager_id, '')", "inventory.items"),
+    ):
+        # postgres does not group by a constant
+        group_key = f", {scope_key}" if scope != "total" else ""
+        await conn.execute(
+            f"""
+            INSERT INTO inventory.item_valuation
+                (inventory_id, scope, scope_key, tax_rate, items, units,
+                stock_value, price_value, costed_price_value)
+            SELECT items.inventory_id, '{scope}', {scope_key},
+                COALESCE(items.tax_rate, -1),
+                {sign} * COUNT(*),
+                {sign} * COALESCE(SUM(items.quantity_in_stock), 0),
+                {sign} * COALESCE(
+                    SUM(
+                        items.quantity_in_stock
+                        * CAST(items.unit_cost AS DOUBLE PRECISION)
+                    ),
+                    0
+                ),
+                {sign} * COALESCE(SUM(items.quantity_in_stock * {price}), 0),
+                {sign} * COALESCE(
+                    SUM(
+                        CASE WHEN items.unit_cost IS NOT NULL
+                        THEN items.quantity_in_stock * {price} END
+                    ),
+                    0
+                )
+            FROM {source}
+            WHERE {where}
+            GROUP BY items.inventory_id{group_key}, COALESCE(items.tax_rate, -1)
+            ON CONFLICT (inventory_id, scope, scope_key, tax_rate) DO UPDATE SET
+                items = item_valuation.items + excluded.items,
+                units = item_valuation.units + excluded.units,
+                stock_value = item_valuation.stock_value + excluded.stock_value,
+                price_value = item_valuation.price_value + excluded.price_value,
+                costed_price_value = item_valuation.costed_price_value
+                    + excluded.costed_price_value
+            """,
+            values,
+        )
+
+
+async def get_inventory_valuation(inventory: Inventory) -> InventoryValuation | None:
+    """Stock value, retail value and margins, in total, per tag and manager."""
+    stats = await get_inventory_stats(inventory.id)
+    if not stats:
+        return None
+
+    # the item discount applies first, then the inventory discount. Prices
+    # include tax on tax inclusive inventories, otherwise tax is added.
+    tax_rate = "CASE WHEN tax_rate = -1 THEN :default_tax_rate ELSE tax_rate END"
+    gross = f"(1 + {tax_rate} * :tax_added / 100)"
+    net = f"(1 + {tax_rate} * :tax_included / 100)"
+    rows: list[dict] = await db.fetchall(
+        f"""
+        SELECT scope, scope_key,
+            SUM(items) AS items,
+            SUM(units) AS units,
+            SUM(stock_value) AS stock_value,
+            SUM(price_value * {gross}) * :global_factor AS retail_value,
+            SUM(price_value / {net}) * :global_factor AS retail_value_net,
+            SUM(costed_price_value / {net}) * :global_factor AS costed_value_net
+        FROM inventory.item_valuation
+        WHERE inventory_id = :inventory_id
+        GROUP BY scope, scope_key
+        HAVING SUM(items) > 0
+        ORDER BY scope, scope_key
+        """,
+        {
+            "inventory_id": inventory.id,
+            "default_tax_rate": inventory.default_tax_rate or 0.0,
+            "global_factor": 1 - (inventory.global_discount_percentage or 0.0) / 100,
+            "tax_added": 0.0 if inventory.is_tax_inclusive else 1.0,
+            "tax_included": 1.0 if inventory.is_tax_inclusive else 0.0,
+        },
+    )
+
+    valuation = InventoryValuation(
+        inventory_id=inventory.id,
+        currency=inventory.currency,
+        version=stats.version,
+        totals=ValuationTotals(),
+    )
+    for row in rows:
+        row = dict(row)
+        scope, scope_key = row.pop("scope"), row.pop("scope_key")
+        row["margin"] = (row["costed_value_net"] or 0) - (row["stock_value"] or 0)
+        if scope == "total":
+            valuation.totals = _valuation_totals(ValuationTotals, row)
+        elif scope == "tag":
+            valuation.tags.append(
+                _valuation_totals(TagValuation, {**row, "tag": scope_key})
+            )
+        else:
+            valuation.managers.append(
+                _valuation_totals(
+                    ManagerValuation, {**row, "manager_id": scope_key or None}
+                )
+            )
+    return valuation
+
+
+def _valuation_totals(model, row: dict):
+    data = dict(row)
+    costed_value_net = data.pop("costed_value_net") or 0
+    if costed_value_net:
+        data["margin_percentage"] = round(data["margin"] / costed_value_net * 100, 2)
+    for field in ("stock_value", "retail_value", "retail_value_net", "margin"):
+        data[field] = round(data[field] or 0, 2)
+    return model(**data)
@@ -1,4 +1,29 @@
-from .models import CreateItem, ImportItem, Manager
+import base64
+import csv
+import gzip
+import hashlib
+import io
+import json
+import re
+import zlib
+from collections.abc import AsyncGenerator, AsyncIterable
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from pathlib import Path
+
+from fastapi import Request
+from pydantic import BaseModel
+
+from .models import CreateItem, ImportItem, InventoryUpdateLog, Item, Manager
+
+# served by `api_get_item_image`, referenced by items with an inline image
+ITEM_IMAGE_URL = "/inventory/api/v1/items/{item_id}/images/{position}"
+
+EXPORT_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
 
 
 def check_item_tags(service_allowed_tags: list[str], item_tags: list[str]) -> bool:
@@ -13,6 +38,11 @@ def split_tags(tags: str | None) -> list[str]:
     return [tag.strip() for tag in tags.split(",") if tag.strip()]
 
 
+def search_terms(query: str, max_terms: int = 8) -> list[str]:
+    """Lowercased words of a search query, punctuation is dropped."""
+    return re.findall(r"[^\W_]+", query.lower())[:max_terms]
+
+
 def to_csv(value: list[str] | str | None) -> str | None:
     if value is None:
         return None
@@ -35,10 +65,39 @@ def normalize_images(value: str | list[str] | None) -> list[str]:
         return []
     if isinstance(value, list):
         return [str(v).strip() for v in value if str(v).strip()]
-    separator = "|||" if "|||" in value else ","
+    # a single inline image has a comma after its "data:...;base64" header
+    separator = "|||" if "|||" in value or is_inline_image(value) else ","
     return from_csv(value, separator=separator)
 
 
+def is_inline_image(image: str) -> bool:
+    return image.startswith("data:")
+
+
+def primary_image(item_id: str, images: list[str]) -> str | None:
+    """
+    Reference to the first image, kept on the item row for listings. Inline
+    (base64) images are referenced by their URL so the row stays small.
+    """
+    if not images:
+        return None
+    if is_inline_image(images[0]):
+        return ITEM_IMAGE_URL.format(item_id=item_id, position=0)
+    return images[0]
+
+
+def decode_inline_image(image: str) -> tuple[str, bytes] | None:
+    """Media type and content of a `data:<type>;base64,<data>` image."""
+    header, _, data = image.partition(",")
+    if not header.startswith("data:") or not header.endswith(";base64"):
+        return None
+    try:
+        content = base64.b64decode(data, validate=True)
+    except ValueError:
+        return None
+    return header[5:-7] or "application/octet-stream", content
+
+
 def to_images_csv(value: list[str] | str | None) -> str | None:
     if value is None:
         return None
@@ -88,3 +147,162 @@ def manager_allows_tags(manager: Manager, item_tags: list[str]) -> bool:
     if not item_tags:
         return False
     return all(tag in allowed_tags for tag in item_tags)
+
+
+def exportable_item(item: Item | dict) -> dict:
+    data = dict(item) if isinstance(item, dict) else item.dict()
+    data.pop("inventory_id", None)
+    for key in ("tags", "omit_tags"):
+        if key in data:
+            data[key] = from_csv(data[key])
+    if "images" in data:
+        data["images"] = normalize_images(data["images"])
+    return data
+
+
+def projection_columns(fields: str, model: type[BaseModel]) -> list[str]:
+    """
+    Columns of a comma separated `fields=` projection of `model`, `id` is
+    always included. Raises ValueError on fields the model does not have.
+    """
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in model.__fields__]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    return list(dict.fromkeys(["id", *requested]))
+
+
+def dump_json(data) -> str:
+    return json.dumps(data, default=_json_default)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+def _csv_line(values: list) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(
+        [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in values
+        ]
+    )
+    return buffer.getvalue()
+
+
+async def encode_export(
+    chunks: AsyncIterable[list[Item]] | AsyncIterable[list[dict]],
+    export_format: str,
+    columns: list[str] | None = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Encode chunks of items, or of projected rows of `columns`, as one JSON
+    document (`{"items": [...]}`), NDJSON or CSV. Nothing but the current
+    chunk is kept in memory.
+    """
+    csv_fields = [
+        field for field in columns or Item.__fields__ if field != "inventory_id"
+    ]
+    if export_format == "json":
+        yield '{"items": ['
+    elif export_format == "csv":
+        yield _csv_line(csv_fields)
+
+    first = True
+    async for items in chunks:
+        lines = []
+        for item in items:
+            if export_format == "csv":
+                data = item if isinstance(item, dict) else item.dict()
+                lines.append(_csv_line([data[field] for field in csv_fields]))
+                continue
+            line = json.dumps(exportable_item(item), default=_json_default)
+            if export_format == "json":
+                lines.append(line if first else f",{line}")
+            else:
+                lines.append(f"{line}\n")
+            first = False
+        yield "".join(lines)
+
+    if export_format == "json":
+        yield "]}"
+
+
+async def gzip_stream(chunks: AsyncIterable[str]) -> AsyncGenerator[bytes, None]:
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":"), default=_json_default)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError as exc:
+        raise ValueError("Invalid cursor.") from exc
+    if not isinstance(data, dict):
+        raise ValueError("Invalid cursor.")
+    return data
+
+
+def make_etag(*parts) -> str:
+    raw = "|".join(str(part) for part in parts)
+    return f'W/"{hashlib.sha256(raw.encode()).hexdigest()[:32]}"'
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: datetime | None = None
+) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # weak comparison, as for GET requests
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or not last_modified:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # http dates have a one second resolution
+    return last_modified.replace(microsecond=0) <= since
+
+
+def log_day(created_at: datetime) -> str:
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(timezone.utc).date().isoformat()
+
+
+def archive_audit_logs(path: Path, logs: list[InventoryUpdateLog]) -> None:
+    """
+    Append `logs` as NDJSON to the gzip file at `path`. Each call adds a gzip
+    member, the concatenated members read back as one stream.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as archive:
+        for log in logs:
+            archive.write(json.dumps(log.dict(), default=_json_default) + "\n")
@@ -1,4 +1,4 @@
-from lnbits.db import Database
+from lnbits.db import SQLITE, Database
 
 
 async def m001_initial(db: Database):
@@ -91,3 +91,455 @@ async def m002_add_item_weight(db: Database):
         );
         """
     )
+
+
+async def m003_add_lookup_indexes(db: Database):
+    """
+    Add composite indexes for the lookups done by crud.py: items, managers and
+    audit logs are always scoped by inventory (and sorted by the filter models
+    sort fields), audit logs are looked up by idempotency key and inventories
+    by owner. Tags get no index, their filters are substring (LIKE '%tag%')
+    matches that an index cannot serve.
+    """
+
+    indexes = {
+        "items_inventory_created_idx": ("items", "inventory_id, created_at"),
+        "items_inventory_name_idx": ("items", "inventory_id, name"),
+        "items_inventory_price_idx": ("items", "inventory_id, price"),
+        "items_inventory_quantity_idx": ("items", "inventory_id, quantity_in_stock"),
+        "items_inventory_manager_idx": ("items", "inventory_id, manager_id"),
+        "managers_inventory_idx": ("managers", "inventory_id"),
+        "audit_logs_inventory_created_idx": (
+            "audit_logs",
+            "inventory_id, created_at",
+        ),
+        "audit_logs_inventory_item_idx": (
+            "audit_logs",
+            "inventory_id, item_id, created_at",
+        ),
+        "audit_logs_idempotency_key_idx": ("audit_logs", "idempotency_key"),
+        "inventories_user_idx": ("inventories", "user_id"),
+    }
+    for name, (table, columns) in indexes.items():
+        await db.execute(create_index_query(db, name, table, columns))
+
+
+async def m004_add_items_keyset_index(db: Database):
+    """
+    Index items by (inventory_id, id) so exports can walk an inventory in
+    keyset order without sorting it.
+    """
+    await db.execute(
+        create_index_query(db, "items_inventory_id_idx", "items", "inventory_id, id")
+    )
+
+
+async def m005_add_item_tags(db: Database):
+    """
+    Normalized item tags, one row per (item, tag), so tag filters can match
+    exact tags through an index. Backfilled from the items tags column.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inventory.item_tags (
+            item_id TEXT NOT NULL,
+            inventory_id TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (item_id, tag)
+        );
+        """
+    )
+    await db.execute(
+        create_index_query(
+            db, "item_tags_inventory_tag_idx", "item_tags", "inventory_id, tag, item_id"
+        )
+    )
+
+    rows: list[dict] = await db.fetchall(
+        "SELECT id, inventory_id, tags FROM inventory.items WHERE tags IS NOT NULL"
+    )
+    tag_rows = [
+        (row["id"], row["inventory_id"], tag)
+        for row in rows
+        for tag in dict.fromkeys(
+            tag.strip() for tag in row["tags"].split(",") if tag.strip()
+        )
+    ]
+    for start in range(0, len(tag_rows), 300):
+        values: dict = {}
+        placeholders = []
+        for i, (item_id, inventory_id, tag) in enumerate(tag_rows[start : start + 300]):
+            placeholders.append(f"(:item_id_{i}, :inventory_id_{i}, :tag_{i})")
+            values[f"item_id_{i}"] = item_id
+            values[f"inventory_id_{i}"] = inventory_id
+            values[f"tag_{i}"] = tag
+        await db.execute(
+            f"""
+            INSERT INTO inventory.item_tags (item_id, inventory_id, tag)
+            VALUES {", ".join(placeholders)}
+            """,
+            values,
+        )
+
+
+async def m006_add_idempotency_keys(db: Database):
+    """
+    Dedicated idempotency store. The primary key makes claiming a key a single
+    INSERT ... ON CONFLICT DO NOTHING. Backfilled from the audit logs keys.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS inventory.idempotency_keys (
+            idempotency_key TEXT PRIMARY KEY,
+            inventory_id TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    await db.execute(
+        create_index_query(
+            db, "idempotency_keys_created_idx", "idempotency_keys", "created_at"
+        )
+    )
+    await db.execute(
+        """
+        INSERT INTO inventory.idempotency_keys
+            (idempotency_key, inventory_id, created_at)
+        SELECT idempotency_key, MIN(inventory_id), MAX(created_at)
+        FROM inventory.audit_logs
+        GROUP BY idempotency_key
+        """
+    )
+
+
+async def m007_add_inventory_stats(db: Database):
+    """
+    Per inventory counters kept up to date by the write paths, so listings
+    do not need a COUNT(*) for their totals.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS inventory.inventory_stats (
+            inventory_id TEXT PRIMARY KEY,
+            items_total INTEGER NOT NULL DEFAULT 0,
+            items_active INTEGER NOT NULL DEFAULT 0,
+            items_approved INTEGER NOT NULL DEFAULT 0,
+            logs_total INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO inventory.inventory_stats
+            (inventory_id, items_total, items_active, items_approved, logs_total)
+        SELECT inv.id,
+            (SELECT COUNT(*) FROM inventory.items i WHERE i.inventory_id = inv.id),
+            (
+                SELECT COUNT(*) FROM inventory.items i
+                WHERE i.inventory_id = inv.id AND i.is_active
+            ),
+            (
+                SELECT COUNT(*) FROM inventory.items i
+                WHERE i.inventory_id = inv.id AND i.is_approved
+            ),
+            (SELECT COUNT(*) FROM inventory.audit_logs l WHERE l.inventory_id = inv.id)
+        FROM inventory.inventories inv
+        """
+    )
+
+
+async def m008_add_inventory_version(db: Database):
+    """
+    Change version of each inventory, bumped by item and inventory writes
+    and used for the ETags of item listings.
+    """
+    await db.execute(
+        """
+        ALTER TABLE inventory.inventory_stats
+        ADD COLUMN version INTEGER NOT NULL DEFAULT 0
+        """
+    )
+
+
+async def m009_add_items_search(db: Database):
+    """
+    Full-text index over item name, sku, tags and description: an FTS5 table
+    on SQLite, a weighted tsvector with a GIN index on Postgres.
+    """
+    if db.type == SQLITE:
+        # item_id and inventory_id are indexed so rows can be found by MATCH,
+        # the 2 and 3 character prefix indexes speed up as-you-type lookups
+        await db.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS inventory.items_fts USING fts5(
+                item_id, inventory_id, name, sku, tags, description,
+                tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            );
+            """
+        )
+        await db.execute(
+            """
+            INSERT INTO inventory.items_fts
+                (item_id, inventory_id, name, sku, tags, description)
+            SELECT id, inventory_id, name, sku, tags, description
+            FROM inventory.items
+            """
+        )
+        return
+
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inventory.items_fts (
+            item_id TEXT PRIMARY KEY,
+            inventory_id TEXT NOT NULL,
+            document TSVECTOR NOT NULL
+        );
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS items_fts_document_idx "
+        "ON inventory.items_fts USING GIN (document)"
+    )
+    await db.execute(
+        create_index_query(db, "items_fts_inventory_idx", "items_fts", "inventory_id")
+    )
+    await db.execute(
+        """
+        INSERT INTO inventory.items_fts (item_id, inventory_id, document)
+        SELECT id, inventory_id,
+            setweight(to_tsvector('simple', COALESCE(name, '')), 'A')
+            || setweight(to_tsvector('simple', COALESCE(sku, '')), 'A')
+            || setweight(to_tsvector('simple', COALESCE(tags, '')), 'B')
+            || setweight(to_tsvector('simple', COALESCE(description, '')), 'C')
+        FROM inventory.items
+        """
+    )
+
+
+async def m010_add_audit_log_daily(db: Database):
+    """
+    Per item and day (UTC) totals of the audit logs removed by the retention
+    task, so stock history survives once the raw rows are archived.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inventory.audit_log_daily (
+            inventory_id TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            changes INTEGER NOT NULL DEFAULT 0,
+            quantity_added INTEGER NOT NULL DEFAULT 0,
+            quantity_removed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (inventory_id, item_id, day)
+        );
+        """
+    )
+
+
+async def m011_add_low_stock_index(db: Database):
+    """
+    Partial index over the items at or below their reorder threshold, so the
+    low stock report reads only those rows.
+    """
+    await db.execute(
+        create_index_query(
+            db,
+            "items_low_stock_idx",
+            "items",
+            "inventory_id, quantity_in_stock",
+            where="quantity_in_stock <= reorder_threshold",
+        )
+    )
+
+
+async def m012_add_item_images(db: Database):
+    """
+    Item images move to their own table, one row per image in gallery order.
+    The items row keeps a reference to the first image for listings, inline
+    (base64) images are referenced by the url serving them.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inventory.item_images (
+            item_id TEXT NOT NULL,
+            inventory_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            image TEXT NOT NULL,
+            PRIMARY KEY (item_id, position)
+        );
+        """
+    )
+    await db.execute(
+        create_index_query(
+            db, "item_images_inventory_idx", "item_images", "inventory_id"
+        )
+    )
+
+    # small batches, a single row can hold megabytes of inline images. Images
+    # are copied before the items row is rewritten and copies are skipped on
+    # conflict, so a rerun after a failure completes the galleries it left.
+    last_id = ""
+    while True:
+        rows: list[dict] = await db.fetchall(
+            """
+            SELECT id, inventory_id, images FROM inventory.items
+            WHERE images IS NOT NULL AND id > :last_id
+            ORDER BY id LIMIT 50
+            """,
+            {"last_id": last_id},
+        )
+        if not rows:
+            break
+        for row in rows:
+            value = row["images"]
+            separator = "|||" if "|||" in value or value.startswith("data:") else ","
+            images = [part.strip() for part in value.split(separator) if part.strip()]
+            for position, image in enumerate(images):
+                await db.execute(
+                    """
+                    INSERT INTO inventory.item_images
+                        (item_id, inventory_id, position, image)
+                    VALUES (:item_id, :inventory_id, :position, :image)
+                    ON CONFLICT (item_id, position) DO NOTHING
+                    """,
+                    {
+                        "item_id": row["id"],
+                        "inventory_id": row["inventory_id"],
+                        "position": position,
+                        "image": image,
+                    },
+                )
+            primary = images[0] if images else None
+            if primary and primary.startswith("data:"):
+                primary = f"/inventory/api/v1/items/{row['id']}/images/0"
+            await db.execute(
+                "UPDATE inventory.items SET images = :images WHERE id = :id",
+                {"id": row["id"], "images": primary},
+            )
+        last_id = rows[-1]["id"]
+
+
+async def m013_add_audit_log_retention(db: Database):
+    """
+    Days the audit logs of an inventory are kept before the maintenance task
+    rolls them into daily totals, archives and deletes them. NULL keeps them.
+    """
+    await db.execute(
+        """
+        ALTER TABLE inventory.inventories
+        ADD COLUMN audit_log_retention_days INTEGER
+        """
+    )
+
+
+async def m014_add_item_valuation(db: Database):
+    """
+    Running valuation sums per inventory, kept up to date by the item write
+    paths, in total (`scope` total), per tag and per manager (`scope_key` is
+    the tag or the manager id, empty for the owner). The sums are split by
+    item tax rate, -1 for items on the inventory default rate, so tax and
+    the inventory discount are applied when read.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS inventory.item_valuation (
+            inventory_id TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            scope_key TEXT NOT NULL,
+            tax_rate DOUBLE PRECISION NOT NULL,
+            items INTEGER NOT NULL DEFAULT 0,
+            units INTEGER NOT NULL DEFAULT 0,
+            stock_value DOUBLE PRECISION NOT NULL DEFAULT 0,
+            price_value DOUBLE PRECISION NOT NULL DEFAULT 0,
+            costed_price_value DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (inventory_id, scope, scope_key, tax_rate)
+        );
+        """
+    )
+    price = (
+        "CAST(items.price AS DOUBLE PRECISION)"
+        " * (1 - COALESCE(items.discount_percentage, 0) / 100)"
+    )
+    for scope, scope_key, source in (
+        ("total", "''", "inventory.items"),
+        (
+            "tag",
+            "item_tags.tag",
+            "inventory.items JOIN inventory.item_tags"
+            " ON item_tags.item_id = items.id",
+        ),
+        ("manager", "COALESCE(items.manager_id, '')", "inventory.items"),
+    ):
+        # postgres does not group by a constant
+        group_key = f", {scope_key}" if scope != "total" else ""
+        await db.execute(
+            f"""
+            INSERT INTO inventory.item_valuation
+                (inventory_id, scope, scope_key, tax_rate, items, units,
+                stock_value, price_value, costed_price_value)
+            SELECT items.inventory_id, '{scope}', {scope_key},
+                COALESCE(items.tax_rate, -1),
+                COUNT(*),
+                COALESCE(SUM(items.quantity_in_stock), 0),
+                COALESCE(
+                    SUM(
+                        items.quantity_in_stock
+                        * CAST(items.unit_cost AS DOUBLE PRECISION)
+                    ),
+                    0
+                ),
+                COALESCE(SUM(items.quantity_in_stock * {price}), 0),
+                COALESCE(
+                    SUM(
+                        CASE WHEN items.unit_cost IS NOT NULL
+                        THEN items.quantity_in_stock * {price} END
+                    ),
+                    0
+                )
+            FROM {source}
+            GROUP BY items.inventory_id{group_key}, COALESCE(items.tax_rate, -1)
+            """
+        )
+
+
+async def m015_add_deleted_inventories(db: Database):
+    """
+    Inventories deleted with their audit logs left for a background deletion.
+    The maintenance task sweeps the logs of these only, instead of searching
+    the audit logs for inventories that no longer exist. Backfilled once with
+    the inventories already gone that still have logs.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS inventory.deleted_inventories (
+            inventory_id TEXT PRIMARY KEY,
+            deleted_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    for table in ("audit_logs", "audit_log_daily"):
+        await db.execute(
+            f"""
+            INSERT INTO inventory.deleted_inventories (inventory_id)
+            SELECT DISTINCT logs.inventory_id FROM inventory.{table} logs
+            WHERE NOT EXISTS (
+                SELECT 1 FROM inventory.inventories inv
+                WHERE inv.id = logs.inventory_id
+            )
+            ON CONFLICT (inventory_id) DO NOTHING
+            """
+        )
+
+
+def create_index_query(
+    db: Database, name: str, table: str, columns: str, where: str | None = None
+) -> str:
+    # sqlite wants the schema on the index name, postgres on the table name
+    if db.type == SQLITE:
+        query = f"CREATE INDEX IF NOT EXISTS inventory.{name} ON {table} ({columns})"
+    else:
+        query = f"CREATE INDEX IF NOT EXISTS {name} ON inventory.{table} ({columns})"
+    if where:
+        query += f" WHERE {where}"
+    return query
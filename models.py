@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 
 from lnbits.db import FilterModel
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, root_validator
 
 
 class CreateInventory(BaseModel):
@@ -12,6 +12,9 @@ class CreateInventory(BaseModel):
     is_tax_inclusive: bool = True
     tags: str | None = None
     omit_tags: str | None = None
+    # audit logs older than this are rolled into daily totals, archived and
+    # deleted, None keeps them
+    audit_log_retention_days: int | None = Field(None, ge=1)
 
 
 class PublicInventory(CreateInventory):
@@ -46,11 +49,58 @@ class CreateItem(BaseModel):
     is_approved: bool = True
 
 
+class UpdateItem(BaseModel):
+    # fields to change, fields left out of the request are kept
+    name: str | None = None
+    description: str | None = None
+    images: str | None = None
+    sku: str | None = None
+    quantity_in_stock: int | None = None
+    price: float | None = None
+    discount_percentage: float | None = None
+    tax_rate: float | None = None
+    reorder_threshold: int | None = None
+    weight_grams: int | None = None
+    unit_cost: float | None = None
+    external_id: str | None = None
+    tags: str | None = None
+    omit_tags: str | None = None
+    is_active: bool | None = None
+    internal_note: str | None = None
+    is_approved: bool | None = None
+
+
+class ItemsSelection(BaseModel):
+    # items of the inventory with any of `ids`, matching `tags` and `manager_id`
+    ids: list[str] | None = Field(None, max_items=10_000)
+    tags: list[str] | None = None
+    tag_match: str = Field("any", regex="^(any|all)$")
+    manager_id: str | None = None
+
+
+class BulkUpdateItems(ItemsSelection):
+    fields: UpdateItem = Field(default_factory=UpdateItem)
+    # e.g. 10 raises the prices by 10%, -25 lowers them by a quarter
+    price_change_percentage: float | None = Field(None, gt=-100)
+
+    @root_validator(skip_on_failure=True)
+    def check_price_change(cls, values):
+        fields = values["fields"]
+        if values["price_change_percentage"] and "price" in fields.__fields_set__:
+            raise ValueError("Set either fields.price or price_change_percentage.")
+        return values
+
+
+class BulkUpdateResult(BaseModel):
+    updated: int
+
+
 class PublicItem(BaseModel):
     id: str
     inventory_id: str
     name: str
     description: str | None = None
+    # primary image reference, the full gallery is loaded from item_images
     images: str | None = None
     sku: str | None = None
     quantity_in_stock: int | None = None
@@ -76,6 +126,35 @@ class Item(PublicItem):
     is_approved: bool = False
 
 
+# pushed on the change feed: item.created, item.updated, item.deleted,
+# item.quantity, items.cleared, inventory.deleted, item.low_stock (owner
+# only), or reset when the subscriber missed changes and should reload the
+# items
+class ItemChange(BaseModel):
+    seq: int
+    inventory_id: str
+    type: str
+    item_id: str | None = None
+    quantity_delta: int | None = None
+    quantity_in_stock: int | None = None
+    item: PublicItem | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class ItemTag(BaseModel):
+    item_id: str
+    inventory_id: str
+    tag: str
+
+
+# the images of an item in gallery order: asset ids, urls or inline data urls
+class ItemImage(BaseModel):
+    item_id: str
+    inventory_id: str
+    position: int
+    image: str
+
+
 class ItemFilters(FilterModel):
     __search_fields__: list[str] = [  # noqa: RUF012
         "name",
@@ -108,6 +187,28 @@ class ItemFilters(FilterModel):
     updated_at: datetime | None = None
 
 
+class InventoryStats(BaseModel):
+    inventory_id: str
+    items_total: int = 0
+    items_active: int = 0
+    items_approved: int = 0
+    logs_total: int = 0
+    version: int = 0
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class CursorPage(BaseModel):
+    data: list
+    total: int | None = None
+    next_cursor: str | None = None
+
+
+# ranked search results, `total` is None when more matches than were ranked
+class SearchPage(BaseModel):
+    data: list
+    total: int | None = None
+
+
 # Inventory owner can assign managers to help manage items and stock
 class CreateManager(BaseModel):
     inventory_id: str
@@ -150,6 +251,75 @@ class InventoryUpdateLog(CreateInventoryUpdateLog):
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+# daily totals of audit logs that were archived by the retention task
+class AuditLogDaily(BaseModel):
+    inventory_id: str
+    item_id: str
+    day: str  # YYYY-MM-DD, UTC
+    changes: int = 0
+    quantity_added: int = 0
+    quantity_removed: int = 0
+
+
+class ValuationTotals(BaseModel):
+    items: int = 0
+    units: int = 0
+    stock_value: float = 0.0  # quantity * unit cost
+    retail_value: float = 0.0  # quantity * discounted price, tax included
+    retail_value_net: float = 0.0  # same, tax excluded
+    margin: float = 0.0  # net retail value - stock value, of costed items
+    margin_percentage: float | None = None
+
+
+class TagValuation(ValuationTotals):
+    tag: str
+
+
+class ManagerValuation(ValuationTotals):
+    manager_id: str | None = None  # None for items of the owner
+
+
+class InventoryValuation(BaseModel):
+    inventory_id: str
+    currency: str
+    version: int
+    totals: ValuationTotals
+    tags: list[TagValuation] = []
+    managers: list[ManagerValuation] = []
+
+
+class InvoiceStockLine(BaseModel):
+    id: str
+    quantity: int
+
+
+# Stock to subtract once an invoice tagged "inventory" is paid, read from
+# payment.extra: {"tag": "inventory", "inventory_id": "...", "items": [...]}
+class InvoiceStockUpdate(BaseModel):
+    payment_hash: str
+    inventory_id: str
+    items: list[InvoiceStockLine]
+
+
+class StockUpdateLine(BaseModel):
+    id: str
+    op: str = Field("subtract", regex="^(set|add|subtract)$")
+    quantity: int = Field(..., ge=0)
+
+
+class StockUpdatePayload(BaseModel):
+    lines: list[StockUpdateLine] = Field(..., max_items=10_000)
+    source: str | None = None
+
+
+class StockUpdateResult(BaseModel):
+    id: str
+    # updated, unchanged, not_found or untracked (no stock tracking)
+    status: str
+    quantity_before: int | None = None
+    quantity_after: int | None = None
+
+
 class InventoryLogFilters(FilterModel):
     __search_fields__: list[str] = ["idempotency_key", "item_id"]  # noqa: RUF012
 
@@ -192,3 +362,8 @@ class ImportItem(BaseModel):
 
 class ImportItemsPayload(BaseModel):
     items: list[ImportItem]
+
+
+class ImportItemsResult(BaseModel):
+    created: int
+    ids: list[str]
@@ -0,0 +1,239 @@
+"""
+Print the query plans of the hot inventory lookups before and after the
+lookup indexes (`m003_add_lookup_indexes`) are applied.
+
+Runs against a throwaway SQLite database by default. Pass a postgres url to
+run it against Postgres too, use an empty scratch database since the script
+creates (and drops) the `inventory` schema:
+
+    uv run python scripts/query_plans.py
+    uv run python scripts/query_plans.py --postgres postgres://user:pw@host/db
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from lnbits.db import POSTGRES, SQLITE, Compat
+
+# the extension is not an installed package, load its migrations by path
+_spec = importlib.util.spec_from_file_location(
+    "inventory_migrations", Path(__file__).parent.parent / "migrations.py"
+)
+assert _spec and _spec.loader
+migrations = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(migrations)
+
+QUERIES = {
+    "items page (sort by name)": """
+        SELECT * FROM inventory.items WHERE inventory_id = 'inv-3'
+        ORDER BY name asc LIMIT 10
+    """,
+    "items page (sort by created_at)": """
+        SELECT * FROM inventory.items WHERE inventory_id = 'inv-3'
+        ORDER BY created_at desc LIMIT 10
+    """,
+    "items count": """
+        SELECT COUNT(*) FROM inventory.items WHERE inventory_id = 'inv-3'
+    """,
+    "managers": """
+        SELECT * FROM inventory.managers WHERE inventory_id = 'inv-3'
+    """,
+    "audit logs page": """
+        SELECT * FROM inventory.audit_logs WHERE inventory_id = 'inv-3'
+        ORDER BY created_at desc LIMIT 10
+    """,
+    "idempotency check": """
+        SELECT * FROM inventory.audit_logs WHERE idempotency_key = 'key-1234'
+    """,
+    "inventories by user": """
+        SELECT * FROM inventory.inventories WHERE user_id = 'user-3'
+    """,
+}
+
+INVENTORIES = 20
+ITEMS = 50_000
+MANAGERS = 200
+LOGS = 200_000
+
+
+def seed_rows() -> dict[str, tuple[list[str], list[tuple]]]:
+    rng = random.Random(42)
+    now = int(time.time())
+    inventories = [
+        (f"inv-{i}", f"user-{i}", f"Shop {i}", "sat") for i in range(INVENTORIES)
+    ]
+    items = [
+        (
+            f"item-{i}",
+            f"inv-{i % INVENTORIES}",
+            f"Item {rng.randint(0, ITEMS)}",
+            rng.randint(1, 10_000),
+            rng.randint(0, 500),
+            f"tag{rng.randint(0, 30)}",
+        )
+        for i in range(ITEMS)
+    ]
+    managers = [
+        (f"manager-{i}", f"inv-{i % INVENTORIES}", f"Manager {i}")
+        for i in range(MANAGERS)
+    ]
+    logs = [
+        (
+            f"inv-{i % INVENTORIES}",
+            f"item-{rng.randint(0, ITEMS)}",
+            -1,
+            1,
+            0,
+            "webhook",
+            f"key-{i}",
+            now - rng.randint(0, 365 * 24 * 3600),
+        )
+        for i in range(LOGS)
+    ]
+    return {
+        "inventories": (["id", "user_id", "name", "currency"], inventories),
+        "items": (
+            ["id", "inventory_id", "name", "price", "quantity_in_stock", "tags"],
+            items,
+        ),
+        "managers": (["id", "inventory_id", "name"], managers),
+        "audit_logs": (
+            [
+                "inventory_id",
+                "item_id",
+                "quantity_change",
+                "quantity_before",
+                "quantity_after",
+                "source",
+                "idempotency_key",
+                "created_at",
+            ],
+            logs,
+        ),
+    }
+
+
+class SqliteDb(Compat):
+    type = SQLITE
+    schema = "inventory"
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(f"ATTACH '{path}' AS inventory")
+
+    async def execute(self, query: str, values: dict | None = None):
+        self.conn.execute(query, values or {})
+        self.conn.commit()
+
+    async def seed(self, table: str, columns: list[str], rows: list[tuple]):
+        placeholders = ", ".join("?" for _ in columns)
+        self.conn.executemany(
+            f"INSERT INTO inventory.{table} ({', '.join(columns)}) "
+            f"VALUES ({placeholders})",
+            rows,
+        )
+        self.conn.commit()
+
+    async def explain(self, query: str) -> list[str]:
+        self.conn.execute("ANALYZE inventory")
+        rows = self.conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+        return [row[-1] for row in rows]
+
+    async def close(self):
+        self.conn.close()
+
+
+class PostgresDb(Compat):
+    type = POSTGRES
+    schema = "inventory"
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @classmethod
+    async def connect(cls, url: str) -> "PostgresDb":
+        import asyncpg
+
+        conn = await asyncpg.connect(url)
+        exists = await conn.fetchval(
+            "SELECT 1 FROM information_schema.schemata "
+            "WHERE schema_name = 'inventory'"
+        )
+        if exists:
+            await conn.close()
+            raise SystemExit("schema 'inventory' exists, use a scratch database")
+        await conn.execute("CREATE SCHEMA inventory")
+        return cls(conn)
+
+    async def execute(self, query: str, values: dict | None = None):
+        await self.conn.execute(query)
+
+    async def seed(self, table: str, columns: list[str], rows: list[tuple]):
+        if "created_at" in columns:
+            index = columns.index("created_at")
+            rows = [
+                (*row[:index], datetime.fromtimestamp(row[index]), *row[index + 1 :])
+                for row in rows
+            ]
+        await self.conn.copy_records_to_table(
+            table, schema_name="inventory", columns=columns, records=rows
+        )
+
+    async def explain(self, query: str) -> list[str]:
+        await self.conn.execute("ANALYZE")
+        rows = await self.conn.fetch(f"EXPLAIN {query}")
+        return [row[0] for row in rows]
+
+    async def close(self):
+        await self.conn.execute("DROP SCHEMA inventory CASCADE")
+        await self.conn.close()
+
+
+async def print_plans(db, label: str):
+    print(f"\n== {db.type}: {label} ==")
+    for name, query in QUERIES.items():
+        print(f"-- {name}")
+        for line in await db.explain(query):
+            print(f"   {line}")
+
+
+async def run(db):
+    await migrations.m001_initial(db)
+    await migrations.m002_add_item_weight(db)
+    for table, (columns, rows) in seed_rows().items():
+        await db.seed(table, columns, rows)
+    await print_plans(db, "before indexes")
+    await migrations.m003_add_lookup_indexes(db)
+    await print_plans(db, "after indexes")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--postgres", help="postgres url of a scratch database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_db = SqliteDb(os.path.join(tmp, "ext_inventory.sqlite3"))
+        try:
+            await run(sqlite_db)
+        finally:
+            await sqlite_db.close()
+
+    if args.postgres:
+        postgres_db = await PostgresDb.connect(args.postgres)
+        try:
+            await run(postgres_db)
+        finally:
+            await postgres_db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
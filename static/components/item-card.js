@@ -38,9 +38,7 @@ window.app.component('item-card', {
       return 'In Stock'
     },
     itemImgUrl() {
-      return isBase64String(this.item.images[0])
-        ? this.item.images[0]
-        : `/api/v1/assets/${this.item.images[0]}/thumbnail`
+      return imageUrl(this.item.images[0])
     }
   },
   methods: {},
@@ -32,6 +32,7 @@ window.app = Vue.createApp({
         show: false,
         data: {},
         gallery: [],
+        galleryLoaded: false,
         currency: null
       },
       itemsTable: {
@@ -367,6 +368,9 @@ window.app = Vue.createApp({
       if (data.omit_tags && Array.isArray(data.omit_tags)) {
         data.omit_tags = data.omit_tags.join(',')
       }
+      if (!data.audit_log_retention_days) {
+        data.audit_log_retention_days = null
+      }
       if (data.id) {
         this.updateInventory(data)
       } else {
@@ -478,17 +482,34 @@ window.app = Vue.createApp({
       if (id) {
         const item = this.items.find(it => it.id === id)
         this.itemDialog.data = {...item}
-        this.itemDialog.gallery = item.images.map(id => {
+        this.itemDialog.gallery = []
+        this.itemDialog.galleryLoaded = false
+        this.loadItemGallery(id)
+        return
+      }
+      this.itemDialog.data = {}
+    },
+    async loadItemGallery(itemId) {
+      // listings only hold the primary image, the gallery is loaded on demand
+      try {
+        const {data} = await LNbits.api.request(
+          'GET',
+          `/inventory/api/v1/items/${itemId}/images`
+        )
+        if (this.itemDialog.data.id !== itemId) return
+        this.itemDialog.gallery = data.map(image => {
           return {
-            assetId: id,
-            preview: isBase64String(id) ? id : `/api/v1/assets/${id}/thumbnail`,
+            assetId: image,
+            preview: imageUrl(image),
             file: null,
             isNew: false
           }
         })
-        return
+        this.itemDialog.galleryLoaded = true
+      } catch (error) {
+        console.error('Error fetching item images:', error)
+        LNbits.utils.notifyError(error)
       }
-      this.itemDialog.data = {}
     },
     closeItemDialog() {
       this.itemDialog.show = false
@@ -498,6 +519,7 @@ window.app = Vue.createApp({
         if (p.preview && p.isNew) URL.revokeObjectURL(p.preview)
       })
       this.itemDialog.gallery = []
+      this.itemDialog.galleryLoaded = false
     },
     submitItemData() {
       const data = this.itemDialog.data
@@ -555,6 +577,32 @@ window.app = Vue.createApp({
       }
     },
     async updateItem(data) {
+      if (this.itemDialog.galleryLoaded) {
+        const images = await this.saveItemGallery(data.id)
+        if (images === undefined) return
+      }
+      // the gallery is saved on its own, leaving images out keeps it
+      data = {...data}
+      delete data.images
+
+      try {
+        const {data: updatedItem} = await LNbits.api.request(
+          'PUT',
+          `/inventory/api/v1/items/${data.id}`,
+          null,
+          data
+        )
+        this.items = this.items.map(item =>
+          item.id === updatedItem.id ? mapItems(updatedItem) : item
+        )
+      } catch (error) {
+        console.error('Error updating item:', error)
+        LNbits.utils.notifyError(error)
+      } finally {
+        this.closeItemDialog()
+      }
+    },
+    async saveItemGallery(itemId) {
       const filesToUpload = this.itemDialog.gallery
         .filter(
           p =>
@@ -579,6 +627,10 @@ window.app = Vue.createApp({
           LNbits.utils.notifyError('Failed to upload photos')
           return
         }
+        if (uploadedAssetIds.includes(null)) {
+          LNbits.utils.notifyError('One or more photo uploads failed')
+          return
+        }
       }
 
       // Asset IDs from gallery that are not new and not base64
@@ -588,23 +640,17 @@ window.app = Vue.createApp({
 
       const finalIds = [...existingAssetIds, ...uploadedAssetIds]
 
-      data.images = toCsv(finalIds)
-
       try {
         const {data: updatedItem} = await LNbits.api.request(
           'PUT',
-          `/inventory/api/v1/items/${data.id}`,
+          `/inventory/api/v1/items/${itemId}/images`,
           null,
-          data
-        )
-        this.items = this.items.map(item =>
-          item.id === updatedItem.id ? mapItems(updatedItem) : item
+          finalIds
         )
+        return updatedItem.images
       } catch (error) {
-        console.error('Error updating item:', error)
+        console.error('Error updating item images:', error)
         LNbits.utils.notifyError(error)
-      } finally {
-        this.closeItemDialog()
       }
     },
     async deleteItem(id) {
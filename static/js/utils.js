@@ -51,3 +51,10 @@ function isBase64String(str) {
   if (typeof str !== 'string') return false
   return str.includes('data:') && str.includes('base64')
 }
+
+// images are inline base64, urls (inline images of listings) or asset ids
+function imageUrl(image) {
+  if (!image) return null
+  if (isBase64String(image) || image.includes('/')) return image
+  return `/api/v1/assets/${image}/thumbnail`
+}
@@ -3,10 +3,52 @@
 # add your dependencies here
 
 import asyncio
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
+from lnbits.core.crud import get_wallet
 from lnbits.core.models import Payment
+from lnbits.settings import settings
 from lnbits.tasks import register_invoice_listener
 from loguru import logger
+from pydantic import ValidationError
+
+from .crud import (
+    audit_log_buffer,
+    create_inventory_update_log,
+    create_inventory_update_logs,
+    decrement_stock_for_payments,
+    delete_orphaned_update_logs,
+    flush_inventory_update_logs,
+    get_audit_logs_before,
+    get_drifted_inventories,
+    get_inventories_with_log_retention,
+    get_inventory,
+    prune_idempotency_keys,
+    recompute_inventory_stats,
+    rollup_audit_logs,
+)
+from .helpers import archive_audit_logs
+from .models import CreateInventoryUpdateLog, Inventory, InvoiceStockUpdate
+
+MAINTENANCE_INTERVAL_SECONDS = 60 * 60
+# inventories whose counters are checked against their rows per maintenance run
+STATS_CHECK_BATCH_SIZE = 100
+IDEMPOTENCY_KEY_RETENTION = timedelta(days=30)
+# payments arriving within this window are applied in one transaction
+INVOICE_BATCH_WINDOW_SECONDS = 0.01
+INVOICE_BATCH_MAX_SIZE = 500
+# buffered audit logs are written once this many are queued, or after this
+# long since the first one was queued
+AUDIT_LOG_FLUSH_SIZE = 500
+AUDIT_LOG_FLUSH_SECONDS = 1.0
+AUDIT_LOG_POLL_SECONDS = 0.05
+# logs that could not be written are queued again and retried after this long
+AUDIT_LOG_RETRY_SECONDS = 5.0
+# audit logs older than the retention of their inventory are archived to
+# gzipped NDJSON files in the data folder, rolled into daily totals and deleted
+AUDIT_LOG_BATCH_SIZE = 5000
+AUDIT_LOG_ARCHIVE_FOLDER = Path(settings.lnbits_data_folder, "inventory", "audit_logs")
 
 
 async def wait_for_paid_invoices():
@@ -14,12 +56,234 @@ async def wait_for_paid_invoices():
     register_invoice_listener(invoice_queue, "ext_inventory")
 
     while True:
-        payment = await invoice_queue.get()
-        await on_invoice_paid(payment)
+        payments = await next_invoice_batch(invoice_queue)
+        await on_invoices_paid(payments)
+
+
+async def next_invoice_batch(invoice_queue: asyncio.Queue) -> list[Payment]:
+    """
+    Wait for a payment, then collect whatever else arrives within
+    `INVOICE_BATCH_WINDOW_SECONDS` (up to `INVOICE_BATCH_MAX_SIZE`).
+    """
+    payments = [await invoice_queue.get()]
+    await asyncio.sleep(INVOICE_BATCH_WINDOW_SECONDS)
+    while not invoice_queue.empty() and len(payments) < INVOICE_BATCH_MAX_SIZE:
+        payments.append(invoice_queue.get_nowait())
+    return payments
 
 
 async def on_invoice_paid(payment: Payment) -> None:
+    await on_invoices_paid([payment])
+
+
+async def on_invoices_paid(payments: list[Payment]) -> None:
+    updates = []
+    wallet_owners: dict[str, str | None] = {}
     # Will grab any payment with the tag "inventory"
-    if payment.extra.get("tag") == "inventory":
+    for payment in payments:
+        if payment.extra.get("tag") != "inventory":
+            continue
         logger.info("inventory extension received payment")
         logger.debug(payment)
+        if not payment.extra.get("items"):
+            continue
+        try:
+            update = InvoiceStockUpdate.parse_obj(
+                {**payment.extra, "payment_hash": payment.payment_hash}
+            )
+        except ValidationError as exc:
+            logger.warning(f"inventory: invalid stock update in {payment.payment_hash}")
+            logger.debug(exc)
+            continue
+        # `extra` is set by whoever created the invoice, only the owner of the
+        # inventory may take stock from it
+        if payment.wallet_id not in wallet_owners:
+            wallet = await get_wallet(payment.wallet_id)
+            wallet_owners[payment.wallet_id] = wallet.user if wallet else None
+        owner = wallet_owners[payment.wallet_id]
+        if not owner or not await get_inventory(owner, update.inventory_id):
+            logger.warning(
+                f"inventory: payment {payment.payment_hash} to wallet "
+                f"{payment.wallet_id} does not belong to the owner of inventory "
+                f"{update.inventory_id}, stock not updated"
+            )
+            continue
+        updates.append(update)
+    if not updates:
+        return
+
+    # the payment hashes are claimed in the stock transaction, only the audit
+    # logs are left to the background writer
+    try:
+        await decrement_stock_for_payments(updates, buffered=True)
+    except Exception as exc:
+        if len(updates) == 1:
+            logger.error(f"inventory: stock update failed: {exc}")
+            return
+        # retry one by one, so one bad payment does not drop the whole batch
+        logger.warning(f"inventory: batched stock update failed, retrying: {exc}")
+        for update in updates:
+            try:
+                await decrement_stock_for_payments([update], buffered=True)
+            except Exception as update_exc:
+                logger.error(
+                    f"inventory: stock update for {update.payment_hash} failed: "
+                    f"{update_exc}"
+                )
+
+
+async def write_buffered_audit_logs():
+    logs: list[CreateInventoryUpdateLog] = []
+    write: asyncio.Task | None = None
+    try:
+        while True:
+            await next_audit_log_batch(logs)
+            # shielded, so stopping does not abort a write half way
+            write = asyncio.create_task(_write_audit_logs(logs))
+            await asyncio.shield(write)
+            write = None
+            logs = []
+    except asyncio.CancelledError:
+        # stopping: finish the running write, or write the batch being
+        # collected, then everything still queued
+        if write:
+            await write
+        elif logs:
+            await _write_audit_logs(logs)
+        await flush_audit_logs()
+        raise
+
+
+async def next_audit_log_batch(logs: list[CreateInventoryUpdateLog]) -> None:
+    """
+    Wait for a queued log, then add logs to `logs` until there are
+    `AUDIT_LOG_FLUSH_SIZE` or `AUDIT_LOG_FLUSH_SECONDS` passed. The caller
+    owns `logs`, so the ones taken from the queue survive a cancellation.
+    """
+    loop = asyncio.get_running_loop()
+    logs.append(await audit_log_buffer.get())
+    deadline = loop.time() + AUDIT_LOG_FLUSH_SECONDS
+    # polled, python 3.11's wait_for can swallow the cancellation on stop
+    while (
+        len(logs) + audit_log_buffer.qsize() < AUDIT_LOG_FLUSH_SIZE
+        and loop.time() < deadline
+    ):
+        await asyncio.sleep(AUDIT_LOG_POLL_SECONDS)
+    while len(logs) < AUDIT_LOG_FLUSH_SIZE and not audit_log_buffer.empty():
+        logs.append(audit_log_buffer.get_nowait())
+
+
+async def _write_audit_logs(logs: list[CreateInventoryUpdateLog]) -> None:
+    """
+    Write a batch of logs. When the batch fails each log is written on its
+    own, the ones that still fail are queued again instead of being dropped.
+    """
+    try:
+        await create_inventory_update_logs(logs)
+        return
+    except Exception as exc:
+        logger.warning(
+            f"inventory: failed to write {len(logs)} audit logs, "
+            f"writing them one by one: {exc}"
+        )
+    failed = []
+    for log in logs:
+        try:
+            await create_inventory_update_log(log)
+        except Exception:
+            failed.append(log)
+    if not failed:
+        return
+    requeued = 0
+    for log in failed:
+        try:
+            audit_log_buffer.put_nowait(log)
+        except asyncio.QueueFull:
+            break
+        requeued += 1
+    logger.error(
+        f"inventory: failed to write {len(failed)} audit logs, "
+        f"{requeued} queued again, {len(failed) - requeued} lost"
+    )
+    # most likely the database is unavailable, give it time before retrying
+    await asyncio.sleep(AUDIT_LOG_RETRY_SECONDS)
+
+
+async def flush_audit_logs() -> None:
+    try:
+        written = await flush_inventory_update_logs()
+    except Exception as exc:
+        logger.error(f"inventory: failed to flush audit logs: {exc}")
+        return
+    if written:
+        logger.debug(f"inventory: flushed {written} buffered audit logs")
+
+
+async def run_maintenance():
+    stats_checked_after = ""
+    while True:
+        now = datetime.now(timezone.utc)
+        stats_checked_after = await repair_inventory_stats(stats_checked_after)
+        pruned = await prune_idempotency_keys(now - IDEMPOTENCY_KEY_RETENTION)
+        if pruned:
+            logger.debug(f"inventory: pruned {pruned} idempotency keys")
+        archived = await archive_expired_audit_logs(now)
+        if archived:
+            logger.info(f"inventory: archived {archived} audit logs")
+        orphaned = await delete_orphaned_update_logs(AUDIT_LOG_BATCH_SIZE)
+        if orphaned:
+            logger.info(f"inventory: deleted {orphaned} orphaned audit logs")
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+
+async def repair_inventory_stats(after_id: str) -> str:
+    """
+    Check the counters of the next `STATS_CHECK_BATCH_SIZE` inventories after
+    `after_id` and recompute the ones that drifted. Returns where the next run
+    continues, every inventory is checked in turn.
+    """
+    drifted, last_id = await get_drifted_inventories(after_id, STATS_CHECK_BATCH_SIZE)
+    for inventory_id in drifted:
+        logger.warning(f"inventory: counters of {inventory_id} drifted, recomputing")
+        await recompute_inventory_stats(inventory_id)
+    return last_id
+
+
+async def archive_expired_audit_logs(now: datetime) -> int:
+    """
+    Archive, roll into daily totals and delete the audit logs older than the
+    retention of their inventory, in batches of `AUDIT_LOG_BATCH_SIZE`.
+    Inventories without a retention keep their logs. Returns the number of
+    logs removed.
+    """
+    removed = 0
+    for inventory in await get_inventories_with_log_retention():
+        removed += await _archive_inventory_audit_logs(inventory, now)
+    return removed
+
+
+async def _archive_inventory_audit_logs(inventory: Inventory, now: datetime) -> int:
+    assert inventory.audit_log_retention_days
+    before = now - timedelta(days=inventory.audit_log_retention_days)
+    archive = (
+        AUDIT_LOG_ARCHIVE_FOLDER
+        / inventory.id
+        / f"audit_logs-{now:%Y%m%dT%H%M%S}.ndjson.gz"
+    )
+    removed = 0
+    while True:
+        logs = await get_audit_logs_before(inventory.id, before, AUDIT_LOG_BATCH_SIZE)
+        if not logs:
+            return removed
+        # logs are only deleted once archived, a failed rollup leaves
+        # duplicates in the archive rather than logs lost for good
+        try:
+            await asyncio.to_thread(archive_audit_logs, archive, logs)
+        except OSError as exc:
+            logger.error(f"inventory: failed to archive audit logs: {exc}")
+            return removed
+        removed += await rollup_audit_logs(logs)
+        if len(logs) < AUDIT_LOG_BATCH_SIZE:
+            return removed
+        # give other requests a turn at the database between batches
+        await asyncio.sleep(0)
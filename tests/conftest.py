@@ -0,0 +1,99 @@
+"""
+The tests run against a fresh SQLite database in a temporary folder. Set
+`LNBITS_DATABASE_URL` to run them against Postgres, use an empty scratch
+database since the tests create (and drop) the `inventory` schema:
+
+    make test
+    LNBITS_DATABASE_URL=postgres://user:pw@host/db make test
+"""
+
+import re
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from httpx import ASGITransport, AsyncClient
+from lnbits.db import SQLITE
+from lnbits.decorators import check_user_exists, optional_user_id
+from lnbits.exceptions import register_exception_handlers
+from lnbits.helpers import urlsafe_short_hash
+from lnbits.settings import settings
+
+from .. import inventory_ext, migrations
+from ..crud import create_inventory, db
+from ..models import CreateInventory
+
+# the user a test client acts as, requests without it are anonymous
+USER_HEADER = "x-test-user"
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def database(tmp_path_factory):
+    if db.type == SQLITE:
+        settings.lnbits_data_folder = str(tmp_path_factory.mktemp("data"))
+        db.__init__(db.name)
+    else:
+        row = await db.fetchone(
+            "SELECT COUNT(*) AS count FROM information_schema.tables "
+            "WHERE table_schema = 'inventory'"
+        )
+        if row["count"]:
+            pytest.exit("schema 'inventory' has tables, use a scratch database")
+
+    async with db.connect() as conn:
+        for name, migration in sorted(vars(migrations).items()):
+            if re.match(r"^m\d{3}_", name):
+                await migration(conn)
+    yield db
+
+    if db.type != SQLITE:
+        await db.execute("DROP SCHEMA inventory CASCADE")
+
+
+def _user_id(request: Request) -> str | None:
+    return request.headers.get(USER_HEADER)
+
+
+def _user(request: Request) -> SimpleNamespace:
+    user_id = _user_id(request)
+    if not user_id:
+        raise HTTPException(401, "Missing user.")
+    return SimpleNamespace(id=user_id)
+
+
+@pytest.fixture(scope="session")
+def app() -> FastAPI:
+    app = FastAPI()
+    register_exception_handlers(app)
+    app.include_router(inventory_ext)
+    app.dependency_overrides[optional_user_id] = _user_id
+    app.dependency_overrides[check_user_exists] = _user
+    return app
+
+
+@pytest.fixture
+def user_id() -> str:
+    return urlsafe_short_hash()
+
+
+@pytest.fixture
+async def client(app, user_id):
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test/inventory",
+        headers={USER_HEADER: user_id},
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+async def anonymous(app):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test/inventory"
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+async def inventory(user_id):
+    return await create_inventory(user_id, CreateInventory(name="Shop", currency="sat"))
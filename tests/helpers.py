@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+
+from ..models import CreateItem
+
+
+def new_items(inventory_id: str, count: int = 1, **fields) -> list[CreateItem]:
+    return [
+        CreateItem(inventory_id=inventory_id, name=f"Item {i}", price=10, **fields)
+        for i in range(count)
+    ]
+
+
+def utc(value: datetime) -> datetime:
+    # postgres hands back naive utc timestamps
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
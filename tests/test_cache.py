@@ -0,0 +1,62 @@
+from ..cache import LRUCache
+from ..crud import (
+    create_manager,
+    delete_inventory,
+    get_inventory,
+    get_manager,
+    inventory_cache,
+    manager_cache,
+    update_manager,
+)
+from ..models import CreateManager
+
+
+def test_lru_cache_evicts_and_expires(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("time.monotonic", lambda: now[0])
+    cache = LRUCache[str, int](maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    assert "b" in cache  # checking does not make b recently used
+    cache.set("c", 3)  # evicts b, the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    now[0] = 11
+    assert "a" not in cache
+    assert cache.get("a") is None
+
+
+async def test_inventory_cache_invalidation(client, user_id, inventory):
+    cached = await get_inventory(user_id, inventory.id)
+    assert cached and inventory.id in inventory_cache
+    # callers get copies, changing one does not change the cache
+    cached.name = "Changed"
+    cached = await get_inventory(user_id, inventory.id)
+    assert cached and cached.name == "Shop"
+
+    response = await client.put(
+        f"/api/v1/{inventory.id}", json={"name": "Renamed", "currency": "sat"}
+    )
+    assert response.status_code == 200
+    cached = await get_inventory(user_id, inventory.id)
+    assert cached and cached.name == "Renamed"
+
+    assert await delete_inventory(user_id, inventory.id)
+    assert inventory.id not in inventory_cache
+    assert await get_inventory(user_id, inventory.id) is None
+
+
+async def test_manager_cache_invalidation(user_id, inventory):
+    manager = await create_manager(
+        CreateManager(inventory_id=inventory.id, name="Manager", tags="food")
+    )
+    assert await get_manager(manager.id)
+    assert manager.id in manager_cache
+    manager.tags = "drinks"
+    await update_manager(manager)
+    cached = await get_manager(manager.id)
+    assert cached and cached.tags == "drinks"
+
+    await delete_inventory(user_id, inventory.id)
+    assert await get_manager(manager.id) is None
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+from .. import views_api
+from ..broker import change_broker
+from ..crud import create_items, decrement_items_quantities, delete_inventory_items
+from .helpers import new_items
+
+
+def parse_events(body: str) -> list[tuple[int, str, dict]]:
+    events = []
+    for block in body.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in lines:
+            events.append((int(lines["id"]), lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def read_feed(monkeypatch, inventory_id: str, clients, write) -> list[str]:
+    """Open the feed with each client, run `write`, then end the feeds."""
+    monkeypatch.setattr(views_api, "CHANGE_FEED_KEEPALIVE_SECONDS", 0.01)
+    since = change_broker.last_seq(inventory_id)
+    requests = [
+        asyncio.create_task(
+            client.get(f"/api/v1/items/{inventory_id}/changes?since={since}")
+        )
+        for client in clients
+    ]
+    while len(change_broker._subscribers.get(inventory_id, ())) < len(clients):
+        await asyncio.sleep(0.01)
+    await write()
+    change_broker.close(inventory_id)
+    responses = await asyncio.gather(*requests)
+    for response in responses:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+    return [response.text for response in responses]
+
+
+async def test_change_feed(monkeypatch, client, anonymous, inventory):
+    [item_id] = await create_items(
+        new_items(inventory.id, quantity_in_stock=5, reorder_threshold=2)
+    )
+
+    async def write():
+        await decrement_items_quantities(inventory.id, [(item_id, 4)], "test")
+        await delete_inventory_items(inventory.id)
+
+    owner, public = await read_feed(
+        monkeypatch, inventory.id, [client, anonymous], write
+    )
+    owner_events = parse_events(owner)
+    assert [event for _, event, _ in owner_events] == [
+        "item.low_stock",
+        "item.quantity",
+        "items.cleared",
+    ]
+    seqs = [seq for seq, _, _ in owner_events]
+    assert seqs == sorted(seqs)
+    _, _, quantity = owner_events[1]
+    assert quantity["item_id"] == item_id
+    assert quantity["quantity_delta"] == -4
+    assert quantity["quantity_in_stock"] == 1
+    # the low stock event is only for the owner
+    assert [event for _, event, _ in parse_events(public)] == [
+        "item.quantity",
+        "items.cleared",
+    ]
+
+
+async def test_change_feed_replays_after_last_event_id(monkeypatch, client, inventory):
+    monkeypatch.setattr(views_api, "CHANGE_FEED_KEEPALIVE_SECONDS", 0.01)
+    since = change_broker.last_seq(inventory.id)
+    await create_items(new_items(inventory.id, 2))
+
+    async def replay():
+        response = await client.get(
+            f"/api/v1/items/{inventory.id}/changes",
+            headers={"last-event-id": str(since + 1)},
+        )
+        return parse_events(response.text)
+
+    task = asyncio.create_task(replay())
+    while not change_broker._subscribers.get(inventory.id):
+        await asyncio.sleep(0.01)
+    change_broker.close(inventory.id)
+    [(seq, event, data)] = await task
+    assert (seq, event) == (since + 2, "item.created")
+    assert data["item"]["name"] == "Item 1"
+
+
+async def test_change_feed_unknown_inventory(anonymous):
+    response = await anonymous.get("/api/v1/items/missing/changes")
+    assert response.status_code == 404
@@ -0,0 +1,45 @@
+from ..crud import create_items, update_item_fields
+from .helpers import new_items
+
+
+async def test_listing_not_modified(client, anonymous, inventory):
+    [item_id] = await create_items(new_items(inventory.id))
+    url = f"/api/v1/items/{inventory.id}/paginated"
+
+    response = await client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not response.content
+    response = await client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    # the validators depend on the query and on who is asking
+    response = await client.get(
+        url, params={"limit": 1}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    response = await anonymous.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "internal_note" not in response.json()["data"][0]
+
+    await update_item_fields(item_id, {"name": "Renamed"})
+    response = await client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["data"][0]["name"] == "Renamed"
+
+
+async def test_export_not_modified(client, inventory):
+    await create_items(new_items(inventory.id, 2))
+    url = f"/api/v1/items/{inventory.id}/export"
+    response = await client.get(url)
+    assert response.status_code == 200
+    response = await client.get(
+        url, headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert response.status_code == 304
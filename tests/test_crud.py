@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+
+import lnbits.db
+from lnbits.db import POSTGRES, SQLITE
+
+from ..crud import (
+    bind_placeholder,
+    bulk_update_items,
+    create_inventory,
+    create_items,
+    get_item,
+    get_user_item,
+    update_item_fields,
+)
+from ..models import CreateInventory, Item, ItemsSelection
+from .helpers import new_items, utc
+
+
+def test_bind_placeholder(monkeypatch):
+    monkeypatch.setattr(lnbits.db, "DB_TYPE", POSTGRES)
+    assert bind_placeholder(Item, "updated_at") == "to_timestamp(:updated_at)"
+    assert bind_placeholder(Item, "created_at", "created_at_3") == (
+        "to_timestamp(:created_at_3)"
+    )
+    assert bind_placeholder(Item, "name", "name_3") == ":name_3"
+    monkeypatch.setattr(lnbits.db, "DB_TYPE", SQLITE)
+    assert bind_placeholder(Item, "updated_at") == ":updated_at"
+
+
+async def test_timestamps_round_trip(inventory):
+    start = datetime.now(timezone.utc) - timedelta(seconds=1)
+    [item_id] = await create_items(new_items(inventory.id))
+    item = await get_item(item_id)
+    assert item and utc(item.created_at) >= start
+
+    updated = await update_item_fields(item_id, {"name": "Renamed"})
+    assert updated
+    item = await get_item(item_id)
+    assert item and item.name == "Renamed"
+    assert utc(item.updated_at) == utc(updated.updated_at)
+
+    assert await bulk_update_items(
+        inventory.id, ItemsSelection(ids=[item_id]), {"price": 12}
+    )
+    bulk = await get_item(item_id)
+    assert bulk and bulk.price == 12
+    assert utc(bulk.updated_at) >= utc(item.updated_at)
+
+
+async def test_get_user_item(user_id, inventory):
+    [item_id] = await create_items(new_items(inventory.id, tags="a"))
+    found = await get_user_item(user_id, item_id)
+    assert found
+    item, item_inventory = found
+    assert item == await get_item(item_id)
+    assert item_inventory.id == inventory.id and item_inventory.user_id == user_id
+
+    other = await create_inventory("other", CreateInventory(name="x", currency="sat"))
+    assert await get_user_item("other", item_id) is None
+    assert await get_user_item(other.user_id, "missing") is None
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from lnbits.helpers import urlsafe_short_hash
+
+from ..crud import (
+    check_idempotency,
+    claim_idempotency_key,
+    idempotency_cache,
+    prune_idempotency_keys,
+    transaction,
+)
+
+
+async def test_claim_once():
+    key = urlsafe_short_hash()
+    assert not await check_idempotency(key)
+    assert await claim_idempotency_key(key)
+    assert not await claim_idempotency_key(key)
+    # the database answers once the cache forgot the key
+    idempotency_cache.clear()
+    assert not await claim_idempotency_key(key)
+    idempotency_cache.clear()
+    assert await check_idempotency(key)
+
+
+async def test_rolled_back_claim_is_released():
+    key = urlsafe_short_hash()
+    with pytest.raises(RuntimeError):
+        async with transaction() as conn:
+            assert await claim_idempotency_key(key, conn=conn)
+            raise RuntimeError("payment failed")
+    assert not await check_idempotency(key)
+    assert await claim_idempotency_key(key)
+
+
+async def test_prune_idempotency_keys():
+    keys = [urlsafe_short_hash() for _ in range(5)]
+    for key in keys:
+        assert await claim_idempotency_key(key)
+    future = datetime.now(timezone.utc) + timedelta(minutes=1)
+    assert await prune_idempotency_keys(future, batch_size=2) >= 5
+    idempotency_cache.clear()
+    for key in keys:
+        assert not await check_idempotency(key)
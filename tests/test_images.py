@@ -0,0 +1,78 @@
+import base64
+
+from ..crud import (
+    create_items,
+    get_item,
+    get_item_images,
+    set_item_images,
+    update_item_fields,
+)
+from ..helpers import ITEM_IMAGE_URL
+from .helpers import new_items
+
+PNG = b"\x89PNG\r\n\x1a\nimage"
+INLINE = f"data:image/png;base64,{base64.b64encode(PNG).decode()}"
+
+
+async def test_gallery_images(anonymous, inventory):
+    [item_id] = await create_items(new_items(inventory.id))
+    gallery = [INLINE, "https://example.com/b.png", f"/api/v1/items/{item_id}/images/2"]
+    await set_item_images(item_id, gallery)
+
+    item = await get_item(item_id)
+    assert item and item.images == f"/inventory/api/v1/items/{item_id}/images/0"
+    response = await anonymous.get(f"/api/v1/items/{item_id}/images")
+    assert response.json() == gallery
+
+    response = await anonymous.get(f"/api/v1/items/{item_id}/images/0")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content == PNG
+    assert "no-cache" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+    response = await anonymous.get(
+        f"/api/v1/items/{item_id}/images/0", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 304
+
+    # the url is not versioned, a replaced image gets a new etag
+    other = f"data:image/png;base64,{base64.b64encode(PNG + b'2').decode()}"
+    await set_item_images(item_id, [other, *gallery[1:]])
+    response = await anonymous.get(
+        f"/api/v1/items/{item_id}/images/0", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 200
+    assert response.content == PNG + b"2"
+
+    # only inline images are served, nothing is redirected to
+    for position in (1, 2, 3):
+        response = await anonymous.get(f"/api/v1/items/{item_id}/images/{position}")
+        assert response.status_code == 404
+
+
+async def test_item_updates_replace_or_keep_the_gallery(client, inventory):
+    [item_id] = await create_items(new_items(inventory.id))
+    gallery = ["https://example.com/a.png", "https://example.com/b.png", INLINE]
+    await set_item_images(item_id, gallery)
+    body = {"inventory_id": inventory.id, "name": "Renamed", "price": 10}
+
+    # leaving images out (or sending the primary image back) keeps the gallery
+    response = await client.put(f"/api/v1/items/{item_id}", json=body)
+    assert response.status_code == 200
+    assert await get_item_images(item_id) == gallery
+
+    await set_item_images(item_id, [INLINE, *gallery[:2]])
+    await update_item_fields(
+        item_id, {"images": ITEM_IMAGE_URL.format(item_id=item_id, position=0)}
+    )
+    assert await get_item_images(item_id) == [INLINE, *gallery[:2]]
+
+    # sending only the first image cuts the gallery down to it
+    await set_item_images(item_id, gallery)
+    response = await client.put(
+        f"/api/v1/items/{item_id}", json={**body, "images": gallery[0]}
+    )
+    assert response.status_code == 200
+    assert await get_item_images(item_id) == gallery[:1]
+    item = await get_item(item_id)
+    assert item and (item.name, item.images) == ("Renamed", gallery[0])
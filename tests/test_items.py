@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+import zlib
+
+import pytest
+from lnbits.db import Filters
+
+from .. import crud
+from ..crud import (
+    create_items,
+    get_inventory_items_paginated,
+    get_inventory_stats,
+    get_item,
+    iter_inventory_items,
+    update_item_fields,
+)
+from ..models import CreateItem
+from .helpers import new_items
+
+
+async def count_items(inventory_id: str) -> int:
+    page = await get_inventory_items_paginated(inventory_id, Filters())
+    return page.total
+
+
+async def test_import_items(client, inventory):
+    items = [
+        {"name": f"Item {i}", "price": i, "tags": ["a", "b"], "images": ["x.png"]}
+        for i in range(300)
+    ]
+    response = await client.post(
+        f"/api/v1/items/{inventory.id}/import", json={"items": items}
+    )
+    assert response.status_code == 201
+    result = response.json()
+    assert result["created"] == 300
+    assert len(set(result["ids"])) == 300
+    assert await count_items(inventory.id) == 300
+
+
+async def test_import_items_rolls_back(monkeypatch, inventory):
+    async def fail(*_):
+        raise RuntimeError("index failed")
+
+    monkeypatch.setattr(crud, "_index_items", fail)
+    with pytest.raises(RuntimeError):
+        await create_items(new_items(inventory.id, 50))
+    assert await count_items(inventory.id) == 0
+
+
+async def test_iter_inventory_items(inventory):
+    ids = await create_items(new_items(inventory.id, 20))
+    chunks = [chunk async for chunk in iter_inventory_items(inventory.id, chunk_size=7)]
+    assert [len(chunk) for chunk in chunks] == [7, 7, 6]
+    assert [item.id for chunk in chunks for item in chunk] == sorted(ids)
+
+    rows = [
+        row
+        async for chunk in iter_inventory_items(
+            inventory.id, chunk_size=10, columns=["id", "name"]
+        )
+        for row in chunk
+    ]
+    assert len(rows) == 20
+    assert set(rows[0]) == {"id", "name"}
+
+
+async def test_export_items(client, inventory):
+    await create_items(new_items(inventory.id, 3, images="a.png|||b.png"))
+    url = f"/api/v1/items/{inventory.id}/export"
+
+    response = await client.get(url, params={"format": "ndjson"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 3
+    assert lines[0]["images"] == ["a.png", "b.png"]
+
+    response = await client.get(url, params={"format": "csv", "fields": "id,name"})
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 3
+    assert set(rows[0]) == {"id", "name"}
+
+    response = await client.get(url, params={"gzip": "true"})
+    assert response.headers["content-type"] == "application/gzip"
+    content = json.loads(zlib.decompress(response.content, wbits=31))
+    assert len(content["items"]) == 3
+
+
+async def test_filter_items_by_tags(client, inventory):
+    ids = await create_items(
+        [
+            CreateItem(inventory_id=inventory.id, name=name, price=1, tags=tags)
+            for name, tags in [
+                ("a", "food"),
+                ("b", "seafood"),
+                ("c", "food, drinks"),
+                ("d", "drinks"),
+            ]
+        ]
+    )
+    url = f"/api/v1/items/{inventory.id}/paginated"
+
+    async def names(**params) -> set[str]:
+        response = await client.get(url, params=params)
+        assert response.status_code == 200
+        return {item["name"] for item in response.json()["data"]}
+
+    assert await names(tag="food") == {"a", "c"}
+    assert await names(tag=["food", "drinks"]) == {"a", "c", "d"}
+    assert await names(tag=["food", "drinks"], tag_match="all") == {"c"}
+    response = await client.get(url, params={"tag": "food", "tag_match": "some"})
+    assert response.status_code == 400
+
+    await update_item_fields(ids[3], {"tags": "food"})
+    assert await names(tag="food") == {"a", "c", "d"}
+    assert await names(tag="drinks") == {"c"}
+
+
+async def test_patch_item_writes_only_sent_fields(client, anonymous, inventory):
+    [item_id] = await create_items(
+        new_items(inventory.id, quantity_in_stock=5, description="Long text")
+    )
+    item = await get_item(item_id)
+    assert item
+    version = (await get_inventory_stats(inventory.id)).version
+
+    response = await client.patch(
+        f"/api/v1/items/{item_id}", json={"quantity_in_stock": 3}
+    )
+    assert response.status_code == 200
+    patched = await get_item(item_id)
+    assert patched and patched.quantity_in_stock == 3
+    assert patched.dict(exclude={"quantity_in_stock", "updated_at"}) == item.dict(
+        exclude={"quantity_in_stock", "updated_at"}
+    )
+    version_after = (await get_inventory_stats(inventory.id)).version
+    assert version_after > version
+
+    # values equal to the stored ones write nothing
+    response = await client.patch(
+        f"/api/v1/items/{item_id}", json={"quantity_in_stock": 3, "name": item.name}
+    )
+    assert response.status_code == 200
+    assert (await get_inventory_stats(inventory.id)).version == version_after
+    assert await get_item(item_id) == patched
+
+    response = await client.patch(
+        f"/api/v1/items/{item_id}", json={"quantity_in_stock": "many"}
+    )
+    assert response.status_code == 400
+    response = await anonymous.patch(f"/api/v1/items/{item_id}", json={"price": 2})
+    assert response.status_code == 401
+    response = await client.patch("/api/v1/items/missing", json={"price": 2})
+    assert response.status_code == 404
+
+
+async def test_update_item_fields_rejects_unknown_fields(inventory):
+    [item_id] = await create_items(new_items(inventory.id))
+    with pytest.raises(ValueError, match="id"):
+        await update_item_fields(item_id, {"id": "other"})
+    assert await update_item_fields("missing", {"name": "x"}) is None
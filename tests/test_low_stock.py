@@ -0,0 +1,57 @@
+from ..broker import ChangeBroker, change_broker
+from ..crud import create_items, decrement_items_quantities
+from .helpers import new_items
+
+
+def test_private_changes_reach_private_subscribers_only():
+    broker = ChangeBroker()
+    public, _ = broker.subscribe("inv")
+    owner, _ = broker.subscribe("inv", private=True)
+    broker.publish("inv", "item.updated", item_id="a")
+    broker.publish("inv", "item.low_stock", private=True, item_id="a")
+
+    assert [public.queue.get_nowait().type] == ["item.updated"]
+    assert public.queue.empty()
+    assert owner.queue.qsize() == 2
+
+    _, replay = broker.subscribe("inv", after_seq=0)
+    assert [change.type for change in replay] == ["item.updated"]
+    _, replay = broker.subscribe("inv", after_seq=0, private=True)
+    assert [change.type for change in replay] == ["item.updated", "item.low_stock"]
+
+
+async def test_threshold_crossing_is_published_to_the_owner(inventory):
+    ids = await create_items(
+        new_items(inventory.id, 2, quantity_in_stock=5, reorder_threshold=2)
+    )
+    public, _ = change_broker.subscribe(inventory.id)
+    owner, _ = change_broker.subscribe(inventory.id, private=True)
+    try:
+        # the first line crosses the threshold, the second stays above it
+        await decrement_items_quantities(
+            inventory.id, [(ids[0], 3), (ids[1], 1)], "test"
+        )
+        changes = [owner.queue.get_nowait() for _ in range(owner.queue.qsize())]
+        low_stock = [c for c in changes if c.type == "item.low_stock"]
+        assert [(c.item_id, c.quantity_in_stock) for c in low_stock] == [(ids[0], 2)]
+        while not public.queue.empty():
+            assert public.queue.get_nowait().type != "item.low_stock"
+
+        # already below the threshold, no new crossing
+        await decrement_items_quantities(inventory.id, [(ids[0], 1)], "test")
+        while not owner.queue.empty():
+            assert owner.queue.get_nowait().type != "item.low_stock"
+    finally:
+        change_broker.unsubscribe(public)
+        change_broker.unsubscribe(owner)
+
+
+async def test_low_stock_report(client, inventory):
+    ids = await create_items(
+        new_items(inventory.id, 3, quantity_in_stock=5, reorder_threshold=2)
+    )
+    await decrement_items_quantities(inventory.id, [(ids[1], 4)], "test")
+
+    response = await client.get(f"/api/v1/items/{inventory.id}/low-stock")
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [ids[1]]
@@ -0,0 +1,69 @@
+import pytest
+
+from ..crud import (
+    create_inventory,
+    create_items,
+    create_manager,
+    get_item,
+    get_items_by_ids,
+    get_manager_item,
+    get_manager_items,
+    get_manager_items_paginated,
+    manager_can_access_item,
+)
+from ..models import CreateInventory, CreateItem, CreateManager
+
+
+@pytest.mark.parametrize(
+    "tags, expected",
+    [
+        (None, {"food", "seafood", "food,drinks", "untagged"}),
+        ("food", {"food", "food,drinks"}),
+        ("drinks, seafood", {"seafood", "food,drinks"}),
+        ("", set()),
+    ],
+)
+async def test_manager_items_match_access_rule(inventory, tags, expected):
+    data = [
+        CreateItem(inventory_id=inventory.id, name=name, price=1, tags=item_tags)
+        for name, item_tags in [
+            ("food", "food"),
+            ("seafood", "seafood"),
+            ("food,drinks", "food, drinks"),
+            ("untagged", None),
+        ]
+    ]
+    items = await get_items_by_ids(inventory.id, await create_items(data))
+    manager = await create_manager(
+        CreateManager(inventory_id=inventory.id, name="Manager", tags=tags)
+    )
+
+    names = {item.name for item in await get_manager_items(inventory.id, manager)}
+    assert names == expected
+    page = await get_manager_items_paginated(inventory.id, manager)
+    assert {item.name for item in page.data} == expected
+    assert page.total == len(expected)
+    assert {
+        item.name for item in items if manager_can_access_item(manager, item)
+    } == expected
+
+
+async def test_get_manager_item(user_id, inventory):
+    [item_id] = await create_items(
+        [CreateItem(inventory_id=inventory.id, name="food", price=1, tags="food")]
+    )
+    manager = await create_manager(
+        CreateManager(inventory_id=inventory.id, name="Manager", tags="food")
+    )
+    found = await get_manager_item(manager.id, item_id)
+    assert found
+    item, item_manager, item_inventory = found
+    assert item == await get_item(item_id)
+    timestamps = {"created_at", "updated_at"}
+    assert item_manager.dict(exclude=timestamps) == manager.dict(exclude=timestamps)
+    assert item_inventory.id == inventory.id
+
+    # a manager of another inventory gets nothing
+    other = await create_inventory(user_id, CreateInventory(name="x", currency="sat"))
+    stranger = await create_manager(CreateManager(inventory_id=other.id, name="M"))
+    assert await get_manager_item(stranger.id, item_id) is None
@@ -0,0 +1,57 @@
+from lnbits.db import SQLITE
+
+from .. import migrations
+from ..crud import create_items, db, get_item, get_item_images
+from .helpers import new_items
+
+
+async def index_names() -> set[str]:
+    if db.type == SQLITE:
+        query = "SELECT name FROM inventory.sqlite_master WHERE type = 'index'"
+    else:
+        query = (
+            "SELECT indexname AS name FROM pg_indexes " "WHERE schemaname = 'inventory'"
+        )
+    rows: list[dict] = await db.fetchall(query)
+    return {row["name"] for row in rows}
+
+
+async def test_lookup_indexes():
+    names = await index_names()
+    assert {
+        "items_inventory_created_idx",
+        "items_inventory_name_idx",
+        "items_inventory_price_idx",
+        "items_inventory_quantity_idx",
+        "items_inventory_manager_idx",
+        "managers_inventory_idx",
+        "audit_logs_inventory_created_idx",
+        "audit_logs_inventory_item_idx",
+        "audit_logs_idempotency_key_idx",
+        "inventories_user_idx",
+    } <= names
+    # tag filters are substring matches, an index on tags is never used
+    assert "items_inventory_tags_idx" not in names
+
+
+async def test_item_images_backfill_can_rerun(inventory):
+    [item_id] = await create_items(new_items(inventory.id))
+    gallery = ["https://example.com/a.png", "https://example.com/b.png"]
+    # a run that failed after copying the first image of the gallery
+    await db.execute(
+        "UPDATE inventory.items SET images = :images WHERE id = :id",
+        {"id": item_id, "images": ",".join(gallery)},
+    )
+    await db.execute(
+        """
+        INSERT INTO inventory.item_images (item_id, inventory_id, position, image)
+        VALUES (:item_id, :inventory_id, 0, :image)
+        """,
+        {"item_id": item_id, "inventory_id": inventory.id, "image": gallery[0]},
+    )
+
+    for _ in range(2):
+        await migrations.m012_add_item_images(db)
+        assert await get_item_images(item_id) == gallery
+        item = await get_item(item_id)
+        assert item and item.images == gallery[0]
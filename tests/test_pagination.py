@@ -0,0 +1,121 @@
+import pytest
+from lnbits.helpers import urlsafe_short_hash
+
+from ..crud import create_inventory_update_logs, create_items
+from ..models import CreateInventoryUpdateLog, CreateItem, PublicItem
+from .helpers import new_items
+
+
+async def walk(client, url: str, **params) -> list[dict]:
+    """Follow `next_cursor` to the end, returning every row seen."""
+    rows: list[dict] = []
+    cursor = None
+    while True:
+        response = await client.get(
+            url, params={**params, "pagination": "cursor", "limit": 3, "cursor": cursor}
+        )
+        assert response.status_code == 200
+        page = response.json()
+        rows += page["data"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return rows
+        assert len(page["data"]) == 3
+
+
+@pytest.mark.parametrize(
+    "sortby, direction",
+    [
+        ("created_at", "asc"),
+        ("created_at", "desc"),
+        ("price", "asc"),
+        ("price", "desc"),
+        ("quantity_in_stock", "asc"),
+        ("name", "desc"),
+    ],
+)
+async def test_items_cursor_round_trip(client, anonymous, inventory, sortby, direction):
+    # repeated prices and missing quantities make the id tie-breaker matter
+    await create_items(
+        [
+            CreateItem(
+                inventory_id=inventory.id,
+                name=f"Item {i}",
+                price=i % 3,
+                quantity_in_stock=None if i % 4 == 0 else i,
+            )
+            for i in range(10)
+        ]
+    )
+    url = f"/api/v1/items/{inventory.id}/paginated"
+    for user in (client, anonymous):
+        rows = await walk(user, url, sortby=sortby, direction=direction)
+        assert len(rows) == 10
+        assert len({row["id"] for row in rows}) == 10
+
+    if sortby != "created_at":
+        # missing quantities sort as -1
+        values = [row[sortby] for row in rows]
+        expected = sorted(
+            values,
+            key=lambda value: -1 if value is None else value,
+            reverse=direction == "desc",
+        )
+        assert values == expected
+
+
+async def test_cursor_must_match_sorting(client, inventory):
+    await create_items(
+        [CreateItem(inventory_id=inventory.id, name=str(i), price=i) for i in range(5)]
+    )
+    url = f"/api/v1/items/{inventory.id}/paginated"
+    response = await client.get(
+        url, params={"pagination": "cursor", "limit": 2, "sortby": "price"}
+    )
+    cursor = response.json()["next_cursor"]
+    response = await client.get(url, params={"cursor": cursor, "sortby": "name"})
+    assert response.status_code == 400
+
+
+async def test_logs_cursor_round_trip(client, inventory):
+    await create_inventory_update_logs(
+        [
+            CreateInventoryUpdateLog(
+                inventory_id=inventory.id,
+                item_id=f"item-{i % 2}",
+                quantity_change=-1,
+                quantity_before=i + 1,
+                quantity_after=i,
+                idempotency_key=urlsafe_short_hash(),
+            )
+            for i in range(8)
+        ]
+    )
+    url = f"/api/v1/logs/{inventory.id}/paginated"
+    for sortby in ("created_at", "item_id"):
+        rows = await walk(client, url, sortby=sortby, direction="desc")
+        assert len({row["id"] for row in rows}) == 8
+    response = await client.get(
+        url, params={"pagination": "cursor", "include_total": "true"}
+    )
+    assert response.json()["total"] == 8
+
+
+@pytest.mark.parametrize("pagination", ["offset", "cursor"])
+async def test_projected_listing(client, anonymous, inventory, pagination):
+    await create_items(new_items(inventory.id, 2, unit_cost=3, is_active=False))
+    url = f"/api/v1/items/{inventory.id}/paginated"
+    params = {"pagination": pagination}
+
+    response = await client.get(url, params={**params, "fields": "name,is_active"})
+    assert response.status_code == 200
+    rows = response.json()["data"]
+    assert [set(row) for row in rows] == [{"id", "name", "is_active"}] * 2
+    assert {row["is_active"] for row in rows} == {False}
+
+    # public listings hold only the public columns
+    response = await anonymous.get(url, params=params)
+    assert response.status_code == 200
+    assert set(response.json()["data"][0]) == set(PublicItem.__fields__)
+    response = await anonymous.get(url, params={**params, "fields": "unit_cost"})
+    assert response.status_code == 400
@@ -0,0 +1,64 @@
+from .. import crud
+from ..crud import create_items
+from ..models import CreateItem
+
+
+async def search(client, inventory_id: str, **params) -> dict:
+    response = await client.get(
+        f"/api/v1/items/{inventory_id}/paginated", params=params
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_search_ranks_names_first(client, inventory):
+    await create_items(
+        [
+            CreateItem(
+                inventory_id=inventory.id,
+                name=f"Plain {i}",
+                description="a red cotton shirt",
+                price=1,
+            )
+            for i in range(4)
+        ]
+        + [
+            CreateItem(inventory_id=inventory.id, name="Red Shirt", price=1),
+            CreateItem(inventory_id=inventory.id, name="Blue Shirt", price=2),
+        ]
+    )
+    page = await search(client, inventory.id, q="red shi")
+    assert page["total"] == 5
+    assert page["data"][0]["name"] == "Red Shirt"
+
+    page = await search(client, inventory.id, q="shirt", limit=2, offset=4)
+    assert page["total"] == 6
+    assert len(page["data"]) == 2
+    page = await search(client, inventory.id, q="shirt", sortby="price")
+    assert page["data"][-1]["name"] == "Blue Shirt"
+    page = await search(client, inventory.id, q="nothing")
+    assert page == {"data": [], "total": 0}
+
+
+async def test_capped_search_keeps_best_matches(monkeypatch, client, inventory):
+    monkeypatch.setattr(crud, "SEARCH_MAX_RESULTS", 3)
+    # the best match is created last, so it is not first in index order
+    await create_items(
+        [
+            CreateItem(
+                inventory_id=inventory.id,
+                name=f"Lamp {i}",
+                description="a lamp for the desk",
+                price=1,
+            )
+            for i in range(5)
+        ]
+        + [CreateItem(inventory_id=inventory.id, name="Desk", price=1)]
+    )
+    page = await search(client, inventory.id, q="desk")
+    assert page["total"] is None
+    assert len(page["data"]) == 3
+    assert page["data"][0]["name"] == "Desk"
+    page = await search(client, inventory.id, q="desk", limit=2)
+    assert page["total"] is None
+    assert page["data"][0]["name"] == "Desk"
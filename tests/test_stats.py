@@ -0,0 +1,116 @@
+from .. import tasks
+from ..crud import (
+    create_inventory,
+    create_items,
+    db,
+    decrement_items_quantities,
+    delete_item,
+    get_drifted_inventories,
+    get_inventory_stats,
+    get_inventory_valuation,
+    recompute_inventory_stats,
+    update_item_fields,
+)
+from ..models import CreateInventory, CreateItem, InventoryStats
+from .helpers import new_items
+
+
+async def counters(inventory_id: str) -> dict:
+    stats = await get_inventory_stats(inventory_id)
+    assert stats
+    return stats.dict(include={*InventoryStats.__fields__} - {"version", "updated_at"})
+
+
+async def test_counters_follow_writes(inventory):
+    ids = await create_items(
+        [
+            CreateItem(
+                inventory_id=inventory.id,
+                name=str(i),
+                price=1,
+                quantity_in_stock=5,
+                is_active=i % 2 == 0,
+                is_approved=i < 3,
+            )
+            for i in range(6)
+        ]
+    )
+    assert await counters(inventory.id) == {
+        "inventory_id": inventory.id,
+        "items_total": 6,
+        "items_active": 3,
+        "items_approved": 3,
+        "logs_total": 0,
+    }
+    version = (await get_inventory_stats(inventory.id)).version
+
+    await update_item_fields(ids[1], {"is_active": True, "is_approved": True})
+    await delete_item(ids[0])
+    await decrement_items_quantities(inventory.id, [(ids[2], 1), (ids[3], 2)], "test")
+    expected = {
+        "inventory_id": inventory.id,
+        "items_total": 5,
+        "items_active": 3,
+        "items_approved": 2,
+        "logs_total": 2,
+    }
+    assert await counters(inventory.id) == expected
+    assert (await get_inventory_stats(inventory.id)).version > version
+
+    await recompute_inventory_stats(inventory.id)
+    assert await counters(inventory.id) == expected
+
+
+async def test_listing_total_from_counters(client, inventory):
+    await create_items(
+        [
+            CreateItem(inventory_id=inventory.id, name=str(i), price=1, is_active=i < 2)
+            for i in range(5)
+        ]
+    )
+    url = f"/api/v1/items/{inventory.id}/paginated"
+    response = await client.get(url, params={"limit": 1})
+    assert response.json()["total"] == 5
+    response = await client.get(url, params={"limit": 1, "is_active": "true"})
+    assert response.json()["total"] == 2
+    response = await client.get(url, params={"limit": 1, "is_active": "false"})
+    assert response.json()["total"] == 3
+
+
+async def test_only_drifted_counters_are_recomputed(monkeypatch, user_id, inventory):
+    drifting = await create_inventory(
+        user_id, CreateInventory(name="Drifting", currency="sat")
+    )
+    for inventory_id in (inventory.id, drifting.id):
+        await create_items(new_items(inventory_id, 3, quantity_in_stock=2))
+    await db.execute(
+        "UPDATE inventory.inventory_stats SET items_total = 7 "
+        "WHERE inventory_id = :inventory_id",
+        {"inventory_id": drifting.id},
+    )
+    await db.execute(
+        "UPDATE inventory.item_valuation SET units = units + 1 "
+        "WHERE inventory_id = :inventory_id",
+        {"inventory_id": drifting.id},
+    )
+    recomputed = []
+
+    async def recompute_inventory_stats(inventory_id=None):
+        recomputed.append(inventory_id)
+        await recompute_now(inventory_id)
+
+    recompute_now = tasks.recompute_inventory_stats
+    monkeypatch.setattr(tasks, "recompute_inventory_stats", recompute_inventory_stats)
+    # the inventories are checked a batch at a time, then from the start again
+    monkeypatch.setattr(tasks, "STATS_CHECK_BATCH_SIZE", 1)
+    after_id = await tasks.repair_inventory_stats("")
+    while after_id:
+        after_id = await tasks.repair_inventory_stats(after_id)
+
+    assert drifting.id in recomputed
+    assert inventory.id not in recomputed
+    assert (await counters(drifting.id))["items_total"] == 3
+    valuation = await get_inventory_valuation(drifting)
+    assert valuation and valuation.totals.units == 6
+    drifted, _ = await get_drifted_inventories("", 10_000)
+    assert drifting.id not in drifted
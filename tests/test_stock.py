@@ -0,0 +1,96 @@
+import pytest
+
+from ..crud import bulk_update_items, create_items, get_items_by_ids
+from ..models import ItemsSelection
+from .helpers import new_items
+
+
+async def test_stock_update_results(client, inventory):
+    tracked, other = await create_items(new_items(inventory.id, 2, quantity_in_stock=5))
+    [untracked] = await create_items(new_items(inventory.id))
+
+    response = await client.patch(
+        f"/api/v2/items/{inventory.id}/quantities",
+        json={
+            "lines": [
+                {"id": tracked, "op": "add", "quantity": 3},
+                {"id": tracked, "op": "subtract", "quantity": 10},
+                {"id": tracked, "op": "set", "quantity": 4},
+                {"id": other, "op": "set", "quantity": 5},
+                {"id": untracked, "op": "add", "quantity": 1},
+                {"id": "missing", "quantity": 1},
+            ],
+            "source": "pos",
+        },
+    )
+    assert response.status_code == 200
+    results = [
+        (r["id"], r["status"], r["quantity_before"], r["quantity_after"])
+        for r in response.json()
+    ]
+    # lines for the same item apply in order, stock never goes below zero
+    assert results == [
+        (tracked, "updated", 5, 8),
+        (tracked, "updated", 8, 0),
+        (tracked, "updated", 0, 4),
+        (other, "unchanged", 5, 5),
+        (untracked, "untracked", None, None),
+        ("missing", "not_found", None, None),
+    ]
+    items = {
+        item.id: item for item in await get_items_by_ids(inventory.id, [tracked, other])
+    }
+    assert items[tracked].quantity_in_stock == 4
+    assert items[other].quantity_in_stock == 5
+
+    logs = await client.get(f"/api/v1/logs/{inventory.id}/paginated")
+    assert logs.status_code == 200
+    changes = [log["quantity_change"] for log in logs.json()["data"]]
+    assert sorted(changes) == [-8, 3, 4]
+
+
+async def test_bulk_update_counts_changed_items(client, inventory):
+    ids = await create_items(new_items(inventory.id, 3))
+    await client.patch(
+        f"/api/v1/items/{inventory.id}/bulk",
+        json={"ids": ids[:1], "fields": {"is_active": False}},
+    )
+
+    response = await client.patch(
+        f"/api/v1/items/{inventory.id}/bulk",
+        json={"ids": ids, "fields": {"is_active": False}},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"updated": 2}
+
+    response = await client.patch(
+        f"/api/v1/items/{inventory.id}/bulk",
+        json={"ids": ids, "price_change_percentage": 12.345},
+    )
+    assert response.json() == {"updated": 3}
+    prices = [item.price for item in await get_items_by_ids(inventory.id, ids)]
+    # prices are single precision on postgres
+    assert prices == pytest.approx([11.23] * 3)
+
+    response = await client.patch(
+        f"/api/v1/items/{inventory.id}/bulk", json={"ids": ids}
+    )
+    assert response.status_code == 400
+    response = await client.patch(
+        f"/api/v1/items/{inventory.id}/bulk", json={"fields": {"is_active": True}}
+    )
+    assert response.status_code == 400
+
+
+async def test_bulk_update_rejects_price_with_price_change(client, inventory):
+    ids = await create_items(new_items(inventory.id, 2))
+    response = await client.patch(
+        f"/api/v1/items/{inventory.id}/bulk",
+        json={"ids": ids, "fields": {"price": 20}, "price_change_percentage": 10},
+    )
+    assert response.status_code == 400
+    assert {item.price for item in await get_items_by_ids(inventory.id, ids)} == {10}
+    with pytest.raises(ValueError, match="not both"):
+        await bulk_update_items(
+            inventory.id, ItemsSelection(ids=ids), {"price": 20}, 10
+        )
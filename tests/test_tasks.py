@@ -0,0 +1,311 @@
+import asyncio
+import gzip
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from lnbits.core.models import Payment
+from lnbits.helpers import urlsafe_short_hash
+
+from .. import tasks
+from ..crud import (
+    audit_log_buffer,
+    buffer_inventory_update_logs,
+    create_inventory,
+    create_inventory_update_logs,
+    create_items,
+    db,
+    delete_inventory,
+    delete_orphaned_update_logs,
+    flush_inventory_update_logs,
+    get_audit_log_daily,
+    get_audit_logs_before,
+    get_inventory_stats,
+    get_item,
+    rollup_audit_logs,
+    update_inventory,
+)
+from ..models import CreateInventory, CreateInventoryUpdateLog
+from ..tasks import (
+    archive_expired_audit_logs,
+    on_invoices_paid,
+    write_buffered_audit_logs,
+)
+from .helpers import new_items
+
+
+@pytest.fixture
+def wallets(monkeypatch) -> dict[str, str]:
+    """Owners of the wallets invoices are paid to, by wallet id."""
+    owners: dict[str, str] = {}
+
+    async def get_wallet(wallet_id: str):
+        owner = owners.get(wallet_id)
+        return SimpleNamespace(id=wallet_id, user=owner) if owner else None
+
+    monkeypatch.setattr(tasks, "get_wallet", get_wallet)
+    return owners
+
+
+def paid_invoice(extra: dict, wallet_id: str = "wallet") -> Payment:
+    payment_hash = urlsafe_short_hash()
+    return Payment(
+        checking_id=payment_hash,
+        payment_hash=payment_hash,
+        wallet_id=wallet_id,
+        amount=1000,
+        fee=0,
+        bolt11="lnbc",
+        extra=extra,
+    )
+
+
+async def test_paid_invoices_decrement_stock_once(wallets, user_id, inventory):
+    wallets["wallet"] = user_id
+    item_id, other_id = await create_items(
+        new_items(inventory.id, 2, quantity_in_stock=10)
+    )
+    paid = paid_invoice(
+        {
+            "tag": "inventory",
+            "inventory_id": inventory.id,
+            "items": [{"id": item_id, "quantity": 2}, {"id": item_id, "quantity": 1}],
+            # a hash in the extra does not clash with the payment's own
+            "payment_hash": "ignored",
+        }
+    )
+    invalid = paid_invoice(
+        {"tag": "inventory", "inventory_id": inventory.id, "items": [{"id": 1}]}
+    )
+    foreign = paid_invoice(
+        {
+            "tag": "other",
+            "inventory_id": inventory.id,
+            "items": [{"id": other_id, "quantity": 5}],
+        }
+    )
+
+    await on_invoices_paid([paid, invalid, foreign])
+    item = await get_item(item_id)
+    assert item and item.quantity_in_stock == 7
+    # the logs are left to the background writer
+    assert await flush_inventory_update_logs() == 2
+
+    # a replayed payment is skipped
+    await on_invoices_paid([paid])
+    item = await get_item(item_id)
+    assert item and item.quantity_in_stock == 7
+    other = await get_item(other_id)
+    assert other and other.quantity_in_stock == 10
+
+
+async def test_paid_invoices_to_foreign_wallets_are_ignored(
+    wallets, user_id, inventory
+):
+    [item_id] = await create_items(new_items(inventory.id, quantity_in_stock=10))
+    wallets["own"] = user_id
+    wallets["intruder"] = urlsafe_short_hash()
+    extra = {
+        "tag": "inventory",
+        "inventory_id": inventory.id,
+        "items": [{"id": item_id, "quantity": 4}],
+    }
+
+    # someone paying themselves with this inventory in the extra
+    await on_invoices_paid(
+        [paid_invoice(extra, "intruder"), paid_invoice(extra, "unknown")]
+    )
+    item = await get_item(item_id)
+    assert item and item.quantity_in_stock == 10
+
+    await on_invoices_paid([paid_invoice(extra, "own")])
+    item = await get_item(item_id)
+    assert item and item.quantity_in_stock == 6
+    assert await flush_inventory_update_logs() == 1
+
+
+async def create_logs(inventory_id: str, count: int, age: timedelta) -> None:
+    await create_inventory_update_logs(
+        [
+            CreateInventoryUpdateLog(
+                inventory_id=inventory_id,
+                item_id="item",
+                quantity_change=-1 if i % 2 else 2,
+                quantity_before=10,
+                quantity_after=9,
+                idempotency_key=urlsafe_short_hash(),
+            )
+            for i in range(count)
+        ]
+    )
+    if age:
+        await db.execute(
+            f"""
+            UPDATE inventory.audit_logs
+            SET created_at = {db.timestamp_placeholder("created_at")}
+            WHERE inventory_id = :inventory_id AND created_at >= (
+                {db.timestamp_placeholder("recent")}
+            )
+            """,
+            {
+                "inventory_id": inventory_id,
+                "created_at": datetime.now(timezone.utc) - age,
+                "recent": datetime.now(timezone.utc) - timedelta(minutes=1),
+            },
+        )
+
+
+async def test_audit_log_retention(monkeypatch, tmp_path, client, inventory):
+    monkeypatch.setattr(tasks, "AUDIT_LOG_ARCHIVE_FOLDER", tmp_path)
+    monkeypatch.setattr(tasks, "AUDIT_LOG_BATCH_SIZE", 4)
+    await create_logs(inventory.id, 10, timedelta(days=40))
+    await create_logs(inventory.id, 3, timedelta(0))
+    now = datetime.now(timezone.utc)
+
+    # logs are kept unless the inventory has a retention
+    assert await archive_expired_audit_logs(now) == 0
+    response = await client.put(
+        f"/api/v1/{inventory.id}",
+        json={"name": "Shop", "currency": "sat", "audit_log_retention_days": 30},
+    )
+    assert response.status_code == 200
+
+    assert await archive_expired_audit_logs(now) == 10
+    [daily] = await get_audit_log_daily(inventory.id)
+    assert (daily.changes, daily.quantity_added, daily.quantity_removed) == (
+        10,
+        10,
+        5,
+    )
+    stats = await get_inventory_stats(inventory.id)
+    assert stats and stats.logs_total == 3
+    [archive] = (tmp_path / inventory.id).iterdir()
+    with gzip.open(archive, "rt") as lines:
+        assert len(list(lines)) == 10
+
+
+async def test_audit_logs_kept_when_archive_fails(monkeypatch, tmp_path, inventory):
+    def fail(*_):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tasks, "archive_audit_logs", fail)
+    inventory.audit_log_retention_days = 1
+    await update_inventory(inventory)
+    await create_logs(inventory.id, 3, timedelta(days=2))
+    assert await archive_expired_audit_logs(datetime.now(timezone.utc)) == 0
+    stats = await get_inventory_stats(inventory.id)
+    assert stats and stats.logs_total == 3
+    assert await get_audit_log_daily(inventory.id) == []
+
+
+async def test_rollup_skips_deleted_logs(inventory):
+    await create_logs(inventory.id, 4, timedelta(days=2))
+    logs = await get_audit_logs_before(inventory.id, datetime.now(timezone.utc))
+    await db.execute(
+        "DELETE FROM inventory.audit_logs WHERE id = :id", {"id": logs[0].id}
+    )
+    assert await rollup_audit_logs(logs) == 3
+    [daily] = await get_audit_log_daily(inventory.id)
+    assert daily.changes == 3
+
+
+async def test_orphaned_logs_are_swept(user_id, inventory):
+    deleted = await create_inventory(
+        user_id, CreateInventory(name="Closed", currency="sat")
+    )
+    await create_logs(inventory.id, 2, timedelta(0))
+    await create_logs(deleted.id, 5, timedelta(days=2))
+    logs = await get_audit_logs_before(deleted.id, datetime.now(timezone.utc), 2)
+    await rollup_audit_logs(logs)
+    # the deferred log deletion never ran
+    assert await delete_inventory(user_id, deleted.id, defer_logs=True)
+
+    assert await delete_orphaned_update_logs(batch_size=2) >= 3
+    assert await get_audit_logs_before(deleted.id, datetime.now(timezone.utc)) == []
+    assert await get_audit_log_daily(deleted.id) == []
+    row = await db.fetchone(
+        "SELECT COUNT(*) AS count FROM inventory.audit_logs "
+        "WHERE inventory_id = :inventory_id",
+        {"inventory_id": inventory.id},
+    )
+    assert row["count"] == 2
+    # swept inventories are forgotten
+    row = await db.fetchone(
+        "SELECT COUNT(*) AS count FROM inventory.deleted_inventories "
+        "WHERE inventory_id = :inventory_id",
+        {"inventory_id": deleted.id},
+    )
+    assert row["count"] == 0
+    assert await delete_orphaned_update_logs() == 0
+
+
+def buffered_logs(inventory_id: str, count: int) -> list[CreateInventoryUpdateLog]:
+    return [
+        CreateInventoryUpdateLog(
+            inventory_id=inventory_id,
+            item_id="item",
+            quantity_change=-1,
+            quantity_before=1,
+            quantity_after=0,
+            idempotency_key=urlsafe_short_hash(),
+        )
+        for _ in range(count)
+    ]
+
+
+async def test_stopped_writer_drains_audit_log_buffer(monkeypatch, inventory):
+    monkeypatch.setattr(tasks, "AUDIT_LOG_FLUSH_SIZE", 5)
+    await buffer_inventory_update_logs(buffered_logs(inventory.id, 3))
+    writer = asyncio.create_task(write_buffered_audit_logs())
+    # the writer holds the first logs while waiting for more to arrive
+    await asyncio.sleep(0.05)
+    await buffer_inventory_update_logs(buffered_logs(inventory.id, 20))
+    writer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await writer
+
+    assert audit_log_buffer.empty()
+    stats = await get_inventory_stats(inventory.id)
+    assert stats and stats.logs_total == 23
+
+
+async def test_failed_audit_log_writes_are_retried(monkeypatch, inventory):
+    monkeypatch.setattr(tasks, "AUDIT_LOG_RETRY_SECONDS", 0)
+    logs = buffered_logs(inventory.id, 3)
+    bad = logs[1]
+
+    async def create_inventory_update_logs(logs):
+        raise RuntimeError("database is unavailable")
+
+    async def create_inventory_update_log(log):
+        if log is bad:
+            raise RuntimeError("database is unavailable")
+        await create_inventory_update_logs_now([log])
+
+    create_inventory_update_logs_now = tasks.create_inventory_update_logs
+    monkeypatch.setattr(
+        tasks, "create_inventory_update_logs", create_inventory_update_logs
+    )
+    monkeypatch.setattr(
+        tasks, "create_inventory_update_log", create_inventory_update_log
+    )
+    await tasks._write_audit_logs(logs)
+
+    # the batch is written one by one, the failed log is queued again
+    stats = await get_inventory_stats(inventory.id)
+    assert stats and stats.logs_total == 2
+    assert audit_log_buffer.get_nowait() is bad
+    assert audit_log_buffer.empty()
+
+
+async def test_quantities_endpoint_logs_synchronously(client, inventory):
+    [item_id] = await create_items(new_items(inventory.id, quantity_in_stock=5))
+    response = await client.patch(
+        f"/api/v1/items/{inventory.id}/quantities",
+        params={"ids": [item_id], "quantities": [2]},
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["quantity_in_stock"] == 3
+    assert audit_log_buffer.empty()
+    stats = await get_inventory_stats(inventory.id)
+    assert stats and stats.logs_total == 1
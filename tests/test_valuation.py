@@ -0,0 +1,94 @@
+from ..crud import (
+    apply_stock_updates,
+    bulk_update_items,
+    create_inventory,
+    create_items,
+    decrement_items_quantities,
+    delete_item,
+    get_inventory_valuation,
+    recompute_inventory_stats,
+    update_item_fields,
+)
+from ..models import CreateInventory, CreateItem, ItemsSelection, StockUpdateLine
+from .helpers import new_items
+
+
+async def test_valuation_totals(client, user_id):
+    inventory = await create_inventory(
+        user_id,
+        CreateInventory(
+            name="Shop",
+            currency="sat",
+            global_discount_percentage=50,
+            default_tax_rate=10,
+            is_tax_inclusive=False,
+        ),
+    )
+    await create_items(
+        [
+            CreateItem(
+                inventory_id=inventory.id,
+                name="A",
+                price=10,
+                discount_percentage=20,
+                quantity_in_stock=3,
+                unit_cost=2,
+                tags="a,b",
+            ),
+            CreateItem(
+                inventory_id=inventory.id,
+                name="B",
+                price=5,
+                quantity_in_stock=2,
+                tax_rate=0,
+                tags="b",
+                manager_id="m1",
+            ),
+        ]
+    )
+
+    response = await client.get(f"/api/v1/{inventory.id}/valuation")
+    assert response.status_code == 200
+    valuation = response.json()
+    assert valuation["totals"] == {
+        "items": 2,
+        "units": 5,
+        "stock_value": 6.0,
+        "retail_value": 18.2,
+        "retail_value_net": 17.0,
+        "margin": 6.0,
+        "margin_percentage": 50.0,
+    }
+    assert [(t["tag"], t["items"], t["retail_value"]) for t in valuation["tags"]] == [
+        ("a", 1, 13.2),
+        ("b", 2, 18.2),
+    ]
+    assert [
+        (m["manager_id"], m["units"], m["margin_percentage"])
+        for m in valuation["managers"]
+    ] == [(None, 3, 50.0), ("m1", 2, None)]
+
+
+async def test_valuation_sums_follow_writes(inventory):
+    ids = await create_items(
+        new_items(inventory.id, 4, quantity_in_stock=10, unit_cost=4, tags="x")
+    )
+    await update_item_fields(ids[0], {"price": 12.5, "tags": "x,y"})
+    await update_item_fields(ids[1], {"manager_id": "m1", "tax_rate": 5})
+    await bulk_update_items(
+        inventory.id, ItemsSelection(ids=ids[1:3]), {}, price_change_percentage=10
+    )
+    await apply_stock_updates(
+        inventory.id, [StockUpdateLine(id=ids[0], op="add", quantity=5)], "test"
+    )
+    await decrement_items_quantities(inventory.id, [(ids[2], 3)], "test")
+    await update_item_fields(ids[3], {"tags": "y"})
+    await delete_item(ids[3])
+
+    valuation = await get_inventory_valuation(inventory)
+    await recompute_inventory_stats(inventory.id)
+    recomputed = await get_inventory_valuation(inventory)
+    assert valuation and recomputed
+    assert valuation.totals.items == 3
+    assert [tag.tag for tag in valuation.tags] == ["x", "y"]
+    assert valuation.dict(exclude={"version"}) == recomputed.dict(exclude={"version"})
@@ -1,6 +1,17 @@
+import asyncio
+from datetime import datetime
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
 from lnbits.core.models import User
 from lnbits.db import Filters, Page
 from lnbits.decorators import (
@@ -9,55 +20,87 @@ from lnbits.decorators import (
     parse_filters,
 )
 from lnbits.helpers import generate_filter_params_openapi
-from pydantic import BaseModel
 
+from .broker import change_broker
 from .crud import (
+    apply_stock_updates,
+    bulk_update_items,
     create_inventory,
-    create_inventory_update_log,
     create_item,
+    create_items,
     create_manager,
+    decrement_items_quantities,
     delete_inventory,
-    delete_inventory_items,
-    delete_inventory_managers,
-    delete_inventory_update_logs,
+    delete_inventory_update_logs_in_batches,
     delete_item,
     delete_manager,
+    get_audit_log_daily,
     get_inventories,
     get_inventory,
-    get_inventory_items,
+    get_inventory_items_cursor_page,
     get_inventory_items_paginated,
+    get_inventory_stats,
+    get_inventory_update_logs_cursor_page,
     get_inventory_update_logs_paginated,
+    get_inventory_valuation,
     get_item,
-    get_items_by_ids,
+    get_item_image,
+    get_item_images,
+    get_low_stock_items,
     get_manager,
+    get_manager_item,
     get_manager_items,
+    get_manager_items_paginated,
     get_managers,
     get_public_inventory,
+    get_user_item,
+    iter_inventory_items,
     manager_can_access_item,
+    search_inventory_items,
+    set_item_images,
     update_inventory,
     update_item,
+    update_item_fields,
     update_manager,
 )
 from .helpers import (
-    from_csv,
+    EXPORT_FORMATS,
+    decode_inline_image,
+    dump_json,
+    encode_export,
+    gzip_stream,
+    http_date,
+    is_not_modified,
+    make_etag,
     manager_allows_tags,
-    normalize_images,
     prepare_import_item,
+    projection_columns,
     split_tags,
 )
 from .models import (
+    AuditLogDaily,
+    BulkUpdateItems,
+    BulkUpdateResult,
     CreateInventory,
-    CreateInventoryUpdateLog,
     CreateItem,
     CreateManager,
+    CursorPage,
     ImportItemsPayload,
+    ImportItemsResult,
     Inventory,
     InventoryLogFilters,
+    InventoryValuation,
     Item,
+    ItemChange,
     ItemFilters,
+    ItemsSelection,
     Manager,
     ManagerQuantityUpdate,
     PublicItem,
+    SearchPage,
+    StockUpdatePayload,
+    StockUpdateResult,
+    UpdateItem,
 )
 
 inventory_ext_api = APIRouter()
@@ -65,6 +108,36 @@ items_filters = parse_filters(ItemFilters)
 logs_filters = parse_filters(InventoryLogFilters)
 
 
+def json_response(content: dict, headers: dict[str, str]) -> Response:
+    return Response(dump_json(content), media_type="application/json", headers=headers)
+
+
+async def check_conditional_get(
+    request: Request,
+    inventory_id: str,
+    *variant,
+    changed_at: datetime | None = None,
+) -> tuple[dict[str, str], bool]:
+    """
+    Validators for a listing of the inventory items. They derive from the
+    inventory version, so an unchanged listing is answered without reading items.
+    """
+    stats = await get_inventory_stats(inventory_id)
+    if not stats:
+        return {}, False
+    last_modified = stats.updated_at
+    if changed_at and changed_at > last_modified:
+        last_modified = changed_at
+    query = sorted(request.query_params.multi_items())
+    etag = make_etag(request.url.path, stats.version, changed_at, query, *variant)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": "private, no-cache",
+    }
+    return headers, is_not_modified(request, etag, last_modified)
+
+
 @inventory_ext_api.get("/api/v1", status_code=HTTPStatus.OK)
 async def api_get_inventories(
     user: User = Depends(check_user_exists),
@@ -100,6 +173,8 @@ async def api_update_inventory(
 @inventory_ext_api.delete("/api/v1/{inventory_id}", status_code=HTTPStatus.NO_CONTENT)
 async def api_delete_inventory(
     inventory_id: str,
+    background_tasks: BackgroundTasks,
+    defer_logs: bool = Query(False),
     user: User = Depends(check_user_exists),
 ) -> None:
     inventory = await get_inventory(user.id, inventory_id)
@@ -108,25 +183,33 @@ async def api_delete_inventory(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Cannot delete inventory.",
         )
-    # delete all related data (items, managers, logs) in cascade
-    await delete_inventory_items(inventory_id)
-    await delete_inventory_managers(inventory_id)
-    await delete_inventory_update_logs(inventory_id)
-    # finally delete the inventory
-    await delete_inventory(user.id, inventory_id)
+    # delete all related data (items, managers, logs) in one transaction,
+    # large log tables can be deleted in batches after responding
+    deleted = await delete_inventory(user.id, inventory_id, defer_logs)
+    if deleted and defer_logs:
+        background_tasks.add_task(delete_inventory_update_logs_in_batches, inventory_id)
 
 
 ## ITEMS
 @inventory_ext_api.get(
     "/api/v1/items/{inventory_id}/paginated",
     openapi_extra=generate_filter_params_openapi(ItemFilters),
-    response_model=Page,
+    response_model=None,
 )
 async def api_get_items(
+    request: Request,
+    response: Response,
     inventory_id: str,
+    q: str | None = Query(None, max_length=200),
+    tag: list[str] | None = Query(None),
+    tag_match: str = Query("any", pattern="^(any|all)$"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$"),
+    cursor: str | None = Query(None),
+    include_total: bool = Query(False),
+    fields: str | None = Query(None, description="Comma separated fields to return"),
     user_id: str | None = Depends(optional_user_id),
     filters: Filters = Depends(items_filters),
-) -> Page:
+) -> Page | SearchPage | CursorPage | Response:
     inventory = (
         await get_inventory(user_id, inventory_id)
         if user_id
@@ -138,21 +221,60 @@ async def api_get_items(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Inventory not found.",
         )
-    page = await get_inventory_items_paginated(inventory_id, filters)
+    is_owner = user_id and inventory.dict().get("user_id", None) == user_id
 
-    if user_id and inventory.dict().get("user_id", None) == user_id:
-        return Page(data=page.data, total=page.total)
-    return Page(
-        data=[PublicItem(**item.dict()) for item in page.data], total=page.total
+    headers, not_modified = await check_conditional_get(
+        request, inventory_id, bool(is_owner)
     )
+    if not_modified:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
 
-
-# TODO:
-# Use this model for the bulk quantity update payload
-# on next version bump (needs update on services.py on inventory and webshop extensions)
-class ItemQuantityUpdatePayload(BaseModel):
-    ids: list[str]
-    quantities: list[int]
+    if q and (cursor or pagination == "cursor"):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Search results only support offset pagination.",
+        )
+    # projected and public listings are plain rows, serialized without models
+    columns: list[str] | None
+    if fields:
+        columns = projection_columns(fields, Item if is_owner else PublicItem)
+    else:
+        columns = None if is_owner else list(PublicItem.__fields__)
+
+    if cursor or pagination == "cursor":
+        cursor_page = await get_inventory_items_cursor_page(
+            inventory_id,
+            filters,
+            cursor,
+            include_total,
+            tag,
+            tag_match == "all",
+            columns,
+        )
+        if not columns:
+            return cursor_page
+        content = {
+            "data": cursor_page.data,
+            "total": cursor_page.total,
+            "next_cursor": cursor_page.next_cursor,
+        }
+        return json_response(content, headers)
+
+    page: Page | SearchPage
+    if q:
+        # total is None when the search matched more items than it ranks
+        page = await search_inventory_items(
+            inventory_id, q, filters, tag, tag_match == "all", columns
+        )
+    else:
+        page = await get_inventory_items_paginated(
+            inventory_id, filters, tag, tag_match == "all", columns
+        )
+
+    if not columns:
+        return page
+    return json_response({"data": page.data, "total": page.total}, headers)
 
 
 @inventory_ext_api.patch(
@@ -174,60 +296,163 @@ async def api_update_item_quantities(
             "ids and quantities must have the same length.",
         )
 
-    items = await get_items_by_ids(inventory_id, ids)
-    existing_by_id = {item.id: item for item in items}
-    updated_items: list[Item] = []
-
-    for item_id, qty in zip(ids, quantities, strict=False):
-        current = existing_by_id.get(item_id)
-        if not current:
-            continue
-        if current.quantity_in_stock is None:
-            continue
-        qty_int = int(qty)
-        if qty_int <= 0:
-            continue
-        new_quantity = max(0, current.quantity_in_stock - qty)
-        if new_quantity == current.quantity_in_stock:
-            continue
-        before = current.quantity_in_stock
-        current.quantity_in_stock = new_quantity
-        updated_items.append(await update_item(current))
-        await create_inventory_update_log(
-            CreateInventoryUpdateLog(
-                inventory_id=inventory_id,
-                item_id=current.id,
-                quantity_change=new_quantity - before,
-                quantity_before=before,
-                quantity_after=new_quantity,
-                source=source or "system",
-                idempotency_key=f"manual-patch:{inventory_id}:{current.id}:{before}->{new_quantity}",
-            )
-        )
-
-    return updated_items
+    return await decrement_items_quantities(
+        inventory_id,
+        [(item_id, int(qty)) for item_id, qty in zip(ids, quantities, strict=True)],
+        source or "system",
+    )
+
+
+@inventory_ext_api.patch(
+    "/api/v2/items/{inventory_id}/quantities", status_code=HTTPStatus.OK
+)
+async def api_apply_stock_updates(
+    inventory_id: str,
+    payload: StockUpdatePayload,
+    user: User = Depends(check_user_exists),
+) -> list[StockUpdateResult]:
+    inventory = await get_inventory(user.id, inventory_id)
+    if not inventory or inventory.user_id != user.id:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Inventory not found.")
+    return await apply_stock_updates(
+        inventory_id, payload.lines, payload.source or "system"
+    )
 
 
 @inventory_ext_api.get("/api/v1/items/{inventory_id}/export", status_code=HTTPStatus.OK)
 async def api_export_items(
-    inventory_id: str, user: User = Depends(check_user_exists)
-) -> dict:
+    request: Request,
+    inventory_id: str,
+    export_format: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    compress: bool = Query(False, alias="gzip"),
+    fields: str | None = Query(None, description="Comma separated fields to export"),
+    user: User = Depends(check_user_exists),
+) -> Response:
+    inventory = await get_inventory(user.id, inventory_id)
+    if not inventory or inventory.user_id != user.id:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Inventory not found.",
+        )
+    headers, not_modified = await check_conditional_get(request, inventory_id)
+    if not_modified:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+
+    columns = projection_columns(fields, Item) if fields else None
+    filename = f"inventory-{inventory_id}-items.{export_format}"
+    content = encode_export(
+        iter_inventory_items(inventory_id, columns=columns, with_images=True),
+        export_format,
+        columns,
+    )
+    if compress:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.gz"'
+        return StreamingResponse(
+            gzip_stream(content), media_type="application/gzip", headers=headers
+        )
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return StreamingResponse(
+        content, media_type=EXPORT_FORMATS[export_format], headers=headers
+    )
+
+
+@inventory_ext_api.get(
+    "/api/v1/items/{inventory_id}/low-stock", status_code=HTTPStatus.OK
+)
+async def api_get_low_stock_items(
+    inventory_id: str,
+    user: User = Depends(check_user_exists),
+) -> list[Item]:
+    inventory = await get_inventory(user.id, inventory_id)
+    if not inventory or inventory.user_id != user.id:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Inventory not found.",
+        )
+    return await get_low_stock_items(inventory_id)
+
+
+@inventory_ext_api.get("/api/v1/{inventory_id}/valuation", status_code=HTTPStatus.OK)
+async def api_get_inventory_valuation(
+    inventory_id: str,
+    user: User = Depends(check_user_exists),
+) -> InventoryValuation:
     inventory = await get_inventory(user.id, inventory_id)
     if not inventory or inventory.user_id != user.id:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Inventory not found.",
         )
-    items = await get_inventory_items(inventory_id)
-    exportable_items = []
-    for item in items:
-        data = item.dict()
-        data.pop("inventory_id", None)
-        data["tags"] = from_csv(data.get("tags"))
-        data["omit_tags"] = from_csv(data.get("omit_tags"))
-        data["images"] = normalize_images(data.get("images"))
-        exportable_items.append(data)
-    return {"items": exportable_items}
+    valuation = await get_inventory_valuation(inventory)
+    if not valuation:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Inventory not found.",
+        )
+    return valuation
+
+
+CHANGE_FEED_KEEPALIVE_SECONDS = 15
+
+
+@inventory_ext_api.get("/api/v1/items/{inventory_id}/changes")
+async def api_item_changes(
+    request: Request,
+    inventory_id: str,
+    since: int | None = Query(None, ge=0),
+    user_id: str | None = Depends(optional_user_id),
+) -> StreamingResponse:
+    """
+    Server-sent events feed of the item changes of an inventory. Reconnecting
+    clients resume after the `Last-Event-ID` header (or `since`), a `reset`
+    event means the missed changes are gone and the items must be reloaded.
+    The owner also gets `item.low_stock` events for reorder threshold crossings.
+    """
+    inventory = (
+        await get_inventory(user_id, inventory_id)
+        if user_id
+        else await get_public_inventory(inventory_id)
+    )
+    if not inventory:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Inventory not found.",
+        )
+
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    is_owner = bool(user_id) and inventory.dict().get("user_id", None) == user_id
+    subscription, backlog = change_broker.subscribe(
+        inventory_id, since, private=is_owner
+    )
+
+    def encode(change: ItemChange) -> str:
+        return f"id: {change.seq}\nevent: {change.type}\ndata: {change.json()}\n\n"
+
+    async def stream():
+        try:
+            for change in backlog:
+                yield encode(change)
+            while not (subscription.closed and subscription.queue.empty()):
+                try:
+                    change = await asyncio.wait_for(
+                        subscription.queue.get(), CHANGE_FEED_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield encode(change)
+        finally:
+            change_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @inventory_ext_api.post(
@@ -237,19 +462,17 @@ async def api_import_items(
     inventory_id: str,
     payload: ImportItemsPayload,
     user: User = Depends(check_user_exists),
-) -> list[Item]:
+) -> ImportItemsResult:
     inventory = await get_inventory(user.id, inventory_id)
     if not inventory or inventory.user_id != user.id:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Inventory not found.",
         )
-    created_items: list[Item] = []
-    for raw_item in payload.items:
-        item_data = prepare_import_item(raw_item, inventory_id)
-        created_item = await create_item(item_data)
-        created_items.append(created_item)
-    return created_items
+    ids = await create_items(
+        [prepare_import_item(raw_item, inventory_id) for raw_item in payload.items]
+    )
+    return ImportItemsResult(created=len(ids), ids=ids)
 
 
 @inventory_ext_api.post("/api/v1/items", status_code=HTTPStatus.CREATED)
@@ -277,41 +500,141 @@ async def api_update_item(
     item: CreateItem,
     user: User = Depends(check_user_exists),
 ) -> Item | None:
-    inventory = await get_inventory(user.id, item.inventory_id)
-    if not inventory or inventory.user_id != user.id:
+    found = await get_user_item(user.id, item_id)
+    if not found:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
-            detail="Cannot update item.",
+            detail="Item not found.",
         )
-    _item = await get_item(item_id)
-    if not _item or _item.inventory_id != inventory.id:
+    _item, inventory = found
+    if item.inventory_id != inventory.id:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
-            detail="Item not found.",
+            detail="Cannot update item.",
         )
     for field, value in item.dict().items():
         setattr(_item, field, value)
     # Owner updates implicitly approve items (e.g., items submitted by managers)
     _item.is_approved = True
-    return await update_item(_item)
+    return await update_item(_item, keep_images="images" not in item.__fields_set__)
 
 
-@inventory_ext_api.delete("/api/v1/items/{item_id}", status_code=HTTPStatus.NO_CONTENT)
-async def api_delete_item(
+@inventory_ext_api.patch("/api/v1/items/{item_id}", status_code=HTTPStatus.OK)
+async def api_patch_item(
     item_id: str,
+    data: UpdateItem,
     user: User = Depends(check_user_exists),
-) -> None:
+) -> Item:
+    if not await get_user_item(user.id, item_id):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Item not found.",
+        )
+    item = await update_item_fields(item_id, data.dict(exclude_unset=True))
+    if not item:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Item not found.",
+        )
+    return item
+
+
+@inventory_ext_api.get("/api/v1/items/{item_id}/images", status_code=HTTPStatus.OK)
+async def api_get_item_images(item_id: str) -> list[str]:
+    """The full gallery of an item, listings only hold its primary image."""
     item = await get_item(item_id)
     if not item:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Item not found.",
         )
-    inventory = await get_inventory(user.id, item.inventory_id)
+    return await get_item_images(item_id)
+
+
+@inventory_ext_api.get("/api/v1/items/{item_id}/images/{position}")
+async def api_get_item_image(request: Request, item_id: str, position: int) -> Response:
+    """
+    Serve an inline (base64) gallery image. Other images are URLs or asset
+    ids the clients load directly, they are not redirected to. The url stays
+    the same when the image is replaced, clients revalidate with the ETag.
+    """
+    image = await get_item_image(item_id, position)
+    decoded = decode_inline_image(image) if image else None
+    if not image or not decoded:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Image not found.",
+        )
+    media_type, content = decoded
+    etag = make_etag(item_id, position, image)
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if is_not_modified(request, etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return Response(content, media_type=media_type, headers=headers)
+
+
+@inventory_ext_api.put("/api/v1/items/{item_id}/images", status_code=HTTPStatus.OK)
+async def api_set_item_images(
+    item_id: str,
+    images: list[str],
+    user: User = Depends(check_user_exists),
+) -> Item:
+    if not await get_user_item(user.id, item_id):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Item not found.",
+        )
+    item = await set_item_images(item_id, images)
+    if not item:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Item not found.",
+        )
+    return item
+
+
+@inventory_ext_api.patch("/api/v1/items/{inventory_id}/bulk", status_code=HTTPStatus.OK)
+async def api_bulk_update_items(
+    inventory_id: str,
+    data: BulkUpdateItems,
+    user: User = Depends(check_user_exists),
+) -> BulkUpdateResult:
+    inventory = await get_inventory(user.id, inventory_id)
     if not inventory or inventory.user_id != user.id:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Inventory not found.")
+    updated = await bulk_update_items(
+        inventory_id,
+        data,
+        data.fields.dict(exclude_unset=True),
+        data.price_change_percentage,
+    )
+    return BulkUpdateResult(updated=updated)
+
+
+@inventory_ext_api.post(
+    "/api/v1/items/{inventory_id}/approve", status_code=HTTPStatus.OK
+)
+async def api_approve_items(
+    inventory_id: str,
+    data: ItemsSelection,
+    user: User = Depends(check_user_exists),
+) -> BulkUpdateResult:
+    inventory = await get_inventory(user.id, inventory_id)
+    if not inventory or inventory.user_id != user.id:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Inventory not found.")
+    updated = await bulk_update_items(inventory_id, data, {"is_approved": True})
+    return BulkUpdateResult(updated=updated)
+
+
+@inventory_ext_api.delete("/api/v1/items/{item_id}", status_code=HTTPStatus.NO_CONTENT)
+async def api_delete_item(
+    item_id: str,
+    user: User = Depends(check_user_exists),
+) -> None:
+    if not await get_user_item(user.id, item_id):
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
-            detail="Cannot delete item.",
+            detail="Item not found.",
         )
     await delete_item(item_id)
 
@@ -418,10 +741,16 @@ async def api_delete_manager(
     await delete_manager(manager_id)
 
 
-@inventory_ext_api.get("/api/v1/managers/{manager_id}/items", status_code=HTTPStatus.OK)
+@inventory_ext_api.get(
+    "/api/v1/managers/{manager_id}/items",
+    status_code=HTTPStatus.OK,
+    response_model=list[Item],
+)
 async def api_manager_get_items(
+    request: Request,
+    response: Response,
     manager_id: str,
-) -> list[Item]:
+) -> list[Item] | Response:
     manager = await get_manager(manager_id)
     if not manager:
         raise HTTPException(
@@ -439,9 +768,55 @@ async def api_manager_get_items(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Manager does not belong to the specified inventory.",
         )
+    headers, not_modified = await check_conditional_get(
+        request,
+        inventory.id,
+        manager.id,
+        manager.updated_at,
+        changed_at=manager.updated_at,
+    )
+    if not_modified:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     return await get_manager_items(inventory.id, manager)
 
 
+@inventory_ext_api.get(
+    "/api/v1/managers/{manager_id}/items/paginated",
+    openapi_extra=generate_filter_params_openapi(ItemFilters),
+    response_model=Page,
+)
+async def api_manager_get_items_paginated(
+    request: Request,
+    response: Response,
+    manager_id: str,
+    filters: Filters = Depends(items_filters),
+) -> Page | Response:
+    manager = await get_manager(manager_id)
+    if not manager:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Manager not found.",
+        )
+    inventory = await get_public_inventory(manager.inventory_id)
+    if not inventory:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Cannot access items.",
+        )
+    headers, not_modified = await check_conditional_get(
+        request,
+        inventory.id,
+        manager.id,
+        manager.updated_at,
+        changed_at=manager.updated_at,
+    )
+    if not_modified:
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return await get_manager_items_paginated(inventory.id, manager, filters)
+
+
 @inventory_ext_api.post(
     "/api/v1/managers/{manager_id}/item", status_code=HTTPStatus.CREATED
 )
@@ -490,29 +865,13 @@ async def api_manager_update_item(
     data: Item,
     manager_id: str,
 ) -> Item | None:
-    item = await get_item(item_id)
-    if not item or item.id != item_id:
+    found = await get_manager_item(manager_id, item_id)
+    if not found:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Item not found.",
         )
-    manager = await get_manager(manager_id)
-    if not manager:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail="Manager not found.",
-        )
-    inventory = await get_public_inventory(manager.inventory_id)
-    if not inventory:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail="Cannot update item.",
-        )
-    if manager.inventory_id != inventory.id:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail="Manager does not belong to the specified inventory.",
-        )
+    item, manager, inventory = found
     if data.inventory_id != inventory.id:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
@@ -533,7 +892,7 @@ async def api_manager_update_item(
         setattr(item, field, value)
     item.manager_id = manager.id
     item.is_active = False
-    return await update_item(item)
+    return await update_item(item, keep_images="images" not in data.__fields_set__)
 
 
 @inventory_ext_api.put(
@@ -543,36 +902,32 @@ async def api_manager_update_item(
 async def api_manager_update_item_quantity(
     item_id: str, manager_id: str, data: ManagerQuantityUpdate
 ) -> Item:
-    manager = await get_manager(manager_id)
-    if not manager:
+    found = await get_manager_item(manager_id, item_id)
+    if not found:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
-            detail="Manager not found.",
-        )
-    inventory = await get_public_inventory(manager.inventory_id)
-    if not inventory:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail="Cannot update item.",
+            detail="Item not found.",
         )
+    item, manager, inventory = found
     if data.inventory_id != inventory.id:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Item does not belong to the specified inventory.",
         )
-    item = await get_item(item_id)
-    if not item or item.inventory_id != inventory.id:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail="Item not found.",
-        )
     if not manager_can_access_item(manager, item):
         raise HTTPException(
             status_code=HTTPStatus.FORBIDDEN,
             detail="Manager is not allowed to update this item.",
         )
-    item.quantity_in_stock = data.quantity_in_stock
-    return await update_item(item)
+    updated = await update_item_fields(
+        item.id, {"quantity_in_stock": data.quantity_in_stock}
+    )
+    if not updated:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Item not found.",
+        )
+    return updated
 
 
 @inventory_ext_api.delete(
@@ -582,52 +937,34 @@ async def api_manager_delete_item(
     item_id: str,
     manager_id: str,
 ) -> None:
-    item = await get_item(item_id)
-    if not item or item.id != item_id:
+    found = await get_manager_item(manager_id, item_id)
+    if not found:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Item not found.",
         )
+    item, _, _ = found
     if item.manager_id != manager_id:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Item is not managed by the specified manager.",
         )
-    manager = await get_manager(manager_id)
-    if not manager:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail="Manager not found.",
-        )
-    inventory = await get_public_inventory(manager.inventory_id)
-    if not inventory:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail="Cannot delete item.",
-        )
-    if manager.inventory_id != inventory.id:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail="Manager does not belong to the specified inventory.",
-        )
-    if item.inventory_id != inventory.id:
-        raise HTTPException(
-            status_code=HTTPStatus.BAD_REQUEST,
-            detail="Item does not belong to the specified inventory.",
-        )
     await delete_item(item_id)
 
 
 @inventory_ext_api.get(
     "/api/v1/logs/{inventory_id}/paginated",
     openapi_extra=generate_filter_params_openapi(InventoryLogFilters),
-    response_model=Page,
+    response_model=None,
 )
 async def api_get_inventory_logs(
     inventory_id: str,
+    pagination: str = Query("offset", pattern="^(offset|cursor)$"),
+    cursor: str | None = Query(None),
+    include_total: bool = Query(False),
     user: User = Depends(check_user_exists),
     filters: Filters = Depends(logs_filters),
-) -> Page:
+) -> Page | CursorPage:
     inventory = await get_inventory(user.id, inventory_id)
     if not inventory or inventory.user_id != user.id:
         raise HTTPException(
@@ -635,5 +972,24 @@ async def api_get_inventory_logs(
             detail="Inventory not found.",
         )
 
+    if cursor or pagination == "cursor":
+        return await get_inventory_update_logs_cursor_page(
+            inventory_id, filters, cursor, include_total
+        )
     page = await get_inventory_update_logs_paginated(inventory_id, filters)
     return page
+
+
+@inventory_ext_api.get("/api/v1/logs/{inventory_id}/daily", status_code=HTTPStatus.OK)
+async def api_get_inventory_logs_daily(
+    inventory_id: str,
+    item_id: str | None = Query(None),
+    user: User = Depends(check_user_exists),
+) -> list[AuditLogDaily]:
+    inventory = await get_inventory(user.id, inventory_id)
+    if not inventory or inventory.user_id != user.id:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Inventory not found.",
+        )
+    return await get_audit_log_daily(inventory_id, item_id)